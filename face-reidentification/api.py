@@ -1,20 +1,30 @@
 import os
+import asyncio
+import functools
+import hmac
 import cv2
 import numpy as np
 import warnings
+import time
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, UploadFile, File, HTTPException, Form
-from fastapi.responses import FileResponse
-from typing import Optional
+from fastapi import FastAPI, UploadFile, File, HTTPException, Form, Request
+from fastapi.responses import FileResponse, StreamingResponse, Response
+from typing import List, Optional, Tuple
+from datetime import datetime
+import importlib.util
 import uuid
+import zipfile
 
 # Suppress warnings
 warnings.filterwarnings("ignore")
 os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
 
 # Import your project's modules
-from models import SCRFD, ArcFace
-from database import FaceDatabase
+from models import SCRFD, ArcFace, SessionFactory
+from database import FaceDatabase, AttendanceDatabase, AttendanceExporter, UnregisteredFaceStore, EXPORT_FORMATS
+from utils.metrics import REGISTRY, PROMETHEUS_CONTENT_TYPE
+from utils.profiler import PROFILER
 
 # --- Configuration ---
 # Get the absolute path of the directory where this script is located
@@ -24,9 +34,39 @@ DET_WEIGHT = os.path.join(BASE_DIR, "weights", "det_500m.onnx")
 REC_WEIGHT = os.path.join(BASE_DIR, "weights", "w600k_mbf.onnx")
 DB_PATH = os.path.join(BASE_DIR, "database", "face_database")
 UNREGISTERED_FACES_PATH = os.path.join(BASE_DIR, "database", "unregistered_faces")
+ATTENDANCE_DB_PATH = os.path.join(BASE_DIR, "database", "attendance.db")
 SIMILARITY_THRESH = 0.4
 CONFIDENCE_THRESH = 0.5
 
+# Inference runs on a bounded pool so the event loop (and the health check) never blocks.
+# Requests beyond INFERENCE_QUEUE_LIMIT in flight are rejected with 503.
+INFERENCE_WORKERS = int(os.environ.get("INFERENCE_WORKERS", 2))
+INFERENCE_QUEUE_LIMIT = int(os.environ.get("INFERENCE_QUEUE_LIMIT", 16))
+
+# ONNX Runtime tuning; by default the profile selected in models/onnx_runtime.yaml
+ORT_CONFIG = os.environ.get("ORT_CONFIG") or None
+ORT_PROFILE = os.environ.get("ORT_PROFILE") or None
+# Load the INT8 model variants produced by tools/quantize.py; models without one stay FP32
+USE_INT8_MODELS = os.environ.get("USE_INT8_MODELS", "0") == "1"
+
+# Concurrent /recognize calls are grouped into batches of up to RECOGNIZE_BATCH_SIZE images.
+# A lone request is dispatched immediately; the wait only applies while the pool is busy.
+RECOGNIZE_BATCH_SIZE = int(os.environ.get("RECOGNIZE_BATCH_SIZE", 16))
+RECOGNIZE_BATCH_WAIT_MS = float(os.environ.get("RECOGNIZE_BATCH_WAIT_MS", 5))
+
+# Limits for /recognize_batch; zip members count towards the image limit individually
+MAX_BATCH_IMAGES = int(os.environ.get("MAX_BATCH_IMAGES", 64))
+MAX_BATCH_IMAGE_BYTES = int(os.environ.get("MAX_BATCH_IMAGE_BYTES", 20 * 1024 * 1024))
+BATCH_EMBED_CHUNK = int(os.environ.get("BATCH_EMBED_CHUNK", 64))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+# Sampling profiler behind /admin/profile. The routes only exist when ADMIN_TOKEN is set, and requests
+# must send it as X-Admin-Token
+PROFILE_DIR = os.environ.get("PROFILE_DIR") or os.path.join(BASE_DIR, "profiles")
+MAX_PROFILE_SECONDS = float(os.environ.get("MAX_PROFILE_SECONDS", 300))
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN") or None
+PROFILER.output_dir = PROFILE_DIR
+
 
 # --- Lifespan Management (Modern Syntax) ---
 @asynccontextmanager
@@ -34,28 +74,46 @@ async def lifespan(app: FastAPI):
     """Load models and database when the application starts."""
     try:
         # Startup: Load models and database
-        app.state.detector = SCRFD(DET_WEIGHT, input_size=(640, 640), conf_thres=CONFIDENCE_THRESH)
-        app.state.recognizer = ArcFace(REC_WEIGHT)
+        # Each inference worker runs detection and recognition back to back, so cores are split per worker.
+        # The workers share both sessions, so their threads are not pinned to one worker's slice of cores
+        session_factory = SessionFactory(ORT_CONFIG, profile=ORT_PROFILE, concurrent_sessions=INFERENCE_WORKERS,
+                                         shared_sessions=True)
+        app.state.detector = SCRFD(DET_WEIGHT, input_size=(640, 640), conf_thres=CONFIDENCE_THRESH,
+                                   session_factory=session_factory, quantized=USE_INT8_MODELS)
+        app.state.recognizer = ArcFace(REC_WEIGHT, session_factory=session_factory, quantized=USE_INT8_MODELS)
+        app.state.inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS,
+                                                          thread_name_prefix="inference")
+        app.state.inference_pending = 0
+        app.state.recognize_batcher = RecognizeBatcher(RECOGNIZE_BATCH_SIZE, RECOGNIZE_BATCH_WAIT_MS / 1000)
+        app.state.recognize_batcher.start()
+        REGISTRY.gauge("face_queue_depth", "Items waiting in a background queue",
+                       fn=lambda: app.state.inference_pending, queue="inference")
+        REGISTRY.gauge("face_queue_depth", "Items waiting in a background queue",
+                       fn=lambda: app.state.recognize_batcher.queue.qsize(), queue="recognize_batcher")
         app.state.face_db = FaceDatabase(db_path=DB_PATH)
         
         if not app.state.face_db.load():
             print("Could not load existing face database, a new one will be created upon face addition.")
+
+        app.state.attendance_db = AttendanceDatabase(db_path=ATTENDANCE_DB_PATH)
+        app.state.attendance_exporter = AttendanceExporter(app.state.attendance_db)
         
-        # Ensure the directory for unregistered faces exists
-        os.makedirs(UNREGISTERED_FACES_PATH, exist_ok=True)
-        
-        # Load existing unregistered faces into memory
-        app.state.unregistered_embeddings = {}
-        for filename in os.listdir(UNREGISTERED_FACES_PATH):
-            if filename.endswith(".jpg"):
-                face_id = os.path.splitext(filename)[0]
-                image_path = os.path.join(UNREGISTERED_FACES_PATH, filename)
-                frame = cv2.imread(image_path)
-                if frame is not None:
-                    _, kpss = app.state.detector.detect(frame, max_num=1)
-                    if len(kpss) > 0:
-                        embedding = app.state.recognizer.get_embedding(frame, kpss[0], normalized=True)
-                        app.state.unregistered_embeddings[face_id] = embedding
+        # Map the persisted embeddings of unregistered faces; images are only read when served
+        app.state.unregistered_embeddings = UnregisteredFaceStore(UNREGISTERED_FACES_PATH)
+        app.state.unregistered_embeddings.load()
+
+        # Embed only images captured before the store existed (or whose embedding was lost)
+        image_ids = [os.path.splitext(f)[0] for f in os.listdir(UNREGISTERED_FACES_PATH) if f.endswith(".jpg")]
+        missing = app.state.unregistered_embeddings.sync(image_ids)
+        for face_id in missing:
+            frame = cv2.imread(os.path.join(UNREGISTERED_FACES_PATH, f"{face_id}.jpg"))
+            if frame is not None:
+                _, kpss = app.state.detector.detect(frame, max_num=1)
+                if len(kpss) > 0:
+                    embedding = app.state.recognizer.get_embedding(frame, kpss[0], normalized=True)
+                    app.state.unregistered_embeddings.add(face_id, embedding, persist=False)
+        if missing:
+            app.state.unregistered_embeddings.save()
         
         print(f"Models and database loaded successfully. {len(app.state.unregistered_embeddings)} unregistered faces loaded.")
         
@@ -63,6 +121,11 @@ async def lifespan(app: FastAPI):
         
         # Shutdown: Cleanup resources
         print("Shutting down and cleaning up resources...")
+        await app.state.recognize_batcher.stop()
+        app.state.inference_executor.shutdown(wait=True)
+        app.state.face_db.close()
+        app.state.unregistered_embeddings.close()
+        app.state.attendance_db.close()
         
     except Exception as e:
         print(f"Error during startup: {e}")
@@ -72,9 +135,25 @@ async def lifespan(app: FastAPI):
 # --- FastAPI App Initialization ---
 app = FastAPI(title="Face Recognition API", lifespan=lifespan)
 
+REJECTED_METRIC = REGISTRY.counter("face_api_rejected", "Requests refused with 503 because the service was busy")
+BATCH_SIZE_METRIC = REGISTRY.histogram("face_recognize_batch_size", "Images per micro-batched /recognize dispatch",
+                                       buckets=(1, 2, 4, 8, 16, 32, 64))
+
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Time every request, labelled by its route template so path parameters do not add series."""
+    start = time.perf_counter()
+    response = await call_next(request)
+    route = request.scope.get("route")
+    REGISTRY.histogram("face_api_request_seconds", "Wall time of API requests",
+                       route=getattr(route, "path", "unmatched"), method=request.method,
+                       status=response.status_code).observe(time.perf_counter() - start)
+    return response
+
 
 # --- Helper Functions ---
-async def process_image(image_bytes: bytes) -> np.ndarray:
+def process_image(image_bytes: bytes) -> np.ndarray:
     """
     Decodes image bytes and prepares it for processing.
     """
@@ -94,6 +173,232 @@ def validate_models_loaded(app: FastAPI) -> None:
         raise HTTPException(status_code=503, detail="Models or database not loaded. The service is not ready.")
 
 
+async def run_inference(func, *args):
+    """
+    Runs blocking model or database work on the inference pool.
+    Rejects the request with 503 when too much work is already queued.
+    """
+    if app.state.inference_pending >= INFERENCE_QUEUE_LIMIT:
+        REJECTED_METRIC.inc()
+        raise HTTPException(
+            status_code=503,
+            detail="The service is busy, please retry shortly.",
+            headers={"Retry-After": "1"}
+        )
+
+    app.state.inference_pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(app.state.inference_executor, functools.partial(func, *args))
+    finally:
+        app.state.inference_pending -= 1
+
+
+def embed_largest_face(image_bytes: bytes) -> Tuple[np.ndarray, np.ndarray]:
+    """Decodes an image and returns it with the normalized embedding of its largest face."""
+    frame = process_image(image_bytes)
+
+    bboxes, kpss = app.state.detector.detect(frame, max_num=1)
+    if len(kpss) == 0:
+        raise HTTPException(status_code=404, detail="No face detected in the image.")
+
+    embedding = app.state.recognizer.get_embedding(frame, kpss[0], normalized=True)
+    return frame, embedding
+
+
+def embed_and_search(image_bytes: bytes):
+    """Embeds the largest face in an image and looks it up in the face database."""
+    frame, embedding = embed_largest_face(image_bytes)
+    return frame, embedding, app.state.face_db.search(embedding, SIMILARITY_THRESH)
+
+
+def recognize_images(images: List[bytes]) -> list:
+    """
+    Detects the largest face in each image, then embeds and searches all of them as one batch.
+    Returns, per image, either a (name, similarity) tuple or the HTTPException for that image.
+    """
+    results = [None] * len(images)
+    faces, owners = [], []
+
+    for i, image_bytes in enumerate(images):
+        try:
+            frame = process_image(image_bytes)
+            bboxes, kpss = app.state.detector.detect(frame, max_num=1)
+            if len(kpss) == 0:
+                raise HTTPException(status_code=404, detail="No face detected in the image.")
+            faces.append((frame, kpss[0]))
+            owners.append(i)
+        except HTTPException as e:
+            results[i] = e
+
+    if faces:
+        embeddings = app.state.recognizer.get_embeddings(faces, normalized=True)
+        for i, match in zip(owners, app.state.face_db.search_batch(embeddings, SIMILARITY_THRESH)):
+            results[i] = match
+
+    return results
+
+
+def expand_uploads(uploads: List[Tuple[str, object]]) -> List[Tuple[str, bytes]]:
+    """
+    Turns uploaded files into (filename, image bytes) pairs.
+    Zip archives are read member by member straight from the upload's spooled file.
+    """
+    images = []
+
+    def add(filename: str, size: int, read) -> None:
+        if len(images) >= MAX_BATCH_IMAGES:
+            raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH_IMAGES} images per request.")
+        if size > MAX_BATCH_IMAGE_BYTES:
+            raise HTTPException(status_code=413, detail=f"Image {filename} is too large.")
+        images.append((filename, read()))
+
+    for filename, fileobj in uploads:
+        fileobj.seek(0)
+        if zipfile.is_zipfile(fileobj):
+            fileobj.seek(0)
+            try:
+                with zipfile.ZipFile(fileobj) as archive:
+                    for info in archive.infolist():
+                        if info.is_dir() or not info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                            continue
+                        add(info.filename, info.file_size, functools.partial(archive.read, info))
+            except zipfile.BadZipFile as e:
+                raise HTTPException(status_code=400, detail=f"Invalid zip archive {filename}: {e}")
+        else:
+            fileobj.seek(0, os.SEEK_END)
+            size = fileobj.tell()
+            fileobj.seek(0)
+            add(filename, size, fileobj.read)
+
+    if not images:
+        raise HTTPException(status_code=400, detail="No images found in the upload.")
+    return images
+
+
+def recognize_all_faces(uploads: List[Tuple[str, object]]) -> list:
+    """
+    Detects every face in every uploaded image, embeds them in chunks
+    and looks all of them up with a single FAISS search.
+    """
+    detector = app.state.detector
+    results, faces, owners = [], [], []
+
+    for filename, image_bytes in expand_uploads(uploads):
+        entry = {"filename": filename, "faces": []}
+        results.append(entry)
+        try:
+            frame = process_image(image_bytes)
+        except HTTPException as e:
+            entry["error"] = e.detail
+            continue
+
+        bboxes, kpss = detector.detect(frame, max_num=0)
+        for bbox, kps in zip(bboxes, kpss):
+            x1, y1, x2, y2 = (int(v) for v in bbox[:4])
+            entry["faces"].append({"bbox": [x1, y1, x2, y2], "score": float(bbox[4])})
+            faces.append((frame, kps))
+            owners.append(entry["faces"][-1])
+
+    if faces:
+        embeddings = np.concatenate([
+            app.state.recognizer.get_embeddings(faces[i:i + BATCH_EMBED_CHUNK], normalized=True)
+            for i in range(0, len(faces), BATCH_EMBED_CHUNK)
+        ])
+        for face, (name, similarity) in zip(owners, app.state.face_db.search_batch(embeddings, SIMILARITY_THRESH)):
+            face["student_id"] = None if name == "Unknown" else name
+            face["similarity"] = float(similarity)
+
+    return results
+
+
+class RecognizeBatcher:
+    """
+    Micro-batches /recognize requests.
+    Requests queue up while the inference pool is busy and are dispatched together,
+    so ArcFace and FAISS run once per batch instead of once per request.
+    """
+
+    def __init__(self, max_batch: int, max_wait: float):
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max_wait
+        self.queue = None
+        self.task = None
+        self.in_flight = 0
+        self.slots = None
+
+    def start(self) -> None:
+        self.queue = asyncio.Queue()
+        self.slots = asyncio.Semaphore(INFERENCE_WORKERS)
+        self.task = asyncio.create_task(self._collect())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def submit(self, image_bytes: bytes):
+        if self.queue.qsize() >= INFERENCE_QUEUE_LIMIT * self.max_batch:
+            REJECTED_METRIC.inc()
+            raise HTTPException(
+                status_code=503,
+                detail="The service is busy, please retry shortly.",
+                headers={"Retry-After": "1"}
+            )
+
+        future = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((image_bytes, future))
+        result = await future
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def _drain(self, items: list) -> None:
+        while len(items) < self.max_batch and not self.queue.empty():
+            items.append(self.queue.get_nowait())
+
+    async def _collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self.queue.get()]
+
+            if self.in_flight:
+                # The pool is busy anyway, so give concurrent requests a moment to join this batch
+                deadline = loop.time() + self.max_wait
+                while len(items) < self.max_batch:
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        items.append(await asyncio.wait_for(self.queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+
+            self._drain(items)
+            await self.slots.acquire()
+            self._drain(items)
+
+            self.in_flight += 1
+            asyncio.create_task(self._dispatch(items))
+
+    async def _dispatch(self, items: list) -> None:
+        BATCH_SIZE_METRIC.observe(len(items))
+        try:
+            results = await run_inference(recognize_images, [image_bytes for image_bytes, _ in items])
+        except Exception as e:
+            results = [e] * len(items)
+        finally:
+            self.in_flight -= 1
+            self.slots.release()
+
+        for (_, future), result in zip(items, results):
+            if not future.done():
+                future.set_result(result)
+
+
 # --- API Endpoints ---
 @app.get("/")
 async def root():
@@ -101,6 +406,68 @@ async def root():
     return {"status": "ok", "message": "Face Recognition API is running"}
 
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics: per-stage latency histograms, request latency, queue depths and drops."""
+    return Response(content=REGISTRY.render(), media_type=PROMETHEUS_CONTENT_TYPE)
+
+
+def check_admin_token(request: Request) -> None:
+    if not ADMIN_TOKEN:
+        # Profiles expose code paths and allocation sites; without a token there is no way to restrict them
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not hmac.compare_digest(request.headers.get("X-Admin-Token", ""), ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token.")
+
+
+@app.post("/admin/profile", status_code=202)
+async def start_profile(request: Request, seconds: float = 30, memory: bool = True):
+    """
+    Samples every thread's stack for `seconds` while the service keeps serving, tagged with the
+    pipeline stage each thread is in, and takes tracemalloc snapshots at the start and end unless
+    `memory` is false. Fetch the results from /admin/profile/folded (flamegraph input),
+    /admin/profile/memory and /admin/profile/memory_folded once the run is over.
+    """
+    check_admin_token(request)
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        raise HTTPException(status_code=400, detail=f"seconds must be in (0, {MAX_PROFILE_SECONDS:g}].")
+    try:
+        run = PROFILER.start(seconds, memory=memory)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "started", **run}
+
+
+@app.get("/admin/profile")
+async def profile_status(request: Request):
+    """Whether a profile is being recorded, and the outcome of the last one."""
+    check_admin_token(request)
+    return PROFILER.status()
+
+
+@app.delete("/admin/profile")
+async def stop_profile(request: Request):
+    """Ends the current profile early and returns its result."""
+    check_admin_token(request)
+    if not PROFILER.running:
+        raise HTTPException(status_code=404, detail="No profile is being recorded.")
+    result = await asyncio.get_running_loop().run_in_executor(None, PROFILER.stop)
+    return {"status": "stopped", **(result or {})}
+
+
+@app.get("/admin/profile/{kind}")
+async def download_profile(request: Request, kind: str):
+    """Downloads an output of the last finished profile: folded, memory or memory_folded."""
+    check_admin_token(request)
+    if kind not in ("folded", "memory", "memory_folded"):
+        raise HTTPException(status_code=404, detail=f"Unknown profile output {kind}.")
+    result = PROFILER.last_result
+    path = result.get(kind) if result else None
+    if not path or not os.path.isfile(path):
+        raise HTTPException(status_code=404, detail="No finished profile with that output.")
+    return FileResponse(path, media_type="text/plain", filename=os.path.basename(path))
+
+
 @app.post("/recognize")
 async def recognize_face(file: UploadFile = File(...)):
     """
@@ -110,21 +477,9 @@ async def recognize_face(file: UploadFile = File(...)):
     validate_models_loaded(app)
     
     try:
-        # Read and process the uploaded image
+        # Read the uploaded image; decoding, detection, embedding and search run batched off the event loop
         image_bytes = await file.read()
-        frame = await process_image(image_bytes)
-        
-        # Detect faces
-        bboxes, kpss = app.state.detector.detect(frame, max_num=1)
-        
-        if len(kpss) == 0:
-            raise HTTPException(status_code=404, detail="No face detected in the image.")
-        
-        # Get embedding for the first detected face
-        embedding = app.state.recognizer.get_embedding(frame, kpss[0], normalized=True)
-        
-        # Search for the face in the database
-        results = app.state.face_db.search(embedding, SIMILARITY_THRESH)
+        results = await app.state.recognize_batcher.submit(image_bytes)
         
         # Check if a known face was found
         if results and results[0] != "Unknown":
@@ -140,6 +495,26 @@ async def recognize_face(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail="An internal server error occurred during face recognition.")
 
 
+@app.post("/recognize_batch")
+async def recognize_batch(files: List[UploadFile] = File(...)):
+    """
+    Receives one or more images (or zip archives of images) and returns
+    every detected face in each with its bounding box, student id and similarity.
+    """
+    validate_models_loaded(app)
+
+    try:
+        uploads = [(upload.filename, upload.file) for upload in files]
+        results = await run_inference(recognize_all_faces, uploads)
+        return {"images": results, "total_faces": sum(len(entry["faces"]) for entry in results)}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+        raise HTTPException(status_code=500, detail="An internal server error occurred during batch recognition.")
+
+
 @app.post("/add_face")
 async def add_face(student_id: str = Form(...), file: UploadFile = File(...)):
     """
@@ -149,22 +524,12 @@ async def add_face(student_id: str = Form(...), file: UploadFile = File(...)):
     validate_models_loaded(app)
     
     try:
-        # Read and process the uploaded image
+        # Read the uploaded image and embed its largest face
         image_bytes = await file.read()
-        frame = await process_image(image_bytes)
-        
-        # Detect faces
-        bboxes, kpss = app.state.detector.detect(frame, max_num=1)
-        
-        if len(kpss) == 0:
-            raise HTTPException(status_code=404, detail="No face detected in the image.")
-        
-        # Get embedding for the first detected face
-        embedding = app.state.recognizer.get_embedding(frame, kpss[0], normalized=True)
+        _, embedding = await run_inference(embed_largest_face, image_bytes)
         
         # Add the face to the database
-        app.state.face_db.add_face(embedding, student_id)
-        app.state.face_db.save()
+        await run_inference(app.state.face_db.add_face, embedding, student_id)
         
         return {"message": f"Face for student {student_id} added successfully."}
     
@@ -186,16 +551,9 @@ async def register_face(class_id: int = Form(...), file: UploadFile = File(...))
     
     try:
         image_bytes = await file.read()
-        frame = await process_image(image_bytes)
         
-        # Detect faces to ensure there is a face in the image
-        bboxes, kpss = app.state.detector.detect(frame, max_num=1)
-        if len(kpss) == 0:
-            raise HTTPException(status_code=404, detail="No face detected in the image.")
-        
-        # Check if the face already exists in the main database
-        new_embedding = app.state.recognizer.get_embedding(frame, kpss[0], normalized=True)
-        results = app.state.face_db.search(new_embedding, SIMILARITY_THRESH)
+        # Detect the face and check if it already exists in the main database
+        frame, new_embedding, results = await run_inference(embed_and_search, image_bytes)
         
         if results and results[0] != "Unknown":
             student_id, similarity = results
@@ -204,24 +562,26 @@ async def register_face(class_id: int = Form(...), file: UploadFile = File(...))
                 detail=f"Face already registered to student {student_id}."
             )
         
-        # Check against other unregistered faces (in-memory)
-        for existing_embedding in app.state.unregistered_embeddings.values():
-            similarity = np.dot(new_embedding, existing_embedding)
-            if similarity > SIMILARITY_THRESH:
-                raise HTTPException(
-                    status_code=409,
-                    detail="This face is already pending registration."
-                )
-        
         # Generate a unique ID for this face image
         face_id = str(uuid.uuid4())
         image_path = os.path.join(UNREGISTERED_FACES_PATH, f"{face_id}.jpg")
         
-        # Save the original image
-        cv2.imwrite(image_path, frame)
+        # Check against other unregistered faces and store the embedding in one step, so two
+        # concurrent uploads of the same person cannot both pass the check
+        if await run_inference(app.state.unregistered_embeddings.add_if_unique, face_id, new_embedding,
+                               SIMILARITY_THRESH):
+            raise HTTPException(
+                status_code=409,
+                detail="This face is already pending registration."
+            )
         
-        # Add to in-memory cache
-        app.state.unregistered_embeddings[face_id] = new_embedding
+        # Save the original image; without it the embedding would be dropped on the next start anyway
+        try:
+            if not await run_inference(cv2.imwrite, image_path, frame):
+                raise OSError(f"Could not write {image_path}")
+        except Exception:
+            await run_inference(app.state.unregistered_embeddings.remove, face_id)
+            raise
         
         return {"face_id": face_id, "message": "Face captured successfully.", "class_id": class_id}
     
@@ -239,28 +599,27 @@ async def commit_face(student_id: str = Form(...), face_id: str = Form(...)):
     """
     validate_models_loaded(app)
     
-    # Check if the face_id exists in our cache
-    if face_id not in app.state.unregistered_embeddings:
-        raise HTTPException(
-            status_code=404, 
-            detail=f"Unregistered face with ID {face_id} not found in memory cache."
-        )
-    
     try:
-        # Use the pre-computed embedding directly from cache
-        embedding = app.state.unregistered_embeddings[face_id]
+        # Claim the pre-computed embedding: a concurrent commit of the same face_id now finds nothing
+        embedding = await run_inference(app.state.unregistered_embeddings.pop, face_id)
+        if embedding is None:
+            raise HTTPException(
+                status_code=404, 
+                detail=f"Unregistered face with ID {face_id} not found in memory cache."
+            )
         
-        # Add the face to the main database
-        app.state.face_db.add_face(embedding, student_id)
-        app.state.face_db.save()
+        # Add the face to the main database, handing the face back if that fails
+        try:
+            await run_inference(app.state.face_db.add_face, embedding, student_id)
+        except Exception:
+            await run_inference(app.state.unregistered_embeddings.add, face_id, embedding)
+            raise
         
-        # Clean up the unregistered face image and cache entry
+        # Clean up the unregistered face image
         image_path = os.path.join(UNREGISTERED_FACES_PATH, f"{face_id}.jpg")
         if os.path.exists(image_path):
             os.remove(image_path)
         
-        del app.state.unregistered_embeddings[face_id]
-        
         return {"message": f"Face for student {student_id} has been successfully registered."}
     
     except HTTPException:
@@ -282,12 +641,13 @@ async def delete_face(student_id: str):
         raise HTTPException(status_code=503, detail="Database not loaded.")
     
     try:
-        num_deleted = app.state.face_db.delete_face(student_id)
-        app.state.face_db.save()
+        num_deleted = await run_inference(app.state.face_db.delete_face, student_id)
         return {
             "message": f"Successfully processed deletion for student {student_id}. {num_deleted} face(s) were removed."
         }
     
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"An error occurred during face deletion: {e}")
         raise HTTPException(status_code=500, detail="An internal server error occurred during face deletion.")
@@ -304,8 +664,8 @@ async def unregister_face(face_id: str):
     
     try:
         os.remove(image_path)
-        if hasattr(app.state, 'unregistered_embeddings') and face_id in app.state.unregistered_embeddings:
-            del app.state.unregistered_embeddings[face_id]
+        if hasattr(app.state, 'unregistered_embeddings'):
+            await run_inference(app.state.unregistered_embeddings.remove, face_id)
         return {"message": f"Unregistered face {face_id} deleted successfully."}
     except Exception as e:
         print(f"An error occurred during unregistered face deletion: {e}")
@@ -324,5 +684,49 @@ async def get_unregistered_face(face_id: str):
     return FileResponse(image_path, media_type="image/jpeg")
 
 
+@app.get("/export_attendance")
+async def export_attendance(
+    format: str = "csv",
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    student_id: Optional[str] = None,
+    session: Optional[int] = None,
+):
+    """
+    Streams attendance records as CSV, JSON lines or Parquet.
+    Rows are read and encoded chunk by chunk, so large date ranges are never buffered.
+    """
+    if not hasattr(app.state, 'attendance_exporter'):
+        raise HTTPException(status_code=503, detail="Attendance database not loaded.")
+
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unsupported format '{format}'. Use one of: {', '.join(EXPORT_FORMATS)}."
+        )
+    if format == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        raise HTTPException(status_code=501, detail="Parquet export is not available on this server.")
+
+    for value in (start_date, end_date):
+        if value:
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                raise HTTPException(status_code=400, detail=f"Invalid date '{value}', expected YYYY-MM-DD.")
+
+    content = app.state.attendance_exporter.stream(
+        format,
+        start_date=start_date,
+        end_date=end_date,
+        student=student_id,
+        session_number=session,
+    )
+    return StreamingResponse(
+        content,
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="attendance.{format}"'},
+    )
+
+
 # --- To run this API, use the command: ---
 # uvicorn api:app --host 0.0.0.0 --port 8000 --reload
@@ -0,0 +1,293 @@
+"""Reproducible micro-benchmarks for each stage of the recognition pipeline.
+
+All inputs are synthetic and seeded, so runs on the same machine are comparable
+across commits without a camera, face images or a populated database:
+
+    scrfd       detect() latency of det_500m.onnx per input size on noise frames
+    arcface     get_embeddings() latency per batch size (needs --rec-weight)
+    faiss       FaceDatabase.search / search_batch latency per gallery size
+    tracker     BYTETracker.update() cost per frame per number of moving faces
+    attendance  AttendanceDatabase.apply_events() write rate per batch size
+
+Results are written as JSON. Pass an earlier result as --baseline to fail (exit 1)
+when any metric is more than --max-regression worse than it was.
+
+Usage (from the face-reidentification directory):
+    python benchmarks/pipeline.py --json bench.json
+    python benchmarks/pipeline.py --only faiss tracker --baseline bench.json --max-regression 0.15
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+BENCHMARKS = ("scrfd", "arcface", "faiss", "tracker", "attendance")
+SEED = 0
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Recognition pipeline benchmark suite")
+    parser.add_argument("--only", nargs="+", choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument("--det-weight", type=str, default=os.path.join(ROOT, "weights", "det_500m.onnx"))
+    parser.add_argument("--rec-weight", type=str, default=os.path.join(ROOT, "weights", "w600k_mbf.onnx"))
+    parser.add_argument("--ort-config", type=str, default=None)
+    parser.add_argument("--ort-profile", type=str, default=None)
+    parser.add_argument("--input-sizes", nargs="+", type=int, default=[320, 480, 640])
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 4, 8, 16, 32])
+    parser.add_argument("--gallery-sizes", nargs="+", type=int, default=[100, 1000, 10000, 100000])
+    parser.add_argument("--track-counts", nargs="+", type=int, default=[1, 5, 10, 25, 50])
+    parser.add_argument("--event-batches", nargs="+", type=int, default=[1, 16, 256])
+    parser.add_argument("--repeats", type=int, default=20, help="Timed runs per measurement (median is kept)")
+    parser.add_argument("--warmup", type=int, default=3, help="Untimed runs before each measurement")
+    parser.add_argument("--json", type=str, default=None, help="Write the results to this file")
+    parser.add_argument("--baseline", type=str, default=None, help="Earlier --json output to compare against")
+    parser.add_argument("--max-regression", type=float, default=0.10,
+                        help="Allowed relative slowdown per metric before the run fails")
+    return parser.parse_args()
+
+
+def measure(func, repeats, warmup):
+    """Median wall time of ``func()`` in seconds."""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def metric(value, unit, higher_is_better=False):
+    return {"value": value, "unit": unit, "higher_is_better": higher_is_better}
+
+
+def bench_scrfd(args, session_factory):
+    from models import SCRFD
+
+    frame = np.random.default_rng(SEED).integers(0, 255, (480, 640, 3), dtype=np.uint8)
+    results = {}
+    for size in args.input_sizes:
+        detector = SCRFD(args.det_weight, input_size=(size, size), session_factory=session_factory)
+        seconds = measure(lambda: detector.detect(frame), args.repeats, args.warmup)
+        results[f"scrfd.detect.{size}.ms"] = metric(seconds * 1000, "ms")
+        results[f"scrfd.detect.{size}.fps"] = metric(1 / seconds, "fps", higher_is_better=True)
+    return results
+
+
+def bench_arcface(args, session_factory):
+    from models import ArcFace
+    from utils.helpers import reference_alignment
+
+    if not os.path.isfile(args.rec_weight):
+        print(f"  skipping arcface: {args.rec_weight} not found")
+        return {}
+
+    recognizer = ArcFace(args.rec_weight, session_factory=session_factory)
+    rng = np.random.default_rng(SEED)
+    # Landmarks on ArcFace's reference points, scaled up, so alignment does real work
+    landmarks = reference_alignment * 2 + np.array([260, 140], dtype=np.float32)
+    frames = [rng.integers(0, 255, (480, 640, 3), dtype=np.uint8) for _ in range(max(args.batch_sizes))]
+
+    results = {}
+    for batch in args.batch_sizes:
+        faces = [(frame, landmarks) for frame in frames[:batch]]
+        seconds = measure(lambda: recognizer.get_embeddings(faces), args.repeats, args.warmup)
+        results[f"arcface.batch.{batch}.ms"] = metric(seconds * 1000, "ms")
+        results[f"arcface.batch.{batch}.ms_per_face"] = metric(seconds * 1000 / batch, "ms")
+    return results
+
+
+def bench_faiss(args, workdir):
+    from database import FaceDatabase
+
+    rng = np.random.default_rng(SEED)
+    queries = rng.standard_normal((16, 512)).astype(np.float32)
+
+    results = {}
+    for size in args.gallery_sizes:
+        gallery = rng.standard_normal((size, 512)).astype(np.float32)
+        gallery /= np.linalg.norm(gallery, axis=1, keepdims=True)
+
+        face_db = FaceDatabase(db_path=os.path.join(workdir, f"faiss_{size}"))
+        # Fill the index directly: persisting a synthetic gallery is not what is measured
+        face_db.index.add(gallery)
+        face_db.metadata.extend(f"student_{i}" for i in range(size))
+        try:
+            single = measure(lambda: face_db.search(queries[0]), args.repeats, args.warmup)
+            batch = measure(lambda: face_db.search_batch(queries), args.repeats, args.warmup)
+        finally:
+            face_db.close()
+
+        results[f"faiss.search.{size}.us"] = metric(single * 1e6, "us")
+        results[f"faiss.search_batch16.{size}.us_per_query"] = metric(batch * 1e6 / len(queries), "us")
+    return results
+
+
+def moving_faces(count, frames, rng):
+    """Detections (x1, y1, x2, y2, score) of ``count`` faces drifting across a 640x640 frame."""
+    starts = rng.uniform(40, 560, (count, 2))
+    velocities = rng.uniform(-2, 2, (count, 2))
+    sizes = rng.uniform(40, 80, (count, 1))
+    for frame_id in range(frames):
+        centers = np.clip(starts + velocities * frame_id, 40, 600) + rng.normal(0, 0.5, (count, 2))
+        yield np.hstack([centers - sizes / 2, centers + sizes / 2,
+                         rng.uniform(0.7, 0.99, (count, 1))]).astype(np.float32)
+
+
+def bench_tracker(args):
+    import torch
+    import yaml
+    from models.face_tracking.byte_tracker import BYTETracker
+
+    with open(os.path.join(ROOT, "models", "face_tracking", "config_tracking.yaml"), "r") as stream:
+        config = yaml.safe_load(stream)
+
+    frames = args.warmup + args.repeats * 5
+    results = {}
+    for count in args.track_counts:
+        tracker = BYTETracker(args=config, frame_rate=30)
+        timings = []
+        for frame_id, detections in enumerate(moving_faces(count, frames, np.random.default_rng(SEED))):
+            detections = torch.tensor(detections)
+            start = time.perf_counter()
+            tracker.update(detections, [640, 640], (640, 640))
+            if frame_id >= args.warmup:
+                timings.append(time.perf_counter() - start)
+        results[f"tracker.update.{count}.us"] = metric(statistics.median(timings) * 1e6, "us")
+    return results
+
+
+def bench_attendance(args, workdir):
+    from database import AttendanceDatabase
+
+    # An on-time arrival inside the first scheduled session, so every entry takes the full write path
+    session_time = datetime.datetime.combine(datetime.date.today(), datetime.time(7, 20, 30)).timestamp()
+    students = 200
+    results = {}
+    for batch in args.event_batches:
+        attendance_db = AttendanceDatabase(db_path=os.path.join(workdir, f"attendance_{batch}.db"))
+        sequence = iter(range(1 << 62))
+
+        def events():
+            # Each student enters, then later leaves, then enters again, ...
+            batch_events = []
+            for seq in (next(sequence) for _ in range(batch)):
+                batch_events.append({"seq": seq, "kind": ("entry", "exit")[(seq // students) % 2],
+                                     "name": f"student_{seq % students}", "ts": session_time})
+            return batch_events
+
+        try:
+            seconds = measure(lambda: attendance_db.apply_events(events()), max(3, args.repeats // 2), 1)
+        finally:
+            attendance_db.close()
+        results[f"attendance.apply_events.{batch}.events_per_s"] = metric(batch / seconds, "events/s",
+                                                                         higher_is_better=True)
+    return results
+
+
+def environment(args, session_factory):
+    import onnxruntime
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "onnxruntime": onnxruntime.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpus": len(session_factory.cores),
+        "ort_profile": session_factory.profile,
+        "repeats": args.repeats,
+        "seed": SEED,
+    }
+
+
+def compare(results, baseline, max_regression):
+    """Return (name, old, new, change) for every metric worse than the baseline by more than ``max_regression``."""
+    regressions = []
+    for name, old in baseline.items():
+        new = results.get(name)
+        if new is None or not old["value"]:
+            continue
+        change = (new["value"] - old["value"]) / old["value"]
+        worse = -change if old.get("higher_is_better") else change
+        if worse > max_regression:
+            regressions.append((name, old["value"], new["value"], worse))
+    return regressions
+
+
+def main():
+    args = parse_args()
+    os.chdir(ROOT)
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger().setLevel(logging.WARNING)
+
+    from models import SessionFactory
+
+    # Cached optimized models would make the first benchmark depend on earlier runs
+    session_factory = SessionFactory(args.ort_config, profile=args.ort_profile)
+    session_factory.cache_enabled = False
+
+    results = {}
+    workdir = tempfile.mkdtemp(prefix="pipeline-bench-")
+    try:
+        for name in args.only:
+            print(f"[{name}]")
+            start = time.perf_counter()
+            if name == "scrfd":
+                measured = bench_scrfd(args, session_factory)
+            elif name == "arcface":
+                measured = bench_arcface(args, session_factory)
+            elif name == "faiss":
+                measured = bench_faiss(args, workdir)
+            elif name == "tracker":
+                measured = bench_tracker(args)
+            else:
+                measured = bench_attendance(args, workdir)
+            for key, value in measured.items():
+                print(f"  {key:<48} {value['value']:>12.3f} {value['unit']}")
+            print(f"  ({time.perf_counter() - start:.1f}s)")
+            results.update(measured)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {"environment": environment(args, session_factory), "results": results}
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r") as f:
+            baseline = json.load(f)
+        if baseline.get("environment", {}).get("machine") != report["environment"]["machine"]:
+            print("warning: baseline was recorded on a different machine type")
+        regressions = compare(results, baseline.get("results", {}), args.max_regression)
+        for name, old, new, worse in regressions:
+            print(f"REGRESSION {name}: {old:.3f} -> {new:.3f} ({worse:+.1%} worse)")
+        if regressions:
+            sys.exit(1)
+        print(f"No metric regressed by more than {args.max_regression:.0%} "
+              f"against {baseline.get('environment', {}).get('commit')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Replay a recorded detection log through everything downstream of SCRFD, as fast as possible.
+
+Record a run with ``python main.py --record-detections run.fdlog`` (a camera or
+``--source video.mp4``). The replay feeds the logged detections, frame by frame, to
+the same code main.py uses:
+
+    update_tracks      BYTETracker plus the area/aspect filters
+    recognition_step   quality gating, best-frame selection, FAISS search, AttendanceTracker
+    AttendanceWriter   write-behind queue into a scratch AttendanceDatabase
+
+There are no pixels in the log, so ArcFace is replaced by synthetic embeddings: every
+track is assigned a gallery student (or, for --unknown-fraction of tracks, nobody) and
+gets that student's embedding plus noise. Sharpness is not measured and liveness is off.
+Unlike the live pipeline, recognition runs on every frame rather than whenever its
+thread is free, and event times follow the log (shifted to --start-at), not the wall clock.
+
+Options not listed below are passed to main.py's parser (e.g. --similarity-thresh,
+--quality-window, --exit-cooldown). Profile the post-detection pipeline with
+``python -m cProfile -o replay.prof benchmarks/replay.py run.fdlog``.
+
+Usage (from the face-reidentification directory):
+    python benchmarks/replay.py run.fdlog --students 40 --json replay.json
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Replay recorded detections through tracking, recognition "
+                                                 "and attendance")
+    parser.add_argument("log", type=str, help="Detection log written with main.py --record-detections")
+    parser.add_argument("--students", type=int, default=50, help="Synthetic gallery size")
+    parser.add_argument("--unknown-fraction", type=float, default=0.1,
+                        help="Fraction of tracks that belong to nobody in the gallery")
+    parser.add_argument("--embedding-noise", type=float, default=0.03,
+                        help="Per-dimension noise added to a student's embedding for each recognition")
+    parser.add_argument("--start-at", type=str, default="07:20",
+                        help="Shift the log so it starts at this time today (HH:MM), or 'recorded' to keep its times")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", type=str, default=None, help="Also write the results to this file")
+    return parser.parse_known_args()
+
+
+class SyntheticEmbedder:
+    """Stands in for ArcFace: a track's embedding is its student's gallery embedding plus noise."""
+
+    def __init__(self, gallery: np.ndarray, unknown_fraction: float, noise: float, seed: int):
+        self.gallery = gallery
+        self.unknown_fraction = unknown_fraction
+        self.noise = noise
+        self.seed = seed
+        self.identities = {}  # track_id: gallery row, or -1 for someone unregistered
+        # A stream of its own: reusing the gallery's would make "unknown" faces copies of gallery rows
+        self.rng = np.random.default_rng(np.random.SeedSequence(seed).spawn(2)[1])
+
+    def identity(self, track_id: int) -> int:
+        if track_id not in self.identities:
+            rng = np.random.default_rng((self.seed, track_id))
+            unknown = rng.random() < self.unknown_fraction
+            self.identities[track_id] = -1 if unknown else int(rng.integers(len(self.gallery)))
+        return self.identities[track_id]
+
+    def __call__(self, due):
+        embeddings = self.rng.normal(0, self.noise, (len(due), self.gallery.shape[1])).astype(np.float32)
+        for row, (track_id, _, _) in enumerate(due):
+            identity = self.identity(track_id)
+            if identity >= 0:
+                embeddings[row] += self.gallery[identity]
+            else:
+                embeddings[row] += self.rng.standard_normal(self.gallery.shape[1]).astype(np.float32) / 22.6
+        return embeddings
+
+
+def main():
+    args, pipeline_argv = parse_args()
+    os.chdir(ROOT)
+
+    import torch
+    import main as pipeline
+    from database import AttendanceDatabase, AttendanceWriter, FaceDatabase
+    from models import AttendanceTracker
+    from models.face_tracking.byte_tracker import BYTETracker
+    from utils.detection_log import read_detection_log
+    from utils.face_quality import TrackFaceSelector
+    from utils.metrics import REGISTRY
+
+    params = pipeline.parse_args(pipeline_argv)
+    logging.getLogger().setLevel(logging.WARNING)
+    config_tracking = pipeline.load_config("models/face_tracking/config_tracking.yaml")
+
+    frames = list(read_detection_log(args.log))
+    if not frames:
+        raise SystemExit(f"{args.log} has no frames")
+    if args.start_at == "recorded":
+        offset = 0.0
+    else:
+        start = datetime.datetime.combine(datetime.date.today(),
+                                          datetime.datetime.strptime(args.start_at, "%H:%M").time())
+        offset = start.timestamp() - frames[0].timestamp
+
+    rng = np.random.default_rng(np.random.SeedSequence(args.seed).spawn(2)[0])
+    gallery = rng.standard_normal((args.students, 512)).astype(np.float32)
+    gallery /= np.linalg.norm(gallery, axis=1, keepdims=True)
+
+    workdir = tempfile.mkdtemp(prefix="replay-")
+    clock = [frames[0].timestamp + offset]
+    face_db = FaceDatabase(db_path=os.path.join(workdir, "face_database"))
+    # Fill the index directly: persisting a synthetic gallery is not what is replayed
+    face_db.index.add(gallery)
+    face_db.metadata.extend(f"student_{i:03d}" for i in range(args.students))
+    attendance_db = AttendanceDatabase(db_path=os.path.join(workdir, "attendance.db"))
+    attendance_writer = AttendanceWriter(attendance_db, batch_interval=params.attendance_batch_interval,
+                                         clock=lambda: clock[0])
+    attendance_tracker = AttendanceTracker(attendance_writer, cooldown_seconds=params.exit_cooldown)
+    tracker = BYTETracker(args=config_tracking, frame_rate=30)
+    selector = TrackFaceSelector(window=params.quality_window)
+    embedder = SyntheticEmbedder(gallery, args.unknown_fraction, args.embedding_noise, args.seed)
+    committed = REGISTRY.counter("face_attendance_events_committed")
+    committed_before = committed.value
+
+    track_seconds = recognition_seconds = 0.0
+    faces = 0
+    track_ids = set()
+    try:
+        started = time.perf_counter()
+        for frame in frames:
+            clock[0] = frame.timestamp + offset
+            faces += len(frame.detections)
+
+            tick = time.perf_counter()
+            img_info = {"height": frame.height, "width": frame.width}
+            _, tracking_ids, tracking_bboxes = pipeline.update_tracks(
+                tracker, torch.tensor(frame.detections.copy()), img_info, config_tracking)
+            tock = time.perf_counter()
+            track_seconds += tock - tick
+
+            if len(frame.landmarks) == 0 or len(tracking_ids) == 0:
+                attendance_tracker.update({}, now=clock[0])
+            else:
+                track_ids.update(tracking_ids)
+                pipeline.recognition_step(None, frame.bboxes, list(frame.landmarks), tracking_ids, tracking_bboxes,
+                                          clock[0], embedder, face_db, attendance_tracker, selector, {}, params)
+            recognition_seconds += time.perf_counter() - tock
+
+        replayed = time.perf_counter() - started
+        attendance_writer.close()
+        total = time.perf_counter() - started
+    finally:
+        face_db.close()
+        attendance_db.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    named = {track_id: name for track_id, name in pipeline.id_face_mapping.items() if track_id in track_ids}
+    correct = sum(1 for track_id, name in named.items()
+                  if embedder.identity(track_id) >= 0 and name == f"student_{embedder.identity(track_id):03d}")
+    duration = frames[-1].timestamp - frames[0].timestamp
+    report = {
+        "log": os.path.abspath(args.log),
+        "frames": len(frames),
+        "faces": faces,
+        "recorded_seconds": duration,
+        "replay_seconds": replayed,
+        "replay_fps": len(frames) / replayed if replayed else 0.0,
+        "speedup": duration / replayed if replayed else 0.0,
+        "tracking_ms_per_frame": track_seconds * 1000 / len(frames),
+        "recognition_ms_per_frame": recognition_seconds * 1000 / len(frames),
+        "attendance_flush_seconds": total - replayed,
+        "tracks": len(track_ids),
+        "tracks_named": len(named),
+        "tracks_named_correctly": correct,
+        "attendance_events": int(committed.value - committed_before),
+    }
+
+    for key, value in report.items():
+        print(f"{key:<28} {value:.3f}" if isinstance(value, float) else f"{key:<28} {value}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
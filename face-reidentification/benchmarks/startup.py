@@ -0,0 +1,176 @@
+"""Time-to-first-inference for main.py and the api.py lifespan, with and without the optimized-model cache.
+
+Every measurement runs in a fresh interpreter, so imports, session creation and
+graph optimization are all paid again. Three modes are compared:
+
+    nocache  model_cache disabled (what every start did before the cache existed)
+    cold     cache enabled but empty, so the optimized models are written
+    warm     cache enabled and filled by the cold run
+
+Usage (from the face-reidentification directory):
+    python benchmarks/startup.py --target both --runs 3
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ("nocache", "cold", "warm")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Startup benchmark for the optimized-model cache")
+    parser.add_argument("--target", choices=["main", "api", "both"], default="both")
+    parser.add_argument("--runs", type=int, default=3, help="Runs per mode (cold always clears the cache first)")
+    parser.add_argument("--det-weight", type=str, default=os.path.join(ROOT, "weights", "det_500m.onnx"))
+    parser.add_argument("--rec-weight", type=str, default=os.path.join(ROOT, "weights", "w600k_mbf.onnx"))
+    parser.add_argument("--spoof-weight", type=str,
+                        default=os.path.join(ROOT, "weights", "AntiSpoofing_bin_1.5_128.onnx"))
+    parser.add_argument("--ort-config", type=str, default=None, help="Base ONNX Runtime config")
+    parser.add_argument("--ort-profile", type=str, default=None)
+    parser.add_argument("--json", type=str, default=None, help="Also write the results to this file")
+    parser.add_argument("--child", choices=["main", "api"], help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+def synthetic_face():
+    """A frame plus landmarks placed on ArcFace's reference points, so every model runs once."""
+    import numpy as np
+    from utils.helpers import reference_alignment
+
+    frame = np.random.default_rng(0).integers(0, 255, (480, 640, 3), dtype=np.uint8)
+    return frame, reference_alignment * 2 + np.array([260, 140], dtype=np.float32)
+
+
+def child_main(args):
+    """Mirror main.main(): build the three models, then run each once."""
+    start = time.perf_counter()
+    from models import SCRFD, ArcFace, AntiSpoof, SessionFactory
+    imported = time.perf_counter()
+
+    session_factory = SessionFactory(args.ort_config, profile=args.ort_profile, concurrent_sessions=2)
+    detector = SCRFD(args.det_weight, input_size=(640, 640), session_factory=session_factory, session_group=0)
+    recognizer = ArcFace(args.rec_weight, session_factory=session_factory, session_group=1)
+    anti_spoofing = AntiSpoof(args.spoof_weight, session_factory=session_factory, session_group=1)
+    loaded = time.perf_counter()
+
+    frame, kps = synthetic_face()
+    detector.detect(frame)
+    recognizer.get_embedding(frame, kps, normalized=True)
+    anti_spoofing([frame[140:380, 220:420]])
+    done = time.perf_counter()
+
+    return {"import": imported - start, "load": loaded - imported, "first_inference": done - loaded,
+            "total": done - start}
+
+
+def child_api(args):
+    """Run the FastAPI lifespan and time the first /recognize response."""
+    import cv2
+
+    start = time.perf_counter()
+    import api
+    from fastapi.testclient import TestClient
+    imported = time.perf_counter()
+
+    # Keep the benchmark away from the real databases
+    scratch = tempfile.mkdtemp(prefix="startup-bench-")
+    api.DET_WEIGHT, api.REC_WEIGHT = args.det_weight, args.rec_weight
+    api.DB_PATH = os.path.join(scratch, "face_database")
+    api.UNREGISTERED_FACES_PATH = os.path.join(scratch, "unregistered_faces")
+    api.ATTENDANCE_DB_PATH = os.path.join(scratch, "attendance.db")
+
+    frame, _ = synthetic_face()
+    image = cv2.imencode(".jpg", frame)[1].tobytes()
+    try:
+        with TestClient(api.app) as client:
+            loaded = time.perf_counter()
+            client.post("/recognize", files={"file": ("frame.jpg", image, "image/jpeg")})
+            done = time.perf_counter()
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    return {"import": imported - start, "load": loaded - imported, "first_inference": done - loaded,
+            "total": done - start}
+
+
+def write_config(base_path, path, cache_dir):
+    """Copy the runtime config with the model cache pointed at ``cache_dir`` (or disabled)."""
+    import yaml
+    from models.onnx_session import DEFAULT_RUNTIME_CONFIG
+
+    with open(base_path or DEFAULT_RUNTIME_CONFIG, "r") as stream:
+        config = yaml.safe_load(stream)
+    config["model_cache"] = {"enabled": cache_dir is not None, "dir": cache_dir}
+    with open(path, "w") as stream:
+        yaml.safe_dump(config, stream)
+
+
+def run_child(args, target, config_path):
+    command = [sys.executable, os.path.abspath(__file__), "--child", target, "--ort-config", config_path,
+               "--det-weight", args.det_weight, "--rec-weight", args.rec_weight,
+               "--spoof-weight", args.spoof_weight]
+    if args.ort_profile:
+        command += ["--ort-profile", args.ort_profile]
+
+    env = dict(os.environ, ORT_CONFIG=config_path, ORT_PROFILE=args.ort_profile or "")
+    result = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{target} benchmark run failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def benchmark(args, target, workdir):
+    cache_dir = os.path.join(workdir, "ort_cache")
+    configs = {"nocache": os.path.join(workdir, "nocache.yaml"), "cached": os.path.join(workdir, "cached.yaml")}
+    write_config(args.ort_config, configs["nocache"], None)
+    write_config(args.ort_config, configs["cached"], cache_dir)
+
+    runs = {mode: [] for mode in MODES}
+    for _ in range(args.runs):
+        runs["nocache"].append(run_child(args, target, configs["nocache"]))
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        runs["cold"].append(run_child(args, target, configs["cached"]))
+        runs["warm"].append(run_child(args, target, configs["cached"]))
+
+    return {mode: {key: statistics.median(run[key] for run in results) for key in results[0]}
+            for mode, results in runs.items()}
+
+
+def main():
+    args = parse_args()
+    sys.path.insert(0, ROOT)
+    os.chdir(ROOT)
+
+    if args.child:
+        result = child_main(args) if args.child == "main" else child_api(args)
+        print(json.dumps(result))
+        return
+
+    targets = ["main", "api"] if args.target == "both" else [args.target]
+    report = {}
+    with tempfile.TemporaryDirectory(prefix="startup-bench-") as workdir:
+        for target in targets:
+            report[target] = benchmark(args, target, workdir)
+
+    print(f"{'target':<6} {'mode':<8} {'import':>9} {'load':>9} {'first run':>10} {'total':>9}")
+    for target, modes in report.items():
+        for mode, timings in modes.items():
+            print(f"{target:<6} {mode:<8} {timings['import'] * 1000:>7.0f}ms {timings['load'] * 1000:>7.0f}ms "
+                  f"{timings['first_inference'] * 1000:>8.0f}ms {timings['total'] * 1000:>7.0f}ms")
+        saved = modes["nocache"]["total"] - modes["warm"]["total"]
+        print(f"{target:<6} warm cache saves {saved * 1000:.0f}ms of time-to-first-inference")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"runs": args.runs, "results": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
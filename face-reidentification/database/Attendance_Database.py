@@ -1,17 +1,38 @@
 import sqlite3
+from bisect import bisect_right
 from datetime import datetime
 import datetime as dt
 from contextlib import contextmanager
 import logging
 import os
+import threading
+import time
 
 class AttendanceDatabase:
 
-    def __init__(self, db_path='attendance.db'):
+    def __init__(self, db_path='attendance.db', schedule_refresh_seconds=30, busy_timeout_ms=5000,
+                 synchronous='NORMAL'):
         self.db_path = db_path
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         self.connection = None
+        self.busy_timeout_ms = busy_timeout_ms
+        self.synchronous = synchronous
+        # One long-lived connection per thread; all of them are closed by close()
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        # name -> students.id, only populated from committed rows
+        self._student_ids = {}
+        self.schedule_refresh_seconds = schedule_refresh_seconds
+        # (starts, sessions, max_ends) sorted by start time, swapped atomically on reload
+        self._schedule = ([], [], [])
+        self._schedule_version = None
+        self._schedule_checked_at = 0.0
         self._init_database()
+        self._load_schedule()
+        self._backfill_session_attendance()
+        self._backfill_semester_summary()
+        self._warm_student_cache()
 
     def _init_database(self):
         try:
@@ -38,11 +59,116 @@ class AttendanceDatabase:
                         status TEXT DEFAULT 'present' CHECK(status IN ('present', 'left')),
                         attendance_status TEXT DEFAULT 'on_time' CHECK(attendance_status IN ('on_time', 'late', 'absent')),
                         late_minutes INTEGER DEFAULT 0,
+                        session_number INTEGER,
                         FOREIGN KEY (student_id) REFERENCES students(id)
                     )
                 """)
+                cursor.execute("PRAGMA table_info(attendance_sessions)")
+                if 'session_number' not in [row[1] for row in cursor.fetchall()]:
+                    cursor.execute("ALTER TABLE attendance_sessions ADD COLUMN session_number INTEGER")
                 cursor.execute("CREATE INDEX IF NOT EXISTS idx_date_status ON attendance_sessions (session_date, status)")
 
+                # One row per student per scheduled session; daily_attendance is the per-day rollup
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS session_attendance (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        student_id INTEGER NOT NULL,
+                        attendance_date TEXT NOT NULL,
+                        session_number INTEGER NOT NULL,
+                        attendance_status TEXT DEFAULT 'absent' CHECK(attendance_status IN ('on_time', 'late', 'absent')),
+                        late_minutes INTEGER DEFAULT 0,
+                        attendance_score REAL DEFAULT 0,
+                        first_entry TEXT,
+                        last_exit TEXT,
+                        total_minutes INTEGER DEFAULT 0,
+                        FOREIGN KEY (student_id) REFERENCES students(id),
+                        UNIQUE (student_id, attendance_date, session_number)
+                    )
+                """)
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_session_attendance_date_session
+                    ON session_attendance (attendance_date, session_number, student_id, attendance_status)
+                """)
+                cursor.execute("""
+                    CREATE INDEX IF NOT EXISTS idx_session_attendance_student
+                    ON session_attendance (student_id, attendance_date, attendance_status, attendance_score, late_minutes)
+                """)
+
+
+                # Per-student semester totals, kept current by the triggers below
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS student_semester_summary (
+                        student_id INTEGER PRIMARY KEY,
+                        days_attended INTEGER NOT NULL DEFAULT 0,
+                        sessions_recorded INTEGER NOT NULL DEFAULT 0,
+                        total_score REAL NOT NULL DEFAULT 0,
+                        late_count INTEGER NOT NULL DEFAULT 0,
+                        absent_count INTEGER NOT NULL DEFAULT 0,
+                        total_late_minutes INTEGER NOT NULL DEFAULT 0,
+                        FOREIGN KEY (student_id) REFERENCES students(id)
+                    )
+                """)
+                cursor.execute("""
+                    CREATE TRIGGER IF NOT EXISTS trg_session_attendance_insert
+                    AFTER INSERT ON session_attendance
+                    BEGIN
+                        INSERT OR IGNORE INTO student_semester_summary (student_id) VALUES (NEW.student_id);
+                        UPDATE student_semester_summary SET
+                            sessions_recorded = sessions_recorded + 1,
+                            total_score = total_score + COALESCE(NEW.attendance_score, 0),
+                            late_count = late_count + (NEW.attendance_status = 'late'),
+                            absent_count = absent_count + (NEW.attendance_status = 'absent'),
+                            total_late_minutes = total_late_minutes + COALESCE(NEW.late_minutes, 0),
+                            days_attended = days_attended + (
+                                NEW.attendance_status != 'absent' AND NOT EXISTS (
+                                    SELECT 1 FROM session_attendance sa
+                                    WHERE sa.student_id = NEW.student_id AND sa.attendance_date = NEW.attendance_date
+                                    AND sa.attendance_status != 'absent' AND sa.id != NEW.id
+                                ))
+                        WHERE student_id = NEW.student_id;
+                    END
+                """)
+                cursor.execute("""
+                    CREATE TRIGGER IF NOT EXISTS trg_session_attendance_update
+                    AFTER UPDATE OF attendance_status, attendance_score, late_minutes ON session_attendance
+                    BEGIN
+                        UPDATE student_semester_summary SET
+                            total_score = total_score - COALESCE(OLD.attendance_score, 0) + COALESCE(NEW.attendance_score, 0),
+                            late_count = late_count - (OLD.attendance_status = 'late') + (NEW.attendance_status = 'late'),
+                            absent_count = absent_count - (OLD.attendance_status = 'absent') + (NEW.attendance_status = 'absent'),
+                            total_late_minutes = total_late_minutes - COALESCE(OLD.late_minutes, 0) + COALESCE(NEW.late_minutes, 0),
+                            days_attended = days_attended + (CASE
+                                WHEN (OLD.attendance_status = 'absent') = (NEW.attendance_status = 'absent') THEN 0
+                                WHEN EXISTS (
+                                    SELECT 1 FROM session_attendance sa
+                                    WHERE sa.student_id = NEW.student_id AND sa.attendance_date = NEW.attendance_date
+                                    AND sa.attendance_status != 'absent' AND sa.id != NEW.id
+                                ) THEN 0
+                                WHEN NEW.attendance_status != 'absent' THEN 1
+                                ELSE -1
+                            END)
+                        WHERE student_id = NEW.student_id;
+                    END
+                """)
+                cursor.execute("""
+                    CREATE TRIGGER IF NOT EXISTS trg_session_attendance_delete
+                    AFTER DELETE ON session_attendance
+                    BEGIN
+                        UPDATE student_semester_summary SET
+                            sessions_recorded = sessions_recorded - 1,
+                            total_score = total_score - COALESCE(OLD.attendance_score, 0),
+                            late_count = late_count - (OLD.attendance_status = 'late'),
+                            absent_count = absent_count - (OLD.attendance_status = 'absent'),
+                            total_late_minutes = total_late_minutes - COALESCE(OLD.late_minutes, 0),
+                            days_attended = days_attended - (
+                                OLD.attendance_status != 'absent' AND NOT EXISTS (
+                                    SELECT 1 FROM session_attendance sa
+                                    WHERE sa.student_id = OLD.student_id AND sa.attendance_date = OLD.attendance_date
+                                    AND sa.attendance_status != 'absent'
+                                ))
+                        WHERE student_id = OLD.student_id;
+                    END
+                """)
 
                 cursor.execute("""
                     CREATE TABLE IF NOT EXISTS daily_attendance (
@@ -85,6 +211,31 @@ class AttendanceDatabase:
                         VALUES (?, ?, ?)
                     """, schedule_data)
 
+                # Bumped by any change to class_schedule, from any connection or process, so the
+                # in-memory schedule is only reloaded when it actually changed
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS schedule_version (
+                        id INTEGER PRIMARY KEY CHECK (id = 1),
+                        version INTEGER NOT NULL
+                    )
+                """)
+                cursor.execute("INSERT OR IGNORE INTO schedule_version (id, version) VALUES (1, 0)")
+                for operation in ("INSERT", "UPDATE", "DELETE"):
+                    cursor.execute(f"""
+                        CREATE TRIGGER IF NOT EXISTS trg_class_schedule_{operation.lower()}
+                        AFTER {operation} ON class_schedule
+                        BEGIN
+                            UPDATE schedule_version SET version = version + 1 WHERE id = 1;
+                        END
+                    """)
+
+                cursor.execute("""
+                    CREATE TABLE IF NOT EXISTS event_journal_state (
+                        id INTEGER PRIMARY KEY CHECK (id = 1),
+                        last_seq INTEGER NOT NULL
+                    )
+                """)
+
                 cursor.execute("""
                     CREATE TABLE IF NOT EXISTS semester_config (
                         id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -109,52 +260,196 @@ class AttendanceDatabase:
             return datetime.strptime(time_str, '%H:%M:%S').time()
         return time_str
         
-    def get_current_session_time(self):
+    def _backfill_session_attendance(self):
+        """One-shot migration of databases created before session_attendance existed."""
         try:
             with self.get_connection() as conn:
-                conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
-                current_time = datetime.now().strftime('%H:%M:%S')
+                cursor.execute("SELECT EXISTS (SELECT 1 FROM session_attendance)")
+                if cursor.fetchone()[0]:
+                    return
 
                 cursor.execute("""
-                    SELECT session_number, start_time, end_time 
-                    FROM class_schedule
-                    WHERE start_time <= ? AND end_time >= ?
-                    ORDER BY start_time DESC
-                    LIMIT 1
-                """, (current_time, current_time))
+                    SELECT id, student_id, session_date, entry_time, exit_time, duration_minutes,
+                           attendance_status, late_minutes, session_number
+                    FROM attendance_sessions
+                    ORDER BY entry_time
+                """)
+                rows = cursor.fetchall()
+
+                session_updates = []
+                facts = {}
+                scores = {'on_time': 1.0, 'late': 0.5}
+                for (row_id, student_id, session_date, entry_time, exit_time, duration,
+                     attendance_status, late_minutes, session_number) in rows:
+                    if session_number is None:
+                        session_info = self.get_current_session_time(
+                            at=datetime.strptime(entry_time, '%Y-%m-%d %H:%M:%S'))
+                        session_number = session_info['session_number'] if session_info else 0
+                        session_updates.append((session_number, row_id))
+
+                    key = (student_id, session_date, session_number)
+                    fact = facts.setdefault(key, {
+                        'attendance_status': attendance_status,
+                        'late_minutes': late_minutes or 0,
+                        'attendance_score': scores.get(attendance_status, 0.0),
+                        'first_entry': entry_time,
+                        'last_exit': None,
+                        'total_minutes': 0
+                    })
+                    if exit_time and (fact['last_exit'] is None or exit_time > fact['last_exit']):
+                        fact['last_exit'] = exit_time
+                    fact['total_minutes'] += duration or 0
+
+                cursor.executemany("UPDATE attendance_sessions SET session_number = ? WHERE id = ?",
+                                   session_updates)
+                cursor.executemany("""
+                    INSERT INTO session_attendance
+                    (student_id, attendance_date, session_number, attendance_status, late_minutes,
+                     attendance_score, first_entry, last_exit, total_minutes)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """, [(*key, fact['attendance_status'], fact['late_minutes'], fact['attendance_score'],
+                       fact['first_entry'], fact['last_exit'], fact['total_minutes'])
+                      for key, fact in facts.items()])
+
+                # Day-level absences have no session; keep them under session 0
+                cursor.execute("""
+                    INSERT OR IGNORE INTO session_attendance
+                    (student_id, attendance_date, session_number, attendance_status)
+                    SELECT da.student_id, da.attendance_date, 0, 'absent'
+                    FROM daily_attendance da
+                    WHERE da.attendance_status = 'absent'
+                    AND NOT EXISTS (
+                        SELECT 1 FROM session_attendance sa
+                        WHERE sa.student_id = da.student_id AND sa.attendance_date = da.attendance_date
+                    )
+                """)
 
-                result = cursor.fetchone()
+                if facts or cursor.rowcount > 0:
+                    logging.info(f"Backfilled session attendance from {len(rows)} recorded sessions")
 
-                if result:
-                    return {
-                        'session_number': result['session_number'],
-                        'start_time': self._str_to_time(result['start_time']),
-                        'end_time': self._str_to_time(result['end_time'])
-                    }
+        except sqlite3.Error as e:
+            logging.error(f"Error backfilling session attendance: {e}")
 
+    def _backfill_semester_summary(self):
+        """Build student_semester_summary once for databases that predate it."""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
                 cursor.execute("""
-                    SELECT session_number, start_time, end_time 
-                    FROM class_schedule
-                    WHERE start_time > ?
-                    ORDER BY start_time ASC
-                    LIMIT 1
-                """, (current_time,))
+                    SELECT EXISTS (SELECT 1 FROM session_attendance)
+                    AND NOT EXISTS (SELECT 1 FROM student_semester_summary)
+                """)
+                needs_backfill = cursor.fetchone()[0]
+        except sqlite3.Error as e:
+            logging.error(f"Error checking semester summary: {e}")
+            return
 
-                result = cursor.fetchone()
-                
-                if result:
-                    return {
-                        'session_number': result['session_number'],
-                        'start_time': self._str_to_time(result['start_time']),
-                        'end_time': self._str_to_time(result['end_time'])
-                    }
+        if needs_backfill:
+            self.rebuild_semester_summary()
 
-                return None
+    def rebuild_semester_summary(self):
+        """Recompute student_semester_summary from session_attendance."""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM student_semester_summary")
+                cursor.execute("""
+                    INSERT INTO student_semester_summary
+                    (student_id, days_attended, sessions_recorded, total_score, late_count,
+                     absent_count, total_late_minutes)
+                    SELECT
+                        student_id,
+                        COUNT(DISTINCT CASE WHEN attendance_status != 'absent' THEN attendance_date END),
+                        COUNT(*),
+                        COALESCE(SUM(attendance_score), 0),
+                        SUM(attendance_status = 'late'),
+                        SUM(attendance_status = 'absent'),
+                        COALESCE(SUM(late_minutes), 0)
+                    FROM session_attendance
+                    GROUP BY student_id
+                """)
+                logging.info(f"Rebuilt semester summary for {cursor.rowcount} students")
+                return True
+        except sqlite3.Error as e:
+            logging.error(f"Error rebuilding semester summary: {e}")
+            return False
 
+    def _schedule_signature(self, cursor=None):
+        """Current schedule_version; attendance writes leave it alone, unlike the file mtimes."""
+        try:
+            if cursor is None:
+                with self.get_connection() as conn:
+                    return self._schedule_signature(conn.cursor())
+            cursor.execute("SELECT version FROM schedule_version WHERE id = 1")
+            result = cursor.fetchone()
+            return result[0] if result else None
         except sqlite3.Error as e:
-            logging.error(f"Error getting current session: {e}")
+            logging.error(f"Error reading schedule version: {e}")
             return None
+
+    def _load_schedule(self):
+        """Load class_schedule into sorted in-memory arrays for bisect lookups."""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT session_number, start_time, end_time
+                    FROM class_schedule
+                    ORDER BY start_time ASC, session_number ASC
+                """)
+                rows = cursor.fetchall()
+                version = self._schedule_signature(cursor)
+        except sqlite3.Error as e:
+            logging.error(f"Error loading class schedule: {e}")
+            return
+
+        starts, sessions, max_ends = [], [], []
+        for session_number, start_time, end_time in rows:
+            session = {
+                'session_number': session_number,
+                'start_time': self._str_to_time(start_time),
+                'end_time': self._str_to_time(end_time)
+            }
+            starts.append(session['start_time'])
+            sessions.append(session)
+            max_ends.append(max(max_ends[-1], session['end_time']) if max_ends else session['end_time'])
+
+        self._schedule = (starts, sessions, max_ends)
+        self._schedule_version = version
+        self._schedule_checked_at = time.monotonic()
+        logging.info(f"Loaded {len(sessions)} scheduled sessions")
+
+    def _refresh_schedule_if_changed(self):
+        now = time.monotonic()
+        if now - self._schedule_checked_at < self.schedule_refresh_seconds:
+            return
+        self._schedule_checked_at = now
+        if self._schedule_signature() != self._schedule_version:
+            self._load_schedule()
+
+    def get_current_session_time(self, at=None):
+        """Return the session running at ``at`` (default: now), else the next one today."""
+        self._refresh_schedule_if_changed()
+        starts, sessions, max_ends = self._schedule
+
+        if isinstance(at, dt.datetime):
+            at = at.time()
+        current_time = (at or datetime.now().time()).replace(microsecond=0)
+
+        idx = bisect_right(starts, current_time)
+
+        # Latest-starting session that has begun and not yet ended
+        i = idx - 1
+        while i >= 0 and max_ends[i] >= current_time:
+            if sessions[i]['end_time'] >= current_time:
+                return dict(sessions[i])
+            i -= 1
+
+        if idx < len(sessions):
+            return dict(sessions[idx])
+
+        return None
             
     def calculate_late_minutes(self, entry_time, scheduled_start_time):
         if isinstance(entry_time, dt.datetime):
@@ -168,157 +463,322 @@ class AttendanceDatabase:
             return int(delta.total_seconds() / 60)
         return 0
         
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout_ms / 1000,
+                               check_same_thread=False, cached_statements=256)
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        return conn
+
+    def open_read_connection(self):
+        """Open a dedicated read-only connection; the caller is responsible for closing it."""
+        conn = self._connect()
+        conn.execute("PRAGMA query_only = ON")
+        return conn
+
     @contextmanager
     def get_connection(self, row_factory=None):
-        conn = sqlite3.connect(self.db_path)
+        """The calling thread's connection; the outermost ``with`` commits (or rolls back) on exit.
+
+        Blocks nest: a helper that opens its own block inside a caller's (a schedule reload
+        in the middle of apply_events) shares the caller's transaction instead of committing it.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.depth = 0
+            with self._connections_lock:
+                self._connections.append(conn)
+
+        depth = self._local.depth
+        self._local.depth = depth + 1
+        previous_row_factory = conn.row_factory
         if row_factory:
             conn.row_factory = row_factory
         try:
             yield conn
-            conn.commit()
+            if depth == 0:
+                conn.commit()
         except Exception as e:
-            conn.rollback()
+            if depth == 0:
+                conn.rollback()
             raise e
         finally:
-            conn.close()
-
-    def get_or_create_student(self, name):
+            self._local.depth = depth
+            conn.row_factory = previous_row_factory
+
+    def close(self):
+        """Close every per-thread connection opened by this instance."""
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logging.error(f"Error closing database connection: {e}")
+        self._local = threading.local()
+
+    def _warm_student_cache(self):
         try:
             with self.get_connection() as conn:
                 cursor = conn.cursor()
-                cursor.execute("SELECT id FROM students WHERE name = ?", (name,))
-                result = cursor.fetchone()
-
-                if not result:
-                    cursor.execute("INSERT INTO students (name) VALUES (?)", (name,))
-                    student_id = cursor.lastrowid
-                else:
-                    student_id = result[0]
-
-                return student_id
+                cursor.execute("SELECT name, id FROM students")
+                self._student_ids = dict(cursor.fetchall())
+            logging.info(f"Cached {len(self._student_ids)} student ids")
         except sqlite3.Error as e:
-            logging.error(f"Error getting/creating student: {e}")
-            return None
+            logging.error(f"Error loading student ids: {e}")
+            self._student_ids = {}
 
-    def record_entry(self, name):
-        try:
-            student_id = self.get_or_create_student(name)
-            if student_id is None:
-                return None
+    def _get_or_create_student(self, cursor, name):
+        student_id = self._student_ids.get(name)
+        if student_id is not None:
+            return student_id
 
-            with self.get_connection() as conn:
-                cursor = conn.cursor()
+        cursor.execute("SELECT id FROM students WHERE name = ?", (name,))
+        result = cursor.fetchone()
 
-                current_datetime = datetime.now()
-                current_date = current_datetime.strftime('%Y-%m-%d')
-                current_time = current_datetime.time()
-
-                session_info = self.get_current_session_time()
-
-                if not session_info:
-                    logging.warning("No active session found")
-                    return None
-
-                late_minutes = self.calculate_late_minutes(current_time, session_info['start_time'])
-
-                if late_minutes > 0:
-                    attendance_status = 'late'
-                    attendance_score = 0.5
-                    logging.warning(f"  {name} is LATE by {late_minutes} minutes!")
-                    print(f"\n{'=' * 60}")
-                    print(f"LATE ARRIVAL ALERT")
-                    print(f"{'=' * 60}")
-                    print(f"Student: {name}")
-                    print(f"Scheduled: {session_info['start_time'].strftime('%H:%M')}")
-                    print(f"Arrived: {current_time.strftime('%H:%M:%S')}")
-                    print(f"Late by: {late_minutes} minutes")
-                    print(f"Score: 0.5/1.0")
-                    print(f"{'=' * 60}\n")
-                else:
-                    attendance_status = 'on_time'
-                    attendance_score = 1.0
-                    logging.info(f"✓ {name} arrived on time")
+        if not result:
+            cursor.execute("INSERT INTO students (name) VALUES (?)", (name,))
+            return cursor.lastrowid
+        return result[0]
 
-                cursor.execute("""
-                    INSERT INTO attendance_sessions 
-                    (student_id, session_date, entry_time, status, attendance_status, late_minutes)
-                    VALUES (?, ?, ?, 'present', ?, ?)
-                """, (student_id, current_date, current_datetime.strftime('%Y-%m-%d %H:%M:%S'), attendance_status, late_minutes))
+    def get_or_create_student(self, name):
+        student_id = self._student_ids.get(name)
+        if student_id is not None:
+            return student_id
 
-                session_id = cursor.lastrowid
+        try:
+            with self.get_connection() as conn:
+                student_id = self._get_or_create_student(conn.cursor(), name)
+            self._student_ids[name] = student_id
+            return student_id
+        except sqlite3.Error as e:
+            logging.error(f"Error getting/creating student: {e}")
+            return None
 
-                cursor.execute("""
-                    INSERT INTO daily_attendance 
-                    (student_id, attendance_date, total_sessions, first_entry, current_status, 
-                     attendance_status, late_minutes, attendance_score)
-                    VALUES (?, ?, 1, ?, 'present', ?, ?, ?)
-                    ON CONFLICT(student_id, attendance_date) DO UPDATE SET
-                        total_sessions = total_sessions + 1,
-                        current_status = 'present',
-                        first_entry = MIN(first_entry, excluded.first_entry),
-                        attendance_status = CASE WHEN attendance_status = 'on_time' THEN attendance_status ELSE excluded.attendance_status END,
-                        late_minutes = late_minutes + excluded.late_minutes,
-                        attendance_score = attendance_score + excluded.attendance_score
-                """, (student_id, current_date, current_datetime.strftime('%Y-%m-%d %H:%M:%S'), attendance_status, late_minutes, attendance_score))
+    def get_or_create_students(self, names, chunk_size=500):
+        """Resolve many names to student ids, inserting missing students in bulk."""
+        missing = list(dict.fromkeys(name for name in names if name not in self._student_ids))
+
+        if missing:
+            try:
+                with self.get_connection() as conn:
+                    cursor = conn.cursor()
+                    resolved = {}
+                    # Stay under SQLite's bound parameter limit
+                    for i in range(0, len(missing), chunk_size):
+                        chunk = missing[i:i + chunk_size]
+                        placeholders = ", ".join("?" * len(chunk))
+                        cursor.execute(
+                            f"INSERT OR IGNORE INTO students (name) VALUES {', '.join(['(?)'] * len(chunk))}",
+                            chunk)
+                        cursor.execute(f"SELECT name, id FROM students WHERE name IN ({placeholders})", chunk)
+                        resolved.update(cursor.fetchall())
+                self._student_ids.update(resolved)
+            except sqlite3.Error as e:
+                logging.error(f"Error getting/creating students: {e}")
+
+        return {name: self._student_ids[name] for name in names if name in self._student_ids}
+
+    def _record_entry(self, cursor, name, current_datetime):
+        student_id = self._get_or_create_student(cursor, name)
+
+        current_date = current_datetime.strftime('%Y-%m-%d')
+        current_time = current_datetime.time()
+
+        session_info = self.get_current_session_time(at=current_time)
+
+        if not session_info:
+            logging.warning("No active session found")
+            return None
 
-                logging.info(f"Entry recorded for {name} at {current_datetime.strftime('%H:%M:%S')}")
-                return session_id
+        late_minutes = self.calculate_late_minutes(current_time, session_info['start_time'])
+
+        if late_minutes > 0:
+            attendance_status = 'late'
+            attendance_score = 0.5
+            logging.warning(f"  {name} is LATE by {late_minutes} minutes!")
+            print(f"\n{'=' * 60}")
+            print(f"LATE ARRIVAL ALERT")
+            print(f"{'=' * 60}")
+            print(f"Student: {name}")
+            print(f"Scheduled: {session_info['start_time'].strftime('%H:%M')}")
+            print(f"Arrived: {current_time.strftime('%H:%M:%S')}")
+            print(f"Late by: {late_minutes} minutes")
+            print(f"Score: 0.5/1.0")
+            print(f"{'=' * 60}\n")
+        else:
+            attendance_status = 'on_time'
+            attendance_score = 1.0
+            logging.info(f"✓ {name} arrived on time")
+
+        entry_time = current_datetime.strftime('%Y-%m-%d %H:%M:%S')
+        session_number = session_info['session_number']
+
+        cursor.execute("""
+            INSERT INTO attendance_sessions 
+            (student_id, session_date, entry_time, status, attendance_status, late_minutes, session_number)
+            VALUES (?, ?, ?, 'present', ?, ?, ?)
+        """, (student_id, current_date, entry_time, attendance_status, late_minutes, session_number))
+
+        session_id = cursor.lastrowid
+
+        # The first arrival in a session decides its status; re-entries only extend it
+        cursor.execute("""
+            INSERT INTO session_attendance
+            (student_id, attendance_date, session_number, attendance_status, late_minutes,
+             attendance_score, first_entry)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT(student_id, attendance_date, session_number) DO UPDATE SET
+                attendance_status = CASE WHEN attendance_status = 'absent' THEN excluded.attendance_status ELSE attendance_status END,
+                late_minutes = CASE WHEN attendance_status = 'absent' THEN excluded.late_minutes ELSE late_minutes END,
+                attendance_score = CASE WHEN attendance_status = 'absent' THEN excluded.attendance_score ELSE attendance_score END,
+                first_entry = COALESCE(first_entry, excluded.first_entry)
+        """, (student_id, current_date, session_number, attendance_status, late_minutes, attendance_score,
+              entry_time))
+
+        # Roll the day's sessions up into daily_attendance (at most one row per scheduled session)
+        cursor.execute("""
+            SELECT COALESCE(SUM(late_minutes), 0), COALESCE(SUM(attendance_score), 0)
+            FROM session_attendance
+            WHERE student_id = ? AND attendance_date = ?
+        """, (student_id, current_date))
+        day_late_minutes, day_score = cursor.fetchone()
+
+        cursor.execute("""
+            INSERT INTO daily_attendance 
+            (student_id, attendance_date, total_sessions, first_entry, current_status, 
+             attendance_status, late_minutes, attendance_score)
+            VALUES (?, ?, 1, ?, 'present', ?, ?, ?)
+            ON CONFLICT(student_id, attendance_date) DO UPDATE SET
+                total_sessions = total_sessions + 1,
+                current_status = 'present',
+                first_entry = MIN(COALESCE(first_entry, excluded.first_entry), excluded.first_entry),
+                attendance_status = CASE WHEN attendance_status = 'on_time' THEN attendance_status ELSE excluded.attendance_status END,
+                late_minutes = excluded.late_minutes,
+                attendance_score = excluded.attendance_score
+        """, (student_id, current_date, entry_time, attendance_status, day_late_minutes, day_score))
+
+        logging.info(f"Entry recorded for {name} at {current_datetime.strftime('%H:%M:%S')}")
+        return session_id
+
+    def record_entry(self, name, timestamp=None):
+        try:
+            with self.get_connection() as conn:
+                return self._record_entry(conn.cursor(), name, timestamp or datetime.now())
 
         except sqlite3.Error as e:
             logging.error(f"Error recording entry: {e}")
             return None
 
-    def record_exit(self, name):
-        try:
-            student_id = self.get_or_create_student(name)
-            if student_id is None:
-                return False
+    def _record_exit(self, cursor, name, current_datetime):
+        student_id = self._get_or_create_student(cursor, name)
+
+        current_date = current_datetime.strftime('%Y-%m-%d')
+
+        cursor.execute("""
+            SELECT id, entry_time, session_number FROM attendance_sessions
+            WHERE student_id = ? 
+            AND session_date = ? 
+            AND status = 'present'
+            ORDER BY entry_time DESC
+            LIMIT 1
+        """, (student_id, current_date))
+
+        result = cursor.fetchone()
+
+        if result:
+            session_id, entry_time_str, session_number = result
+            entry_time = datetime.strptime(entry_time_str, '%Y-%m-%d %H:%M:%S')
+            duration = int((current_datetime - entry_time).total_seconds() / 60)
+
+            cursor.execute("""
+                UPDATE attendance_sessions
+                SET exit_time = ?, duration_minutes = ?, status = 'left'
+                WHERE id = ?
+            """, (current_datetime.strftime('%Y-%m-%d %H:%M:%S'), duration, session_id))
+
+            cursor.execute("""
+                UPDATE daily_attendance
+                SET total_minutes = total_minutes + ?,
+                    last_exit = ?,
+                    current_status = 'absent'
+                WHERE student_id = ? AND attendance_date = ?
+            """, (duration, current_datetime.strftime('%Y-%m-%d %H:%M:%S'), student_id, current_date))
+
+            cursor.execute("""
+                UPDATE session_attendance
+                SET total_minutes = total_minutes + ?,
+                    last_exit = ?
+                WHERE student_id = ? AND attendance_date = ? AND session_number = ?
+            """, (duration, current_datetime.strftime('%Y-%m-%d %H:%M:%S'), student_id, current_date,
+                  session_number))
+
+            logging.info(
+                f" Exit recorded for {name} at {current_datetime.strftime('%H:%M:%S')} (Duration: {duration} min)")
+            return True
+        else:
+            logging.warning(f"No open session found for {name}")
+            return False
 
+    def record_exit(self, name, timestamp=None):
+        try:
             with self.get_connection() as conn:
-                cursor = conn.cursor()
+                return self._record_exit(conn.cursor(), name, timestamp or datetime.now())
 
-                current_datetime = datetime.now()
-                current_date = current_datetime.strftime('%Y-%m-%d')
-
-                cursor.execute("""
-                    SELECT id, entry_time FROM attendance_sessions
-                    WHERE student_id = ? 
-                    AND session_date = ? 
-                    AND status = 'present'
-                    ORDER BY entry_time DESC
-                    LIMIT 1
-                """, (student_id, current_date))
+        except sqlite3.Error as e:
+            logging.error(f"Error recording exit: {e}")
+            return False
 
+    def get_journal_seq(self):
+        """Sequence number of the last journaled event applied by apply_events."""
+        try:
+            with self.get_connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute("SELECT last_seq FROM event_journal_state WHERE id = 1")
                 result = cursor.fetchone()
+                return result[0] if result else 0
+        except sqlite3.Error as e:
+            logging.error(f"Error reading journal state: {e}")
+            return 0
 
-                if result:
-                    session_id, entry_time_str = result
-                    entry_time = datetime.strptime(entry_time_str, '%Y-%m-%d %H:%M:%S')
-                    duration = int((current_datetime - entry_time).total_seconds() / 60)
+    def apply_events(self, events):
+        """Apply queued attendance events in order inside a single transaction.
 
-                    cursor.execute("""
-                        UPDATE attendance_sessions
-                        SET exit_time = ?, duration_minutes = ?, status = 'left'
-                        WHERE id = ?
-                    """, (current_datetime.strftime('%Y-%m-%d %H:%M:%S'), duration, session_id))
+        Each event is a dict with ``kind`` ('entry', 'exit' or 'absent'), ``name``, ``ts``
+        (unix time) and optionally ``seq``, the journal sequence number.
+        """
+        if not events:
+            return True
+
+        handlers = {'entry': self._record_entry, 'exit': self._record_exit, 'absent': self._mark_absent_students}
+        # Resolve ids up front so the cache only ever sees committed students
+        self.get_or_create_students([event['name'] for event in events if event['name'] is not None])
+        try:
+            with self.get_connection() as conn:
+                if not conn.in_transaction:
+                    conn.execute("BEGIN IMMEDIATE")
+                cursor = conn.cursor()
+                last_seq = None
+                for event in events:
+                    handler = handlers.get(event['kind'])
+                    if handler is None:
+                        logging.warning(f"Skipping unknown attendance event: {event['kind']}")
+                    else:
+                        handler(cursor, event['name'], datetime.fromtimestamp(event['ts']))
+                    last_seq = event.get('seq', last_seq)
 
+                if last_seq is not None:
                     cursor.execute("""
-                        UPDATE daily_attendance
-                        SET total_minutes = total_minutes + ?,
-                            last_exit = ?,
-                            current_status = 'absent'
-                        WHERE student_id = ? AND attendance_date = ?
-                    """, (duration, current_datetime.strftime('%Y-%m-%d %H:%M:%S'), student_id, current_date))
-
-                    logging.info(
-                        f" Exit recorded for {name} at {current_datetime.strftime('%H:%M:%S')} (Duration: {duration} min)")
-                    return True
-                else:
-                    logging.warning(f"No open session found for {name}")
-                    return False
+                        INSERT INTO event_journal_state (id, last_seq) VALUES (1, ?)
+                        ON CONFLICT(id) DO UPDATE SET last_seq = MAX(last_seq, excluded.last_seq)
+                    """, (last_seq,))
+            return True
 
         except sqlite3.Error as e:
-            logging.error(f"Error recording exit: {e}")
+            logging.error(f"Error applying {len(events)} attendance events: {e}")
             return False
 
     def get_current_status(self, name):
@@ -434,6 +894,75 @@ class AttendanceDatabase:
             logging.error(f"Error marking absent: {e}")
             return False
 
+    def _mark_absent_students(self, cursor, name, current_datetime):
+        """Mark every student with no attendance row for the current session absent, as set-based inserts."""
+        current_date = current_datetime.strftime('%Y-%m-%d')
+        session_info = self.get_current_session_time(at=current_datetime)
+        session_number = session_info['session_number'] if session_info else 0
+
+        cursor.execute("""
+            SELECT s.name
+            FROM students s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM session_attendance sa
+                WHERE sa.attendance_date = ? AND sa.session_number = ? AND sa.student_id = s.id
+            )
+            ORDER BY s.name
+        """, (current_date, session_number))
+        absent_students = [row[0] for row in cursor.fetchall()]
+
+        if not absent_students:
+            return absent_students
+
+        cursor.execute("""
+            INSERT INTO session_attendance
+            (student_id, attendance_date, session_number, attendance_status, attendance_score)
+            SELECT s.id, ?, ?, 'absent', 0
+            FROM students s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM session_attendance sa
+                WHERE sa.attendance_date = ? AND sa.session_number = ? AND sa.student_id = s.id
+            )
+        """, (current_date, session_number, current_date, session_number))
+
+        cursor.execute("""
+            INSERT INTO daily_attendance
+            (student_id, attendance_date, attendance_status, attendance_score, current_status)
+            SELECT s.id, ?, 'absent', 0, 'absent'
+            FROM students s
+            WHERE NOT EXISTS (
+                SELECT 1 FROM daily_attendance da
+                WHERE da.student_id = s.id AND da.attendance_date = ?
+            )
+        """, (current_date, current_date))
+
+        print(f"\n{'=' * 70}")
+        print(f" ABSENT STUDENTS ALERT (5 minutes after session start)")
+        print(f"{'=' * 70}")
+        if session_info:
+            print(
+                f"Session {session_info['session_number']} - Started at: {session_info['start_time'].strftime('%H:%M')}")
+        print(f"Current time: {current_datetime.strftime('%H:%M:%S')}")
+        print(f"\nAbsent students ({len(absent_students)}):")
+        for i, student in enumerate(absent_students, 1):
+            print(f"  {i}. {student}")
+        print(f"{'=' * 70}\n")
+        logging.warning(f"{len(absent_students)} students marked as absent")
+
+        return absent_students
+
+    def mark_absent_students(self, timestamp=None):
+        """Mark all enrolled students not yet seen this session as absent in one transaction."""
+        try:
+            with self.get_connection() as conn:
+                if not conn.in_transaction:
+                    conn.execute("BEGIN IMMEDIATE")
+                return self._mark_absent_students(conn.cursor(), None, timestamp or datetime.now())
+
+        except sqlite3.Error as e:
+            logging.error(f"Error marking absent students: {e}")
+            return []
+
     def calculate_attendance_score(self, name, total_sessions_in_semester):
         try:
             student_id = self.get_or_create_student(name)
@@ -444,8 +973,8 @@ class AttendanceDatabase:
                 cursor = conn.cursor()
 
                 cursor.execute("""
-                    SELECT SUM(attendance_score) as total_score
-                    FROM daily_attendance
+                    SELECT total_score
+                    FROM student_semester_summary
                     WHERE student_id = ?
                 """, (student_id,))
 
@@ -484,6 +1013,8 @@ class AttendanceDatabase:
                 
                 logging.info("All tables dropped successfully")
                 self._init_database()
+                self._load_schedule()
+                self._student_ids = {}
                 logging.info("Database reinitialized")
 
                 return True
@@ -509,14 +1040,13 @@ class AttendanceDatabase:
                 cursor.execute("""
                     SELECT 
                         s.name,
-                        COUNT(DISTINCT da.attendance_date) as days_attended,
-                        SUM(da.attendance_score) as total_score,
-                        SUM(CASE WHEN da.attendance_status = 'late' THEN 1 ELSE 0 END) as late_count,
-                        SUM(CASE WHEN da.attendance_status = 'absent' THEN 1 ELSE 0 END) as absent_count,
-                        SUM(da.late_minutes) as total_late_minutes
+                        COALESCE(ss.days_attended, 0) as days_attended,
+                        COALESCE(ss.total_score, 0) as total_score,
+                        COALESCE(ss.late_count, 0) as late_count,
+                        COALESCE(ss.absent_count, 0) as absent_count,
+                        COALESCE(ss.total_late_minutes, 0) as total_late_minutes
                     FROM students s
-                    LEFT JOIN daily_attendance da ON s.id = da.student_id
-                    GROUP BY s.id, s.name
+                    LEFT JOIN student_semester_summary ss ON s.id = ss.student_id
                     ORDER BY total_score DESC, s.name
                 """)
 
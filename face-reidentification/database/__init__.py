@@ -1,2 +1,5 @@
 from .face_db import FaceDatabase
 from .Attendance_Database import AttendanceDatabase
+from .attendance_writer import AttendanceWriter
+from .attendance_export import AttendanceExporter, EXPORT_FORMATS
+from .unregistered_store import UnregisteredFaceStore
@@ -0,0 +1,162 @@
+import csv
+import io
+import json
+import logging
+import sqlite3
+
+EXPORT_COLUMNS = (
+    "attendance_date",
+    "session_number",
+    "student",
+    "attendance_status",
+    "late_minutes",
+    "attendance_score",
+    "first_entry",
+    "last_exit",
+    "total_minutes",
+)
+
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "jsonl": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands back whatever was written since the last drain."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class AttendanceExporter:
+    """Streams session_attendance rows out of AttendanceDatabase.
+
+    Rows are pulled with ``fetchmany`` from a dedicated read-only connection and
+    encoded one chunk at a time, so memory stays flat however large the range is.
+    """
+
+    def __init__(self, attendance_db, chunk_size=1000):
+        self.attendance_db = attendance_db
+        self.chunk_size = chunk_size
+
+    def iter_chunks(self, start_date=None, end_date=None, student=None, session_number=None):
+        """Yield lists of row tuples ordered by date, session and student id."""
+        conditions, params = [], []
+        if start_date:
+            conditions.append("sa.attendance_date >= ?")
+            params.append(start_date)
+        if end_date:
+            conditions.append("sa.attendance_date <= ?")
+            params.append(end_date)
+        if session_number is not None:
+            conditions.append("sa.session_number = ?")
+            params.append(session_number)
+        if student:
+            conditions.append("s.name = ?")
+            params.append(student)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        # Ordering follows idx_session_attendance_date_session so SQLite never sorts
+        query = f"""
+            SELECT sa.attendance_date, sa.session_number, s.name, sa.attendance_status,
+                   sa.late_minutes, sa.attendance_score, sa.first_entry, sa.last_exit,
+                   sa.total_minutes
+            FROM session_attendance sa
+            JOIN students s ON s.id = sa.student_id
+            {where}
+            ORDER BY sa.attendance_date, sa.session_number, sa.student_id
+        """
+
+        conn = self.attendance_db.open_read_connection()
+        try:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(self.chunk_size)
+                if not rows:
+                    break
+                yield rows
+        except sqlite3.Error as e:
+            logging.error(f"Error exporting attendance: {e}")
+            raise
+        finally:
+            conn.close()
+
+    def iter_csv(self, **filters):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(EXPORT_COLUMNS)
+        for rows in self.iter_chunks(**filters):
+            writer.writerows(rows)
+            yield buffer.getvalue().encode("utf-8")
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+
+    def iter_jsonl(self, **filters):
+        for rows in self.iter_chunks(**filters):
+            yield "".join(
+                json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) + "\n" for row in rows
+            ).encode("utf-8")
+
+    def iter_parquet(self, **filters):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise RuntimeError("Parquet export requires the 'pyarrow' package") from e
+
+        schema = pa.schema([
+            ("attendance_date", pa.string()),
+            ("session_number", pa.int64()),
+            ("student", pa.string()),
+            ("attendance_status", pa.string()),
+            ("late_minutes", pa.int64()),
+            ("attendance_score", pa.float64()),
+            ("first_entry", pa.string()),
+            ("last_exit", pa.string()),
+            ("total_minutes", pa.int64()),
+        ])
+
+        # One row group per fetched chunk, flushed to the client as soon as it is encoded
+        sink = _ChunkSink()
+        writer = pq.ParquetWriter(sink, schema)
+        try:
+            for rows in self.iter_chunks(**filters):
+                columns = list(zip(*rows))
+                writer.write_table(pa.Table.from_arrays(
+                    [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+                    schema=schema))
+                data = sink.drain()
+                if data:
+                    yield data
+        finally:
+            writer.close()
+        yield sink.drain()
+
+    def stream(self, export_format, **filters):
+        """Return a generator of encoded bytes for ``export_format`` ('csv', 'jsonl' or 'parquet')."""
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {export_format}")
+        return getattr(self, f"iter_{export_format}")(**filters)
@@ -0,0 +1,186 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+from utils.metrics import REGISTRY, timed
+
+
+class AttendanceWriter:
+    """Write-behind queue in front of AttendanceDatabase.
+
+    ``record_entry``/``record_exit`` only append the event to a journal file and
+    enqueue it, so the recognition thread never waits on SQLite. A dedicated
+    thread groups queued events into one transaction per ``batch_interval``.
+    The journal is replayed on startup for events that were never committed and
+    is truncated whenever everything written to it has been committed.
+
+    A batch the database refuses (locked, disk full) is retried, with a backoff
+    capped at ``max_backoff`` seconds, before anything newer is taken from the
+    queue. If it still fails ``max_retries`` times once the writer is closing, it
+    is left in the journal for the next start to replay.
+    """
+
+    def __init__(self, attendance_db, journal_path=None, batch_interval=0.5, max_batch=256,
+                 fsync=False, max_retries=3, max_backoff=2.0, clock=time.time):
+        self.attendance_db = attendance_db
+        self.clock = clock  # timestamps events; replays substitute the recorded time
+        self.journal_path = journal_path or os.path.splitext(attendance_db.db_path)[0] + ".journal"
+        self.batch_interval = batch_interval
+        self.max_batch = max_batch
+        self.fsync = fsync
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+
+        self._queue = queue.Queue()
+        REGISTRY.gauge("face_queue_depth", "Items waiting in a background queue", fn=self.qsize,
+                       queue="attendance_writer")
+        self._committed_metric = REGISTRY.counter("face_attendance_events_committed",
+                                                  "Attendance events written to SQLite")
+        self._dropped_metric = REGISTRY.counter("face_queue_dropped", "Items dropped from a background queue",
+                                                queue="attendance_writer")
+        self._journal_lock = threading.Lock()
+        self._stop = threading.Event()
+
+        self._seq = attendance_db.get_journal_seq()
+        self._committed_seq = self._seq
+        self._replay_journal()
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+
+        self._thread = threading.Thread(target=self._run, name="attendance-writer", daemon=True)
+        self._thread.start()
+
+    def record_entry(self, name):
+        self._submit("entry", name)
+        return None
+
+    def record_exit(self, name):
+        self._submit("exit", name)
+        return True
+
+    def mark_absent_students(self):
+        """Queue a set-based absence check for everyone not yet seen today."""
+        self._submit("absent", None)
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def _submit(self, kind, name, **fields):
+        with self._journal_lock:
+            if self._stop.is_set():
+                logging.warning(f"Attendance writer is closed, ignoring {kind} event for {name}")
+                return
+            self._seq += 1
+            event = {"seq": self._seq, "kind": kind, "name": name, "ts": self.clock(), **fields}
+            self._journal.write(json.dumps(event, ensure_ascii=False) + "\n")
+            self._journal.flush()
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+            self._queue.put(event)
+
+    @staticmethod
+    def _is_event(event):
+        return isinstance(event, dict) and isinstance(event.get("seq"), int) \
+            and isinstance(event.get("ts"), (int, float)) \
+            and event.get("kind") in ("entry", "exit", "absent") and "name" in event
+
+    def _replay_journal(self):
+        if not os.path.exists(self.journal_path):
+            return
+
+        pending = []
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    event = None
+                if not self._is_event(event):
+                    # A torn final line from a crash mid-write, or a line this writer never produces
+                    logging.warning("Skipping unreadable attendance journal line")
+                    continue
+                self._seq = max(self._seq, event["seq"])
+                if event["seq"] > self._committed_seq:
+                    pending.append(event)
+
+        if pending:
+            logging.info(f"Replaying {len(pending)} uncommitted attendance events")
+            if not self.attendance_db.apply_events(pending):
+                raise RuntimeError(f"Failed to replay attendance journal {self.journal_path}")
+            self._committed_seq = pending[-1]["seq"]
+
+        open(self.journal_path, "w").close()
+
+    def _next_batch(self):
+        try:
+            first = self._queue.get(timeout=self.batch_interval)
+        except queue.Empty:
+            return None if self._stop.is_set() else []
+
+        batch = [first]
+        deadline = time.monotonic() + self.batch_interval
+        while len(batch) < self.max_batch:
+            timeout = 0 if self._stop.is_set() else deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _commit(self, batch):
+        """Apply ``batch``; False when the writer is closing and the database still refuses it."""
+        try:
+            return self._apply(batch)
+        except Exception as e:
+            if len(batch) > 1:
+                # Not a database error (those are retried): find the event that fails and keep the rest
+                return all(self._commit([event]) for event in batch)
+            # It would fail again on every retry and replay, so it is the one event that is dropped
+            logging.error(f"Dropping attendance event {batch[0]} that could not be applied: {e}")
+            self._dropped_metric.inc()
+            self._committed_seq = batch[0]["seq"]
+            self._truncate_journal_if_committed()
+            return True
+
+    def _apply(self, batch):
+        attempt = 0
+        while True:
+            attempt += 1
+            with timed("db_write"):
+                committed = self.attendance_db.apply_events(batch)
+            if committed:
+                self._committed_seq = batch[-1]["seq"]
+                self._committed_metric.inc(len(batch))
+                self._truncate_journal_if_committed()
+                return True
+            if self._stop.is_set() and attempt >= self.max_retries:
+                return False
+            logging.warning(f"Attendance batch commit failed (attempt {attempt}), retrying")
+            time.sleep(min(self.batch_interval * attempt, self.max_backoff))
+
+    def _truncate_journal_if_committed(self):
+        with self._journal_lock:
+            if self._committed_seq == self._seq:
+                self._journal.seek(0)
+                self._journal.truncate()
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            if batch and not self._commit(batch):
+                # Committing anything newer would move the database's sequence past these events
+                logging.error(f"Closing with {self._seq - self._committed_seq} attendance events uncommitted; "
+                              f"they stay in {self.journal_path} and are replayed on the next start")
+                break
+
+    def close(self):
+        """Commit everything still queued and close the journal; later events are ignored."""
+        with self._journal_lock:
+            self._stop.set()
+        self._thread.join()
+        with self._journal_lock:
+            self._journal.close()
@@ -3,20 +3,71 @@ import faiss
 import numpy as np
 import json
 import logging
+import struct
 import threading
+import time
+import zlib
+from contextlib import contextmanager
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Tuple, List, Optional
 from queue import Queue
 
+from utils.metrics import timed
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+# Checkpoint file: header, then length-prefixed UTF-8 names, then the serialized FAISS index
+CHECKPOINT_MAGIC = b"FDBC"
+CHECKPOINT_VERSION = 1
+CHECKPOINT_HEADER = struct.Struct("<4sBQII")  # magic, version, seq, name count, index bytes
+NAME_LENGTH = struct.Struct("<H")
+
+# Delta log: a header naming the log's generation (new each time a checkpoint restarts it), then records
+DELTA_LOG_MAGIC = b"FDBL"
+DELTA_LOG_HEADER = struct.Struct("<4sQ")  # magic, generation
+
+# Delta log record: header, name, embedding (adds only), CRC32 of everything before it
+DELTA_HEADER = struct.Struct("<QBH")  # seq, op, name length
+DELTA_CRC = struct.Struct("<I")
+DELTA_ADD = ord("A")
+DELTA_DELETE = ord("D")
+
 
 class FaceDatabase:
-    def __init__(self, embedding_size: int = 512, db_path: str = "./database/face_database", max_workers: int = 4) -> None:
+    """FAISS index of face embeddings plus the name stored with each row.
+
+    Changes are appended to a delta log as they happen; a background thread
+    checkpoints the whole database (written to a temp file and renamed into place)
+    after ``checkpoint_every`` changes or ``checkpoint_interval`` seconds. Loading
+    reads the last checkpoint and replays the newer part of the delta log.
+
+    Several processes (main.py and the API) may share one database directory.
+    Appends and checkpoints take an advisory lock on ``deltas.lock``, and first
+    apply what other processes appended since (or reload their checkpoint if one
+    restarted the log). Sequence numbers therefore stay global, and a checkpoint
+    covers every record in the log it restarts.
+    """
+
+    def __init__(self, embedding_size: int = 512, db_path: str = "./database/face_database", max_workers: int = 4,
+                 checkpoint_every: int = 100, checkpoint_interval: float = 30.0, fsync: bool = False) -> None:
 
         self.embedding_size = embedding_size
         self.db_path = db_path
+        self.checkpoint_file = os.path.join(db_path, "checkpoint.bin")
+        self.delta_file = os.path.join(db_path, "deltas.log")
+        self.lock_file = os.path.join(db_path, "deltas.lock")
+        # Pre-checkpoint format, still read when no checkpoint exists
         self.index_file = os.path.join(db_path, "faiss_index.bin")
         self.meta_file = os.path.join(db_path, "metadata.json")
         self.max_workers = max_workers
+        self.checkpoint_every = checkpoint_every
+        self.checkpoint_interval = checkpoint_interval
+        self.fsync = fsync
         self._shutdown = False
 
         os.makedirs(db_path, exist_ok=True)
@@ -36,12 +87,36 @@ class FaceDatabase:
         # Stores associated names for each embedding
         self.metadata = []
 
+        # Delta log state: last assigned sequence number, the one covered by the checkpoint on disk,
+        # and when the oldest change not yet checkpointed was made
+        self._seq = 0
+        self._checkpoint_seq = 0
+        self._dirty_since = None
+        self._loaded = False
+        # The open log, its generation and how far into it this process has applied
+        self._delta_log = None
+        self._log_generation = None
+        self._log_offset = 0
+        # Held with the advisory lock on deltas.lock, which does not exclude threads of the same process
+        self._log_lock = threading.Lock()
+        self._lock_handle = None
+        self._checkpoint_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._checkpointer = threading.Thread(target=self._run_checkpointer, name="face-db-checkpoint", daemon=True)
+        self._checkpointer.start()
+
     def add_face(self, embedding: np.ndarray, name: str) -> None:
 
         # normalized_embedding = embedding / np.linalg.norm(embedding)
-        with self.lock:
-            self.index.add(np.array([embedding], dtype=np.float32))
-            self.metadata.append(name)
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(self.embedding_size)
+        with self._file_lock(), self.lock:
+            self._catch_up()
+            self._add(embedding, name)
+            self._log_delta(DELTA_ADD, name, embedding)
+
+    def _add(self, embedding: np.ndarray, name: str) -> None:
+        self.index.add(np.array([embedding], dtype=np.float32))
+        self.metadata.append(name)
 
     def search(self, embedding: np.ndarray, threshold: float = 0.4) -> Tuple[str, float]:
 
@@ -54,7 +129,7 @@ class FaceDatabase:
             return "Unknown", 0.0
 
         normalized_embedding = embedding / np.linalg.norm(embedding)
-        with self.lock:
+        with self.lock, timed("faiss_search"):
             similarities, indices = self.index.search(np.array([normalized_embedding], dtype=np.float32), 1)
 
         similarity = float(similarities[0][0])
@@ -66,18 +141,33 @@ class FaceDatabase:
 
     def batch_search(self, embeddings: List[np.ndarray], threshold: float = 0.4) -> List[Tuple[str, float]]:
 
-        if not embeddings:
+        if len(embeddings) == 0:
             return []
 
-        if len(embeddings) < 10:
-            with self.lock:
-                results = []
-                for embedding in embeddings:
-                    result = self._search_internal(embedding, threshold)
-                    results.append(result)
-                return results
-        else:
-            return self.batch_search_parallel(embeddings, threshold)
+        return self.search_batch(embeddings, threshold)
+
+    def search_batch(self, embeddings, threshold: float = 0.4) -> List[Tuple[str, float]]:
+        """Search a whole (N, embedding_size) batch with a single FAISS call."""
+        query = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        if len(query) == 0:
+            return []
+        query = np.ascontiguousarray(query / np.linalg.norm(query, axis=1, keepdims=True))
+
+        with self.lock:
+            if self.index.ntotal == 0:
+                return [("Unknown", 0.0)] * len(query)
+            with timed("faiss_search"):
+                similarities, indices = self.index.search(query, 1)
+            metadata = self.metadata
+
+        results = []
+        for similarity, idx in zip(similarities[:, 0], indices[:, 0]):
+            similarity = float(similarity)
+            if similarity > threshold and 0 <= idx < len(metadata):
+                results.append((metadata[idx], similarity))
+            else:
+                results.append(("Unknown", similarity))
+        return results
 
     def batch_search_parallel(self, embeddings: List[np.ndarray], threshold: float = 0.4) -> List[Tuple[str, float]]:
 
@@ -99,6 +189,14 @@ class FaceDatabase:
 
         return results
     def delete_face(self, name: str) -> int:
+        with self._file_lock(), self.lock:
+            self._catch_up()
+            num_deleted = self._delete(name)
+            if num_deleted:
+                self._log_delta(DELTA_DELETE, name)
+            return num_deleted
+
+    def _delete(self, name: str) -> int:
         with self.lock:
             if self.index.ntotal == 0:
                 return 0
@@ -125,37 +223,310 @@ class FaceDatabase:
             
             return num_deleted
 
-    def save(self) -> None:
+    def replace_all(self, embeddings, names: List[str]) -> None:
+        """Replace every face with ``embeddings``/``names`` (a rebuild from the images) and checkpoint it."""
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.embedding_size)
+        index = faiss.IndexFlatIP(self.embedding_size)
+        if len(embeddings):
+            index.add(embeddings)
 
-        with self.lock:
+        with self._checkpoint_lock, self._file_lock():
+            with self.lock:
+                # Only to learn the latest sequence number: whatever is on disk is being replaced
+                self._loaded = False
+                self._catch_up()
+                self.index, self.metadata = index, list(names)
+                self._seq += 1
             try:
-                faiss.write_index(self.index, self.index_file)
-                with open(self.meta_file, 'w', encoding='utf-8') as f:
-                    json.dump(self.metadata, f, ensure_ascii=False, indent=2)
-                logging.info(f"Face database saved with {self.index.ntotal} faces")
-            except Exception as e:
-                logging.error(f"Failed to save face database: {e}")
+                self._checkpoint()
+            except Exception:
+                # The checkpointer retries; until then the rebuild lives only in memory
+                with self.lock:
+                    self._dirty_since = time.monotonic()
+                    self._wake.set()
                 raise
 
-    def load(self) -> bool:
-        if os.path.exists(self.index_file) and os.path.exists(self.meta_file):
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive against other threads and, through an advisory lock on ``deltas.lock``, other processes."""
+        with self._log_lock:
+            if self._lock_handle is None:
+                self._lock_handle = open(self.lock_file, "a+b")
+            fd = self._lock_handle.fileno()
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            else:
+                self._lock_handle.seek(0)
+                while True:
+                    try:
+                        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                        break
+                    except OSError:
+                        # LK_LOCK gives up after ten seconds
+                        continue
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+                else:
+                    self._lock_handle.seek(0)
+                    msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+    def _catch_up(self) -> int:
+        """Apply what other processes wrote to the log since this one last read it.
+
+        Must be called with the file lock and ``self.lock`` held. Before load() (or
+        in replace_all) nothing is applied, only the sequence number is advanced
+        past everything on disk. Returns how many records were applied.
+        """
+        if self._delta_log is None:
+            if not os.path.exists(self.delta_file):
+                self._restart_log()
+                return 0
+            self._delta_log = open(self.delta_file, "r+b")
+
+        self._delta_log.seek(0)
+        header = self._delta_log.read(DELTA_LOG_HEADER.size)
+        if len(header) < DELTA_LOG_HEADER.size:
+            # Empty, or a crash while a checkpoint restarted it: no records to lose
+            self._restart_log()
+            return 0
+        magic, generation = DELTA_LOG_HEADER.unpack(header)
+        start = DELTA_LOG_HEADER.size
+        if magic != DELTA_LOG_MAGIC:
+            # Written before logs had a header; replaced by the next checkpoint
+            generation, start = 0, 0
+
+        if generation != self._log_generation:
+            if self._log_generation is not None and os.path.exists(self.checkpoint_file):
+                # Another process checkpointed and restarted the log. Its checkpoint includes
+                # everything this process logged, since it caught up before writing it
+                if self._loaded:
+                    self._read_checkpoint()
+                    self._dirty_since = None
+                else:
+                    self._checkpoint_seq = self._read_checkpoint_seq()
+                self._seq = max(self._seq, self._checkpoint_seq)
+            self._log_generation = generation
+            self._log_offset = start
+
+        return self._replay_deltas()
+
+    def _restart_log(self) -> None:
+        """Empty the log under a new generation. Must be called with the file lock held."""
+        if self._delta_log is None:
+            self._delta_log = open(self.delta_file, "r+b" if os.path.exists(self.delta_file) else "w+b")
+        generation = struct.unpack("<Q", os.urandom(8))[0]
+        self._delta_log.seek(0)
+        self._delta_log.truncate()
+        self._delta_log.write(DELTA_LOG_HEADER.pack(DELTA_LOG_MAGIC, generation))
+        self._delta_log.flush()
+        if self.fsync:
+            os.fsync(self._delta_log.fileno())
+        self._log_generation = generation
+        self._log_offset = DELTA_LOG_HEADER.size
+
+    def _log_delta(self, op: int, name: str, embedding: Optional[np.ndarray] = None) -> None:
+        """Append one change to the delta log. Must be called after ``_catch_up`` with both locks held."""
+        self._seq += 1
+        encoded = name.encode("utf-8")
+        record = DELTA_HEADER.pack(self._seq, op, len(encoded)) + encoded
+        if embedding is not None:
+            record += embedding.tobytes()
+        self._delta_log.seek(self._log_offset)
+        self._delta_log.write(record + DELTA_CRC.pack(zlib.crc32(record)))
+        self._delta_log.flush()
+        if self.fsync:
+            os.fsync(self._delta_log.fileno())
+        self._log_offset = self._delta_log.tell()
+
+        if self._dirty_since is None:
+            self._dirty_since = time.monotonic()
+            self._wake.set()
+        if self._seq - self._checkpoint_seq >= self.checkpoint_every:
+            self._wake.set()
+
+    def _replay_deltas(self) -> int:
+        """Apply delta log records past ``_log_offset`` that are newer than the checkpoint."""
+        vector_size = self.embedding_size * 4
+        applied = 0
+        f = self._delta_log
+        f.seek(self._log_offset)
+        while True:
+            valid_end = f.tell()
+            header = f.read(DELTA_HEADER.size)
+            if not header:
+                break
+
+            intact = len(header) == DELTA_HEADER.size
+            if intact:
+                seq, op, name_length = DELTA_HEADER.unpack(header)
+                body = f.read(name_length + (vector_size if op == DELTA_ADD else 0))
+                crc = f.read(DELTA_CRC.size)
+                intact = len(crc) == DELTA_CRC.size and DELTA_CRC.unpack(crc)[0] == zlib.crc32(header + body)
+            if not intact:
+                # A torn final record from a crash mid-write; cut it off so new records follow valid ones
+                logging.warning("Truncating an incomplete record from the face database delta log")
+                f.truncate(valid_end)
+                break
+
+            self._log_offset = f.tell()
+            self._seq = max(self._seq, seq)
+            if seq <= self._checkpoint_seq or not self._loaded:
+                continue
+
+            name = body[:name_length].decode("utf-8")
+            if op == DELTA_ADD:
+                self._add(np.frombuffer(body, dtype=np.float32, offset=name_length), name)
+            elif op == DELTA_DELETE:
+                self._delete(name)
+            applied += 1
+        return applied
+
+    def save(self) -> None:
+        """Checkpoint now: write the whole database to a temp file and rename it into place."""
+        with self._checkpoint_lock, self._file_lock():
             with self.lock:
-                try:
+                self._catch_up()
+            self._checkpoint()
+
+    def _checkpoint(self) -> None:
+        """Write the checkpoint and restart the log. Must be called with the file lock held.
+
+        Nothing can be logged meanwhile, by this process or another, so the new
+        checkpoint covers every record in the log it empties.
+        """
+        with self.lock:
+            seq = self._seq
+            names = list(self.metadata)
+            index_bytes = faiss.serialize_index(self.index)
+            ntotal = self.index.ntotal
+
+        try:
+            tmp_path = f"{self.checkpoint_file}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(CHECKPOINT_HEADER.pack(CHECKPOINT_MAGIC, CHECKPOINT_VERSION, seq, len(names),
+                                               len(index_bytes)))
+                for name in names:
+                    encoded = name.encode("utf-8")
+                    f.write(NAME_LENGTH.pack(len(encoded)))
+                    f.write(encoded)
+                f.write(index_bytes.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.checkpoint_file)
+            logging.info(f"Face database saved with {ntotal} faces")
+        except Exception as e:
+            logging.error(f"Failed to save face database: {e}")
+            raise
+
+        with self.lock:
+            self._checkpoint_seq = seq
+            self._restart_log()
+            self._dirty_since = None
+            self._loaded = True
+
+    def _read_checkpoint_seq(self) -> int:
+        with open(self.checkpoint_file, "rb") as f:
+            magic, version, seq, _, _ = CHECKPOINT_HEADER.unpack(f.read(CHECKPOINT_HEADER.size))
+        if magic != CHECKPOINT_MAGIC or version != CHECKPOINT_VERSION:
+            raise ValueError(f"Unrecognized face database checkpoint {self.checkpoint_file}")
+        return seq
+
+    def _read_checkpoint(self) -> None:
+        with open(self.checkpoint_file, "rb") as f:
+            data = f.read()
+
+        magic, version, seq, count, index_size = CHECKPOINT_HEADER.unpack_from(data, 0)
+        if magic != CHECKPOINT_MAGIC or version != CHECKPOINT_VERSION:
+            raise ValueError(f"Unrecognized face database checkpoint {self.checkpoint_file}")
+
+        offset = CHECKPOINT_HEADER.size
+        names = []
+        for _ in range(count):
+            (length,) = NAME_LENGTH.unpack_from(data, offset)
+            offset += NAME_LENGTH.size
+            names.append(data[offset:offset + length].decode("utf-8"))
+            offset += length
+
+        index = faiss.deserialize_index(np.frombuffer(data, dtype=np.uint8, count=index_size, offset=offset))
+        if index.ntotal != len(names):
+            raise ValueError(f"Checkpoint has {index.ntotal} embeddings but {len(names)} names")
+
+        self.index, self.metadata, self._checkpoint_seq = index, names, seq
+
+    def load(self) -> bool:
+        with self._file_lock(), self.lock:
+            try:
+                if os.path.exists(self.checkpoint_file):
+                    self._read_checkpoint()
+                    loaded = True
+                elif os.path.exists(self.index_file) and os.path.exists(self.meta_file):
                     self.index = faiss.read_index(self.index_file)
                     with open(self.meta_file, 'r', encoding='utf-8') as f:
                         self.metadata = json.load(f)
-                    logging.info(f"Loaded face database with {self.index.ntotal} faces")
-                    return True
-                except Exception as e:
-                    logging.error(f"Failed to load face database: {e}")
-                    return False
-        return False
+                    loaded = True
+                else:
+                    loaded = False
+
+                self._seq = self._checkpoint_seq
+                self._loaded = True
+                self._log_generation = None
+                replayed = self._catch_up()
+            except Exception as e:
+                logging.error(f"Failed to load face database: {e}")
+                self._loaded = False
+                return False
+
+            if replayed:
+                logging.info(f"Replayed {replayed} face database changes from the delta log")
+                self._dirty_since = time.monotonic()
+                self._wake.set()
+            if loaded or replayed:
+                logging.info(f"Loaded face database with {self.index.ntotal} faces")
+            return loaded or replayed > 0
+
+    def _run_checkpointer(self) -> None:
+        while not self._shutdown:
+            with self.lock:
+                dirty_since = self._dirty_since
+                pending = self._seq - self._checkpoint_seq
+
+            if dirty_since is None:
+                timeout = None
+            elif pending >= self.checkpoint_every:
+                timeout = 0
+            else:
+                timeout = max(0.0, dirty_since + self.checkpoint_interval - time.monotonic())
+
+            if timeout is None or timeout > 0:
+                self._wake.wait(timeout)
+                self._wake.clear()
+                continue
+
+            try:
+                self.save()
+            except Exception:
+                # Changes stay in the delta log; retry after another interval
+                with self.lock:
+                    self._dirty_since = time.monotonic()
 
     def _cleanup(self):
         if not self._shutdown:
             self._shutdown = True
             if hasattr(self, 'executor'):
                 self.executor.shutdown(wait=True)
+            if hasattr(self, '_checkpointer'):
+                self._wake.set()
+                if self._checkpointer is not threading.current_thread():
+                    self._checkpointer.join()
+                if self._dirty_since is not None:
+                    self.save()
+                for handle in (self._delta_log, self._lock_handle):
+                    if handle is not None:
+                        handle.close()
+                self._delta_log = self._lock_handle = None
 
     def close(self):
 
@@ -0,0 +1,283 @@
+import json
+import logging
+import os
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+class UnregisteredFaceStore:
+    """Embeddings of faces captured by /register_face that are waiting for a student id.
+
+    The embeddings are persisted next to the captured images as a raw float32 row
+    file plus an append-only log of which face id occupies which row. A change
+    writes one row in place and appends one log line, so persisting is O(1) however
+    many faces are pending. Once the log is several times longer than the live rows
+    it is compacted: the snapshot goes to a new row file, and the log (replaced
+    atomically) names the row file it describes. Loading memory-maps the row file,
+    so startup no longer re-runs detection and recognition on every pending image.
+
+    In memory the rows live in one contiguous, geometrically grown matrix with an
+    id -> row map. Removal swaps the last row into the freed slot, and duplicate
+    checks are a single matrix-vector product over the live rows.
+
+    ``lock`` serializes writers and is held across disk writes. Reads (``in``,
+    indexing, ``find_duplicate``) only take a short in-memory lock, so they never
+    wait on an fsync and are safe to call from the event loop.
+    """
+
+    def __init__(self, path: str, embedding_size: int = 512, fsync: bool = True, compact_factor: int = 4) -> None:
+        self.path = path
+        self.embedding_size = embedding_size
+        self.fsync = fsync
+        self.compact_factor = compact_factor
+        self.rows_file = os.path.join(path, "embeddings-0.f32")
+        self.log_file = os.path.join(path, "face_ids.log")
+        self.lock = threading.RLock()
+        self._state_lock = threading.Lock()
+
+        # Rows [0, len(self._ids)) are live; the matrix may be a read-only memory map until the first change
+        self._matrix = np.empty((0, embedding_size), dtype=np.float32)
+        self._ids = []
+        self._rows = {}
+        self._row_bytes = embedding_size * np.dtype(np.float32).itemsize
+        self._log_records = 0
+        self._rows_handle = None
+        self._log_handle = None
+
+        os.makedirs(path, exist_ok=True)
+
+    def __contains__(self, face_id: str) -> bool:
+        return face_id in self._rows
+
+    def __getitem__(self, face_id: str) -> np.ndarray:
+        with self._state_lock:
+            return np.array(self._matrix[self._rows[face_id]])
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def face_ids(self) -> List[str]:
+        with self._state_lock:
+            return list(self._ids)
+
+    def find_duplicate(self, embedding: np.ndarray, threshold: float) -> Optional[Tuple[str, float]]:
+        """Return (face_id, similarity) of the most similar pending face above ``threshold``, if any."""
+        with self._state_lock:
+            if not self._ids:
+                return None
+            similarities = self._matrix[:len(self._ids)] @ np.asarray(embedding, dtype=np.float32).reshape(-1)
+            row = int(np.argmax(similarities))
+            if similarities[row] > threshold:
+                return self._ids[row], float(similarities[row])
+        return None
+
+    def add(self, face_id: str, embedding: np.ndarray, persist: bool = True) -> None:
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(self.embedding_size)
+        with self.lock:
+            with self._state_lock:
+                row = self._rows.get(face_id)
+                if row is None:
+                    row = len(self._ids)
+                    self._reserve(row + 1)
+                    self._ids.append(face_id)
+                    self._rows[face_id] = row
+                else:
+                    self._reserve(len(self._ids))
+                self._matrix[row] = embedding
+                count = len(self._ids)
+            if persist:
+                self._write_row(row, embedding)
+                self._append_log({"row": row, "id": face_id, "count": count})
+
+    def remove(self, face_id: str, persist: bool = True) -> bool:
+        with self.lock:
+            with self._state_lock:
+                row = self._rows.pop(face_id, None)
+                if row is None:
+                    return False
+
+                last = len(self._ids) - 1
+                moved = None
+                if row != last:
+                    self._reserve(len(self._ids))
+                    self._matrix[row] = self._matrix[last]
+                    moved = self._ids[last]
+                    self._ids[row] = moved
+                    self._rows[moved] = row
+                    embedding = np.array(self._matrix[row])
+                self._ids.pop()
+
+            if persist:
+                if moved is None:
+                    self._append_log({"count": last})
+                else:
+                    # Row first: until the log line lands, the log still says the row holds the removed
+                    # face, whose image is already gone, so sync() drops it on the next start
+                    self._write_row(row, embedding)
+                    self._append_log({"row": row, "id": moved, "count": last})
+            return True
+
+    def pop(self, face_id: str) -> Optional[np.ndarray]:
+        """Remove ``face_id`` and return its embedding, or None when it is not (or no longer) pending."""
+        with self.lock:
+            with self._state_lock:
+                row = self._rows.get(face_id)
+                if row is None:
+                    return None
+                embedding = np.array(self._matrix[row])
+            self.remove(face_id)
+            return embedding
+
+    def add_if_unique(self, face_id: str, embedding: np.ndarray, threshold: float) -> Optional[Tuple[str, float]]:
+        """Add ``face_id`` unless a pending face is more similar than ``threshold``; returns that duplicate."""
+        with self.lock:
+            duplicate = self.find_duplicate(embedding, threshold)
+            if duplicate is None:
+                self.add(face_id, embedding)
+            return duplicate
+
+    def _reserve(self, count: int) -> None:
+        """Make the matrix writable with room for ``count`` rows."""
+        if count <= len(self._matrix) and self._matrix.flags.writeable:
+            return
+        capacity = max(count, 2 * len(self._matrix), 64)
+        matrix = np.empty((capacity, self.embedding_size), dtype=np.float32)
+        matrix[:len(self._ids)] = self._matrix[:len(self._ids)]
+        self._matrix = matrix
+
+    def _write_row(self, row: int, embedding: np.ndarray) -> None:
+        if self._rows_handle is None:
+            self._rows_handle = open(self.rows_file, "r+b" if os.path.exists(self.rows_file) else "w+b")
+        self._rows_handle.seek(row * self._row_bytes)
+        self._rows_handle.write(embedding.tobytes())
+        self._rows_handle.flush()
+        if self.fsync:
+            os.fsync(self._rows_handle.fileno())
+
+    def _append_log(self, record: dict) -> None:
+        if self._log_handle is None:
+            self._log_handle = open(self.log_file, "ab")
+        self._log_handle.write((json.dumps(record) + "\n").encode("utf-8"))
+        self._log_handle.flush()
+        if self.fsync:
+            os.fsync(self._log_handle.fileno())
+        self._log_records += 1
+        if self._log_records > self.compact_factor * max(len(self._ids), 16):
+            self.save()
+
+    def _close_handles(self) -> None:
+        for handle in (self._rows_handle, self._log_handle):
+            if handle is not None:
+                handle.close()
+        self._rows_handle = self._log_handle = None
+
+    def close(self) -> None:
+        with self.lock:
+            self._close_handles()
+
+    def load(self) -> bool:
+        """Map the persisted rows and replay the id log. Returns False when there is nothing (valid) to load."""
+        if not os.path.exists(self.log_file):
+            return False
+
+        face_ids = []
+        records = 0
+        torn = False
+        rows_file = self.rows_file
+        try:
+            with open(self.log_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # A torn final line from a crash mid-append; the change it described is lost
+                        logging.warning("Skipping unreadable unregistered embeddings log line")
+                        torn = True
+                        continue
+                    if "rows_file" in record:
+                        rows_file = os.path.join(self.path, record["rows_file"])
+                    if "row" in record:
+                        face_ids.extend([None] * (record["row"] + 1 - len(face_ids)))
+                        face_ids[record["row"]] = record["id"]
+                    if "count" in record:
+                        del face_ids[record["count"]:]
+                    records += 1
+            rows = os.path.getsize(rows_file) // self._row_bytes if os.path.exists(rows_file) else 0
+            matrix = np.memmap(rows_file, dtype=np.float32, mode="r",
+                               shape=(rows, self.embedding_size)) if rows else None
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logging.warning(f"Could not load unregistered embeddings: {e}")
+            return False
+
+        if None in face_ids or len(set(face_ids)) != len(face_ids) or rows < len(face_ids):
+            logging.warning(f"Unregistered embeddings log ({len(face_ids)} face ids) does not match "
+                            f"{rows} stored rows, ignoring them")
+            return False
+
+        with self.lock:
+            self._close_handles()
+            self.rows_file = rows_file
+            with self._state_lock:
+                self._matrix = matrix if matrix is not None else np.empty((0, self.embedding_size), np.float32)
+                self._ids = face_ids
+                self._rows = {face_id: row for row, face_id in enumerate(face_ids)}
+            self._log_records = records
+            if torn:
+                # Appending after a partial line would corrupt the next record too
+                self.save()
+            self._remove_stale_rows_files()
+        return True
+
+    def save(self) -> None:
+        """Write a compact snapshot: exactly the live rows, and a log with one line per face."""
+        with self.lock:
+            with self._state_lock:
+                face_ids = list(self._ids)
+                matrix = np.array(self._matrix[:len(face_ids)])
+
+            self._close_handles()
+            # New rows go to a new file and only the log rename switches to it, so a crash at any
+            # point leaves a log next to the row file it describes
+            generation = int(os.path.basename(self.rows_file)[len("embeddings-"):-len(".f32")]) + 1
+            rows_file = os.path.join(self.path, f"embeddings-{generation}.f32")
+            self._replace(rows_file, lambda f: f.write(matrix.tobytes()))
+            lines = json.dumps({"rows_file": os.path.basename(rows_file)}) + "\n"
+            lines += "".join(json.dumps({"row": row, "id": face_id}) + "\n" for row, face_id in enumerate(face_ids))
+            lines += json.dumps({"count": len(face_ids)}) + "\n"
+            self._replace(self.log_file, lambda f: f.write(lines.encode("utf-8")))
+            self.rows_file = rows_file
+            self._log_records = len(face_ids) + 2
+            self._remove_stale_rows_files()
+
+    def _remove_stale_rows_files(self) -> None:
+        """Delete row files of earlier generations (and of snapshots a crash left unused)."""
+        for name in os.listdir(self.path):
+            path = os.path.join(self.path, name)
+            if name.startswith("embeddings-") and name.endswith(".f32") and path != self.rows_file:
+                try:
+                    os.remove(path)
+                except OSError:
+                    # Still memory-mapped on platforms that refuse to delete mapped files; retried next time
+                    pass
+
+    def sync(self, face_ids: Iterable[str]) -> List[str]:
+        """Drop embeddings whose image is gone; return the ids that still need an embedding."""
+        face_ids = set(face_ids)
+        with self.lock:
+            stale = [face_id for face_id in self.face_ids() if face_id not in face_ids]
+            for face_id in stale:
+                self.remove(face_id, persist=False)
+            if stale:
+                self.save()
+        return sorted(face_ids - set(self._rows))
+
+    def _replace(self, path: str, write) -> None:
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            write(f)
+            f.flush()
+            if self.fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
@@ -1,6 +1,7 @@
 import os
 os.environ['KMP_DUPLICATE_LIB_OK'] = 'TRUE'
 import threading
+import signal
 
 import cv2
 import time
@@ -8,13 +9,19 @@ import warnings
 import argparse
 import logging
 import numpy as np
-from database import AttendanceDatabase
+from database import AttendanceDatabase, AttendanceWriter
 import yaml
 from models.face_tracking.byte_tracker import BYTETracker
 from models.face_tracking.visualize import plot_tracking
 from database import FaceDatabase
-from models import SCRFD, ArcFace, AntiSpoof, AttendanceTracker
+from models import SCRFD, ArcFace, AntiSpoof, AttendanceTracker, SessionFactory, TrackLiveness
+from utils.detection_log import DetectionLogWriter
+from utils.face_quality import TrackFaceSelector, face_quality
+from utils.helpers import match_boxes
 from utils.logging import setup_logging
+from utils.metrics import REGISTRY, stage_histogram, start_metrics_server, timed
+from utils.profiler import PROFILER
+from utils.video_writer import AsyncVideoWriter
 from datetime import datetime
 
 warnings.filterwarnings("ignore")
@@ -37,8 +44,10 @@ data_lock = threading.Lock()
 recognition_ready = threading.Event()
 
 id_face_mapping = {}
+# track_id -> True (real) / False (spoof), written by the recognition thread
+id_liveness_mapping = {}
 
-def parse_args():
+def parse_args(argv=None):
 
     parser = argparse.ArgumentParser(description="Face Recognition Attendance with ByteTrack")
 
@@ -46,14 +55,52 @@ def parse_args():
     parser.add_argument("--rec-weight", type=str, default="./weights/w600k_mbf.onnx", help="Path to recognition model")
     parser.add_argument("--spoof-weight", type=str, default="weights/AntiSpoofing_bin_1.5_128.onnx",
                         help="Path to Anti-spoofing model")
+    parser.add_argument("--no-liveness", action="store_true", help="Disable anti-spoofing checks")
+    parser.add_argument("--liveness-thresh", type=float, default=0.5,
+                        help="Minimum real-face probability for a track to count as live")
+    parser.add_argument("--liveness-recheck", type=float, default=0,
+                        help="Seconds between liveness re-checks of a track (0 checks each track once)")
+    parser.add_argument("--ort-config", type=str, default=None,
+                        help="ONNX Runtime config (default: models/onnx_runtime.yaml)")
+    parser.add_argument("--ort-profile", type=str, default=None, choices=["latency", "throughput", "low_memory"],
+                        help="ONNX Runtime tuning profile (default: the one selected in the config)")
+    parser.add_argument("--int8", action="store_true",
+                        help="Load the INT8 model variants produced by tools/quantize.py "
+                             "(models without one stay FP32)")
     parser.add_argument("--similarity-thresh", type=float, default=0.4, help="Similarity threshold between faces")
+    parser.add_argument("--min-face-size", type=float, default=40,
+                        help="Shorter face side in pixels below which a face is not embedded")
+    parser.add_argument("--max-face-yaw", type=float, default=45,
+                        help="Estimated head yaw in degrees above which a face is not embedded")
+    parser.add_argument("--min-face-sharpness", type=float, default=50,
+                        help="Laplacian variance below which a face is treated as blurred and not embedded")
+    parser.add_argument("--quality-window", type=float, default=0.5,
+                        help="Seconds to collect frames of a new track before embedding the best one")
     parser.add_argument("--confidence-thresh", type=float, default=0.5, help="Confidence threshold for face detection")
     parser.add_argument("--faces-dir", type=str, default="./assets/faces", help="Path to faces stored dir")
     parser.add_argument("--max-num", type=int, default=0, help="Maximum number of face detections from a frame")
     parser.add_argument("--db-path", type=str, default="./database/face_database",
                         help="path to vector db and metadata")
     parser.add_argument("--update-db", action="store_true", help="Force update of the face database")
-    parser.add_argument("--output", type=str, default="output_video.mp4", help="Output path for annotated video")
+    parser.add_argument("--output", type=str, default="output_video.mp4",
+                        help="Output path for annotated video (empty string to disable)")
+    parser.add_argument("--output-every", type=int, default=1, help="Write every Nth frame to the output video")
+    parser.add_argument("--output-scale", type=float, default=1.0, help="Scale factor for the output video")
+    parser.add_argument("--output-queue", type=int, default=8,
+                        help="Frames buffered for the video writer before frames are dropped")
+    parser.add_argument("--source", type=str, default="0", help="Camera index or video file to read frames from")
+    parser.add_argument("--record-detections", type=str, default=None,
+                        help="Write every frame's detections and landmarks to this log for benchmarks/replay.py")
+    parser.add_argument("--metrics-port", type=int, default=0,
+                        help="Serve Prometheus metrics on this port (0 disables)")
+    parser.add_argument("--profile", type=float, default=0,
+                        help="Profile all threads for this many seconds from startup (0 disables)")
+    parser.add_argument("--profile-length", type=float, default=30,
+                        help="Seconds profiled when profiling is toggled at runtime (key 'p' or SIGUSR1)")
+    parser.add_argument("--profile-dir", type=str, default="profiles", help="Directory for profiler output")
+    parser.add_argument("--no-profile-memory", action="store_true",
+                        help="Skip the tracemalloc snapshots (they slow allocation-heavy code while profiling)")
+    parser.add_argument("--no-preview", action="store_true", help="Disable the live preview window")
     parser.add_argument("--exit-cooldown", type=int, default=5, help="Seconds before marking someone as left")
     parser.add_argument("--attendance-cooldown", type=int, default=300,
                         help="Cooldown in seconds between attendance records")
@@ -65,13 +112,19 @@ def parse_args():
 
     # SQLite parameters
     parser.add_argument("--attendance-db-path", type=str, default="./database/attendance.db", help="Path to SQLite attendance database")
+    parser.add_argument("--attendance-journal", type=str, default=None,
+                        help="Append-only journal for queued attendance events (default: next to the database)")
+    parser.add_argument("--attendance-batch-interval", type=float, default=0.5,
+                        help="Seconds of attendance events grouped into one database transaction")
 
-    return parser.parse_args()
+    return parser.parse_args(argv)
 
 
 def build_face_database(detector: SCRFD, recognizer: ArcFace, params: argparse.Namespace,
-                        force_update: bool = False) -> FaceDatabase:
-    face_db = FaceDatabase(db_path=params.db_path, max_workers=4)
+                        force_update: bool = False, face_db: FaceDatabase = None) -> FaceDatabase:
+    # A rebuild while running goes into the instance the recognition thread already searches
+    if face_db is None:
+        face_db = FaceDatabase(db_path=params.db_path, max_workers=4)
 
     if not force_update and face_db.load():
         logging.info("Loaded face database from disk.")
@@ -81,9 +134,11 @@ def build_face_database(detector: SCRFD, recognizer: ArcFace, params: argparse.N
 
     if not os.path.exists(params.faces_dir):
         logging.warning(f"Faces directory {params.faces_dir} does not exist. Creating empty database.")
-        face_db.save()
+        face_db.replace_all([], [])
         return face_db
 
+    embeddings, names = [], []
+
     for person_name in os.listdir(params.faces_dir):
         person_dir = os.path.join(params.faces_dir, person_name)
 
@@ -127,9 +182,10 @@ def build_face_database(detector: SCRFD, recognizer: ArcFace, params: argparse.N
                 continue
 
         if out_vec is not None:
-            face_db.add_face(out_vec, person_name)
+            embeddings.append(out_vec)
+            names.append(person_name)
 
-    face_db.save()
+    face_db.replace_all(embeddings, names)
     logging.info(f"Face database built successfully with {face_db.index.ntotal} face embeddings")
     return face_db
 
@@ -142,20 +198,40 @@ def load_config(file_name):
             print(exc)
 
 
-def process_tracking(frame, detector, tracker, args, frame_id, fps):
-    global data_mapping
+def annotate_frame(image, overlay):
+    """Draw the tracking overlay onto ``image`` in place."""
+    liveness = overlay.get("liveness", {})
+    colors = None
+    if liveness is not None:
+        colors = {track_id: COLOR_UNKNOWN if track_id not in liveness
+                  else COLOR_REAL if liveness[track_id] else COLOR_FAKE
+                  for track_id in overlay["ids"]}
+    plot_tracking(
+        image,
+        overlay["tlwhs"],
+        overlay["ids"],
+        names=overlay["names"],
+        frame_id=overlay["frame_id"],
+        fps=overlay["fps"],
+        colors=colors,
+    )
+    cv2.putText(image, overlay["fps_text"], (10, 30), cv2.FONT_HERSHEY_SIMPLEX,
+                1, (0, 255, 0), 2)
+    return image
 
-    # Face detection and tracking
-    outputs, img_info, bboxes, landmarks = detector.detect_tracking(image=frame)
+
+def update_tracks(tracker, outputs, img_info, args):
+    """Feed one frame's detections to BYTETracker and keep the tracks that pass the area/aspect filters."""
     tracking_tlwhs = []
     tracking_ids = []
     tracking_scores = []
     tracking_bboxes = []
 
     if outputs is not None:
-        online_targets = tracker.update(
-            outputs, [img_info["height"], img_info["width"]], (640, 640)
-        )
+        with timed("bytetrack"):
+            online_targets = tracker.update(
+                outputs, [img_info["height"], img_info["width"]], (640, 640)
+            )
 
         for i in range(len(online_targets)):
             t = online_targets[i]
@@ -168,16 +244,22 @@ def process_tracking(frame, detector, tracker, args, frame_id, fps):
                 tracking_tlwhs.append(tlwh)
                 tracking_ids.append(tid)
                 tracking_scores.append(t.score)
-        tracking_image = plot_tracking(
-            img_info["raw_img"],
-            tracking_tlwhs,
-            tracking_ids,
-            names=id_face_mapping,
-            frame_id=frame_id + 1,
-            fps=fps,
-        )
-    else:
-        tracking_image = img_info["raw_img"]
+
+    return tracking_tlwhs, tracking_ids, tracking_bboxes
+
+
+def process_tracking(frame, detector, tracker, args, recorder: DetectionLogWriter = None):
+    global data_mapping
+
+    # Face detection and tracking
+    outputs, img_info, bboxes, landmarks = detector.detect_tracking(image=frame)
+
+    # Record before tracking: BYTETracker rescales the detections in place
+    if recorder is not None:
+        recorder.write(time.time(), img_info["height"], img_info["width"], img_info["det_scale"],
+                       outputs, landmarks)
+
+    tracking_tlwhs, tracking_ids, tracking_bboxes = update_tracks(tracker, outputs, img_info, args)
 
     # CHANGE: Use thread lock to safely update shared data
     with data_lock:
@@ -190,7 +272,7 @@ def process_tracking(frame, detector, tracker, args, frame_id, fps):
     # Signal that new data is ready
     recognition_ready.set()
 
-    return tracking_image
+    return tracking_tlwhs, tracking_ids
 
 
 # def recognition(recognizer: ArcFace, face_db: FaceDatabase, attendance_tracker: AttendanceTracker,
@@ -259,8 +341,9 @@ def process_tracking(frame, detector, tracker, args, frame_id, fps):
 #             attendance_tracker.update(tracked_objects)
 
 def recognition(recognizer: ArcFace, face_db: FaceDatabase, attendance_tracker: AttendanceTracker,
-                last_seen: dict, params: argparse.Namespace, stop_event):
+                last_seen: dict, params: argparse.Namespace, stop_event, liveness: TrackLiveness = None):
     logging.info("Recognition thread started")
+    selector = TrackFaceSelector(window=params.quality_window)
 
     while not stop_event.is_set():
         recognition_ready.wait(timeout=0.5)
@@ -278,6 +361,7 @@ def recognition(recognizer: ArcFace, face_db: FaceDatabase, attendance_tracker:
 
             frame = raw_image.copy()
             detection_landmarks = [kps.copy() for kps in detection_landmarks]
+            detection_bboxes = data_mapping["detection_bboxes"].copy() if len(data_mapping["detection_bboxes"]) > 0 else []
             tracking_bboxes = data_mapping["tracking_bboxes"].copy() if len(data_mapping["tracking_bboxes"]) > 0 else []
             tracking_ids = data_mapping["tracking_ids"].copy() if len(data_mapping["tracking_ids"]) > 0 else []
 
@@ -285,132 +369,166 @@ def recognition(recognizer: ArcFace, face_db: FaceDatabase, attendance_tracker:
             attendance_tracker.update({})
             continue
 
-        embeddings = []
-        current_time = time.time()
+        recognition_step(frame, detection_bboxes, detection_landmarks, tracking_ids, tracking_bboxes, time.time(),
+                         lambda due: recognizer.get_embeddings([face for _, _, face in due]),
+                         face_db, attendance_tracker, selector, last_seen, params, liveness)
+
 
+def recognition_step(frame, detection_bboxes, detection_landmarks, tracking_ids, tracking_bboxes,
+                     current_time: float, embed, face_db: FaceDatabase, attendance_tracker: AttendanceTracker,
+                     selector: TrackFaceSelector, last_seen: dict, params: argparse.Namespace,
+                     liveness: TrackLiveness = None):
+    """One recognition cycle over a frame's tracks: liveness, quality gating, embedding, search, attendance.
+
+    ``embed`` turns the due (track_id, quality, (image, landmarks)) entries into embeddings.
+    ``frame`` may be None (replays), in which case sharpness is not measured and liveness must be off.
+    """
+    # Liveness runs only for tracks without a cached verdict (or due for a re-check)
+    blocked_track_ids = set()
+    if liveness is not None and len(tracking_bboxes) == len(tracking_ids):
         try:
-            for kps in detection_landmarks:
-                embedding = recognizer.get_embedding(frame, kps)
-                embeddings.append(embedding)
+            id_liveness_mapping.update(liveness.check(frame, tracking_ids, tracking_bboxes, now=current_time))
+            for track_id in set(id_liveness_mapping) - set(liveness.results):
+                id_liveness_mapping.pop(track_id, None)
+            blocked_track_ids = liveness.spoofed_track_ids()
         except Exception as e:
-            logging.error(f"Error getting embeddings: {e}")
-            attendance_tracker.update({})
-            continue
+            logging.error(f"Error checking liveness: {e}")
 
-        if embeddings and len(tracking_bboxes) == len(embeddings):
-            results = face_db.batch_search(embeddings, params.similarity_thresh)
+    # Score each track's face: tiny, blurred and profile faces are never embedded,
+    # and of the rest only the best frame collected per track is
+    with timed("face_quality"):
+        for track_index, det_index in match_boxes(tracking_bboxes, detection_bboxes).items():
+            if det_index >= len(detection_landmarks):
+                continue
+            kps = detection_landmarks[det_index]
+            quality = face_quality(frame, detection_bboxes[det_index], kps, min_size=params.min_face_size,
+                                   max_yaw=params.max_face_yaw, min_sharpness=params.min_face_sharpness)
+            selector.offer(tracking_ids[track_index], quality, (frame, kps), current_time)
 
-            tracked_objects = {}
+    due = selector.due(current_time)
+    selector.purge(current_time)
 
-            for i, ((name, similarity), track_id, bbox) in enumerate(zip(results, tracking_ids, tracking_bboxes)):
-                centroid = ((bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2)
-                tracked_objects[track_id] = (centroid, name)
+    if due:
+        try:
+            embeddings = embed(due)
+            results = face_db.batch_search(list(embeddings), params.similarity_thresh)
+        except Exception as e:
+            logging.error(f"Error getting embeddings: {e}")
+            results = []
 
-                if name != "Unknown":
-                    id_face_mapping[track_id] = name
+        for (track_id, quality, _), (name, similarity) in zip(due, results):
+            # A known name sticks to its track; a later Unknown does not erase it
+            if name != "Unknown":
+                id_face_mapping[track_id] = name
 
-                    if name not in last_seen or (current_time - last_seen[name]) >= 30:
-                        last_seen[name] = current_time
-                        logging.info(f" Recognized: {name} (similarity: {similarity:.3f})")
+                if name not in last_seen or (current_time - last_seen[name]) >= 30:
+                    last_seen[name] = current_time
+                    logging.info(f" Recognized: {name} (similarity: {similarity:.3f}, quality: {quality.score:.2f})")
 
-            attendance_tracker.update(tracked_objects)
+    tracked_objects = {}
+    for track_id, bbox in zip(tracking_ids, tracking_bboxes):
+        centroid = ((bbox[0] + bbox[2]) / 2, (bbox[1] + bbox[3]) / 2)
+        tracked_objects[track_id] = (centroid, id_face_mapping.get(track_id, "Unknown"))
 
-            attendance_tracker.cleanup_lost_tracks(tracking_ids)
-        else:
-            # No valid tracking data
-            attendance_tracker.update({})
+    attendance_tracker.update(tracked_objects, blocked_track_ids=blocked_track_ids, now=current_time)
 
+    attendance_tracker.cleanup_lost_tracks(tracking_ids)
 
-def tracking(detector, recognizer, attendance_db, config_tracking, params, stop_event):
+
+def tracking(detector, recognizer, face_db, attendance_db, attendance_writer, config_tracking, params, stop_event):
+    global id_face_mapping
     tracker = BYTETracker(args=config_tracking, frame_rate=30)
 
     # ADD: Variables for absent checking
     session_start_checked = False
     check_time = None
-    registered_students = []  # Load from database or config file
-
-    # ADD: Load registered students from database
-    try:
-        with attendance_db.get_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT name FROM students ORDER BY name")
-            registered_students = [row[0] for row in cursor.fetchall()]
-            cursor.close()
-            logging.info(f"Loaded {len(registered_students)} registered students")
-    except Exception as e:
-        logging.error(f"Error loading registered students: {e}")
+    recorder = None
 
     try:
-        cap = cv2.VideoCapture(0)
+        cap = cv2.VideoCapture(int(params.source) if params.source.isdigit() else params.source)
         if not cap.isOpened():
-            raise IOError(f"Could not open video source")
+            raise IOError(f"Could not open video source {params.source}")
+        if params.record_detections:
+            recorder = DetectionLogWriter(params.record_detections)
+            logging.info(f"Recording detections to {params.record_detections}")
 
         width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         fps = cap.get(cv2.CAP_PROP_FPS)
-        out = cv2.VideoWriter(params.output, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height))
+        if params.output:
+            out = AsyncVideoWriter(params.output, fps, (width, height), annotate=annotate_frame,
+                                   every_n=params.output_every, scale=params.output_scale,
+                                   queue_size=params.output_queue)
+        display = None
 
         full_name = input("Registered name (for manual capture, press Enter to skip): ")
         frame_count = 0
 
         logging.info("Starting attendance tracking with ByteTrack...")
 
+        frames_metric = REGISTRY.counter("face_frames", "Frames read by the tracking thread")
+        tracks_metric = REGISTRY.gauge("face_active_tracks", "Tracks in the latest frame")
+        frame_metric = stage_histogram("detect_track")
+
         while not stop_event.is_set():
-            ret, frame = cap.read()
+            with timed("capture"):
+                ret, frame = cap.read()
             if not ret:
                 break
+            frames_metric.inc()
 
             # ADD: Check for session start and mark absent students after 5 minutes
             current_time = datetime.now()
             session_info = attendance_db.get_current_session_time()
 
+            # Reset check for next session
+            if session_info and check_time != session_info['session_number']:
+                session_start_checked = False
+                check_time = session_info['session_number']
+
             if session_info and not session_start_checked:
                 # Calculate time since session start
                 session_start = datetime.combine(current_time.date(), session_info['start_time'])
                 time_diff = (current_time - session_start).total_seconds() / 60
 
-                # Check after 5 minutes of session start
+                # Check after 5 minutes of session start; the writer thread runs the bulk update
                 if time_diff >= 5:
-                    absent_students = attendance_db.get_absent_students(registered_students)
-                    if absent_students:
-                        print(f"\n{'=' * 70}")
-                        print(f" ABSENT STUDENTS ALERT (5 minutes after session start)")
-                        print(f"{'=' * 70}")
-                        print(
-                            f"Session {session_info['session_number']} - Started at: {session_info['start_time'].strftime('%H:%M')}")
-                        print(f"Current time: {current_time.strftime('%H:%M:%S')}")
-                        print(f"\nAbsent students ({len(absent_students)}):")
-                        for i, student in enumerate(absent_students, 1):
-                            print(f"  {i}. {student}")
-                            attendance_db.mark_absent(student)
-                        print(f"{'=' * 70}\n")
-                        logging.warning(f"{len(absent_students)} students marked as absent")
-
+                    attendance_writer.mark_absent_students()
                     session_start_checked = True
 
-            # Reset check for next session
-            if session_info and check_time != session_info['session_number']:
-                session_start_checked = False
-                check_time = session_info['session_number']
-
             start = time.time()
-            frame = process_tracking(frame, detector=detector, tracker=tracker,
-                                     args=config_tracking, frame_id=frame_count, fps=fps)
+            tracking_tlwhs, tracking_ids = process_tracking(frame, detector=detector, tracker=tracker,
+                                                            args=config_tracking,
+                                                            recorder=recorder)
             end = time.time()
-
-            fps_text = f"FPS: {1 / (end - start):.1f}"
-            cv2.putText(frame, fps_text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX,
-                        1, (0, 255, 0), 2)
-
-            out.write(frame)
-            cv2.imshow("Face Recognition Attendance - ByteTrack", frame)
-
-            key = cv2.waitKey(1) & 0xFF
+            frame_metric.observe(end - start)
+            tracks_metric.set(len(tracking_ids))
+
+            overlay = {
+                "tlwhs": tracking_tlwhs,
+                "ids": tracking_ids,
+                "names": dict(id_face_mapping),
+                "liveness": None if params.no_liveness else dict(id_liveness_mapping),
+                "frame_id": frame_count + 1,
+                "fps": fps,
+                "fps_text": f"FPS: {1 / max(end - start, 1e-6):.1f}",
+            }
+
+            if params.output:
+                out.submit(frame, overlay)
+
+            key = -1
+            if not params.no_preview:
+                if display is None or display.shape != frame.shape:
+                    display = np.empty_like(frame)
+                np.copyto(display, frame)
+                cv2.imshow("Face Recognition Attendance - ByteTrack", annotate_frame(display, overlay))
+                key = cv2.waitKey(1) & 0xFF
             if key == ord('q'):
                 stop_event.set()
                 break
             elif key == ord('b'):
-                face_db = build_face_database(detector, recognizer, params, force_update=True)
+                build_face_database(detector, recognizer, params, force_update=True, face_db=face_db)
             elif key == ord('s') and full_name:
                 save_dir = os.path.join("assets/faces", full_name)
                 os.makedirs(save_dir, exist_ok=True)
@@ -432,6 +550,8 @@ def tracking(detector, recognizer, attendance_db, config_tracking, params, stop_
                           f"{record['late_count']:<5} | {record['absent_count']:<7} | "
                           f"{record['total_score']:<12.1f} | {record['score_out_of_10']:<10.1f}")
                 print("=" * 100 + "\n")
+            elif key == ord('p'):
+                PROFILER.toggle(params.profile_length, memory=not params.no_profile_memory)
             elif key == ord('c'):
                 current_students = attendance_db.get_current_students()
                 print("\n" + "=" * 50)
@@ -448,9 +568,7 @@ def tracking(detector, recognizer, attendance_db, config_tracking, params, stop_
                 if confirm == "DELETE":
                     if attendance_db.reset_database():
                         print(" Database reset successfully!")
-                        registered_students = []
 
-                        global id_face_mapping
                         id_face_mapping = {}
 
                         logging.info("Database reset completed")
@@ -473,14 +591,22 @@ def tracking(detector, recognizer, attendance_db, config_tracking, params, stop_
         if 'cap' in locals():
             cap.release()
         if 'out' in locals():
-            out.release()
+            out.close()
+        if recorder is not None:
+            recorder.close()
+            logging.info(f"Recorded {recorder.frames} frames of detections to {recorder.path}")
         cv2.destroyAllWindows()
 
 def main(params):
     try:
-        detector = SCRFD(params.det_weight, input_size=(640, 640), conf_thres=params.confidence_thresh)
-        recognizer = ArcFace(params.rec_weight)
-        anti_spoofing = AntiSpoof(params.spoof_weight)
+        # Detection runs on the tracking thread, recognition and anti-spoofing on the recognition thread
+        session_factory = SessionFactory(params.ort_config, profile=params.ort_profile, concurrent_sessions=2)
+        detector = SCRFD(params.det_weight, input_size=(640, 640), conf_thres=params.confidence_thresh,
+                         session_factory=session_factory, session_group=0, quantized=params.int8)
+        recognizer = ArcFace(params.rec_weight, session_factory=session_factory, session_group=1,
+                             quantized=params.int8)
+        anti_spoofing = AntiSpoof(params.spoof_weight, session_factory=session_factory, session_group=1,
+                                  quantized=params.int8)
         file_name = "models/face_tracking/config_tracking.yaml"
         config_tracking = load_config(file_name)
         attendance_db = AttendanceDatabase(db_path=params.attendance_db_path)
@@ -491,20 +617,50 @@ def main(params):
     face_db = build_face_database(detector, recognizer, params, force_update=params.update_db)
 
     last_seen = {}
-    attendance_tracker = AttendanceTracker(attendance_db, cooldown_seconds=params.exit_cooldown)
+    attendance_writer = AttendanceWriter(attendance_db, journal_path=params.attendance_journal,
+                                         batch_interval=params.attendance_batch_interval)
+    attendance_tracker = AttendanceTracker(attendance_writer, cooldown_seconds=params.exit_cooldown)
+
+    liveness = None
+    if params.no_liveness:
+        logging.info("Liveness checks disabled")
+    elif anti_spoofing.ort_session is None:
+        logging.warning(f"Anti-spoofing model {params.spoof_weight} not found, liveness checks disabled")
+        params.no_liveness = True
+    else:
+        liveness = TrackLiveness(anti_spoofing, threshold=params.liveness_thresh,
+                                 recheck_seconds=params.liveness_recheck)
+
+    metrics_server = start_metrics_server(params.metrics_port) if params.metrics_port else None
+
+    # Profiling can be started (and stopped early) while running: key 'p' in the preview or `kill -USR1 <pid>`
+    PROFILER.output_dir = params.profile_dir
+    if hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, lambda signum, frame: PROFILER.toggle(
+            params.profile_length, memory=not params.no_profile_memory))
+    if params.profile > 0:
+        PROFILER.start(params.profile, memory=not params.no_profile_memory)
 
     stop_event = threading.Event()
 
+    # Without the preview there is no 'q' key: Ctrl+C / SIGTERM stop the loop so the writers still flush
+    def request_stop(signum, frame):
+        logging.info(f"Received signal {signum}, stopping")
+        stop_event.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
     thread_track = threading.Thread(
         target=tracking,
-        args=(detector, recognizer, attendance_db, config_tracking, params, stop_event),
+        args=(detector, recognizer, face_db, attendance_db, attendance_writer, config_tracking, params, stop_event),
         daemon=True
     )
     thread_track.start()
 
     thread_recognize = threading.Thread(
         target=recognition,
-        args=(recognizer, face_db, attendance_tracker, last_seen, params,stop_event),
+        args=(recognizer, face_db, attendance_tracker, last_seen, params, stop_event, liveness),
         daemon=True
     )
     thread_recognize.start()
@@ -513,6 +669,13 @@ def main(params):
     thread_track.join()
     stop_event.set()
     thread_recognize.join(timeout=2)
+    attendance_writer.close()
+    attendance_db.close()
+    face_db.close()
+    if metrics_server is not None:
+        metrics_server.shutdown()
+    if PROFILER.running:
+        PROFILER.stop()
 
 if __name__ == '__main__':
     args = parse_args()
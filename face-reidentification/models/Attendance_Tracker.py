@@ -8,10 +8,17 @@ class AttendanceTracker:
         self.tracked_people = {}  # name: {'last_seen': time, 'status': 'present'/'absent', 'track_ids': set()}
         self.track_to_name = {}  # track_id: name
         self.active_track_ids = set()  # Currently active track IDs
+        self.blocked_track_ids = set()  # Track IDs already reported as spoofed
 
-    def update(self, tracked_objects):
+    def update(self, tracked_objects, blocked_track_ids=None, now=None):
+        """Record entries/exits for ``{track_id: (centroid, name)}``.
 
-        current_time = time.time()
+        Tracks in ``blocked_track_ids`` (e.g. failed liveness) never record an entry.
+        ``now`` overrides the wall clock (used when replaying recorded runs).
+        """
+
+        current_time = time.time() if now is None else now
+        blocked_track_ids = blocked_track_ids or set()
         current_tracked_names = set()
         current_track_ids = set(tracked_objects.keys())
 
@@ -20,6 +27,11 @@ class AttendanceTracker:
 
         # Update tracking with current detections
         for track_id, (centroid, name) in tracked_objects.items():
+            if track_id in blocked_track_ids:
+                if track_id not in self.blocked_track_ids:
+                    self.blocked_track_ids.add(track_id)
+                    logging.warning(f" Track {track_id} ({name}) failed liveness check, entry not recorded")
+                continue
             if name != "Unknown":
                 current_tracked_names.add(name)
                 self.track_to_name[track_id] = name
@@ -80,6 +92,7 @@ class AttendanceTracker:
     def cleanup_lost_tracks(self, current_track_ids):
         """Clean up track IDs that are no longer active"""
         self.active_track_ids = set(current_track_ids)
+        self.blocked_track_ids &= self.active_track_ids
 
         # Remove track_to_name mappings for lost tracks
         for track_id in list(self.track_to_name.keys()):
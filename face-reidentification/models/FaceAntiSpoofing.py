@@ -1,68 +1,212 @@
 import cv2
-import onnxruntime as ort
 import numpy as np
 import os
+import time
+from logging import getLogger
+
+from models.onnx_session import SessionFactory, resolve_model_path
+from utils.helpers import increased_crop
+from utils.metrics import timed
+
+logger = getLogger(__name__)
+
+
+def _batchable_model(onnx_model_path: str, dynamic_path: str):
+    """Return (model to load, whether it accepts any batch size), or None without the onnx package.
+
+    The published anti-spoofing models are exported with a fixed batch of 1 and a
+    ``Reshape(x, [1, -1])`` flatten before the classifier. Marking the batch dimension
+    symbolic and turning that flatten into ``[0, -1]`` is enough to batch them; the
+    copy is written to ``dynamic_path``. Graphs with any other batch-bound reshape
+    are left alone.
+    """
+    if os.path.isfile(dynamic_path) and os.path.getmtime(dynamic_path) >= os.path.getmtime(onnx_model_path):
+        return dynamic_path, True
+
+    try:
+        import onnx
+        from onnx import numpy_helper
+    except ImportError:
+        return None
+
+    model = onnx.load(onnx_model_path)
+    batch_dim = model.graph.input[0].type.tensor_type.shape.dim[0]
+    if not (batch_dim.HasField("dim_value") and batch_dim.dim_value == 1):
+        return onnx_model_path, True
+
+    initializers = {tensor.name: tensor for tensor in model.graph.initializer}
+    flattens = []
+    for node in model.graph.node:
+        if node.op_type != "Reshape":
+            continue
+        shape = initializers.get(node.input[1])
+        if shape is None or numpy_helper.to_array(shape).tolist() != [1, -1]:
+            return onnx_model_path, False
+        flattens.append(shape)
+
+    for tensor in flattens:
+        tensor.CopyFrom(numpy_helper.from_array(np.array([0, -1], dtype=np.int64), tensor.name))
+    for value in list(model.graph.input) + list(model.graph.output):
+        value.type.tensor_type.shape.dim[0].dim_param = "N"
+    del model.graph.value_info[:]
+
+    os.makedirs(os.path.dirname(dynamic_path), exist_ok=True)
+    tmp_path = f"{dynamic_path}.{os.getpid()}.tmp"
+    onnx.save(model, tmp_path)
+    os.replace(tmp_path, dynamic_path)
+    return dynamic_path, True
+
 
 # onnx model
 class AntiSpoof:
+    """Liveness classifier over face crops.
+
+    Crops are letterboxed into one preallocated (N, 3, S, S) tensor and classified
+    with a single session run. The buffers are reused between calls, so one instance
+    must not be called from several threads at once.
+    """
+
     def __init__(self,
                  weights: str = None,
-                 model_img_size: int = 128):
+                 model_img_size: int = 128,
+                 session_factory: SessionFactory = None,
+                 session_group: int = 0,
+                 quantized: bool = False):
         super().__init__()
-        self.weights = weights
+        self.quantized = quantized
+        self.weights = resolve_model_path(weights, quantized) if weights else weights
         self.model_img_size = model_img_size
-        self.ort_session, self.input_name = self._init_session_(self.weights)
+        self.supports_batch = False
+        self.ort_session, self.input_name = self._init_session_(self.weights, session_factory, session_group)
+
+        # Reused letterbox canvases (uint8, NHWC) and model input (float32, NCHW)
+        self._canvas = np.zeros((0, model_img_size, model_img_size, 3), dtype=np.uint8)
+        self._batch = np.zeros((0, 3, model_img_size, model_img_size), dtype=np.float32)
 
-    def _init_session_(self, onnx_model_path: str):
+    def _init_session_(self, onnx_model_path: str, session_factory: SessionFactory = None, session_group: int = 0):
         ort_session = None
         input_name = None
         if os.path.isfile(onnx_model_path):
+            session_factory = session_factory or SessionFactory()
+            # Settle which graph to run before creating the (single) session
+            model_path, batchable = onnx_model_path, None
             try:
-                ort_session = ort.InferenceSession(onnx_model_path,
-                                                   providers=['CUDAExecutionProvider'])
-            except:
-                ort_session = ort.InferenceSession(onnx_model_path,
-                                                   providers=['CPUExecutionProvider'])
+                resolved = _batchable_model(onnx_model_path,
+                                            session_factory.derived_model_path(onnx_model_path, "dynamic"))
+                if resolved is not None:
+                    model_path, batchable = resolved
+            except Exception as e:
+                logger.warning(f"Could not make {onnx_model_path} batchable: {e}")
+
+            ort_session = session_factory.create(model_path, group=session_group)
             input_name = ort_session.get_inputs()[0].name
+            if batchable is None:
+                batch_dim = ort_session.get_inputs()[0].shape[0]
+                batchable = not isinstance(batch_dim, int) or batch_dim != 1
+            self.supports_batch = batchable
         return ort_session, input_name
 
-    def preprocessing(self, img):
-        #img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    def _reserve(self, count: int) -> None:
+        if len(self._batch) < count:
+            capacity = max(count, 2 * len(self._batch), 8)
+            size = self.model_img_size
+            self._canvas = np.zeros((capacity, size, size, 3), dtype=np.uint8)
+            self._batch = np.zeros((capacity, 3, size, size), dtype=np.float32)
+
+    def _letterbox(self, img, canvas):
+        """Resize ``img`` to fit the model input, keeping its aspect ratio, centered on a black ``canvas``."""
         new_size = self.model_img_size
-        old_size = img.shape[:2] # old_size is in (height, width) format
+        old_size = img.shape[:2]  # (height, width)
 
-        ratio = float(new_size)/max(old_size)
-        scaled_shape = tuple([int(x*ratio) for x in old_size])
+        ratio = float(new_size) / max(old_size)
+        height, width = (max(1, min(new_size, int(x * ratio))) for x in old_size)
+        top = (new_size - height) // 2
+        left = (new_size - width) // 2
 
-        # new_size should be in (width, height) format
-        img = cv2.resize(img, (scaled_shape[1], scaled_shape[0]))
+        canvas.fill(0)
+        canvas[top:top + height, left:left + width] = cv2.resize(img, (width, height))
 
-        delta_w = new_size - scaled_shape[1]
-        delta_h = new_size - scaled_shape[0]
-        top, bottom = delta_h//2, delta_h-(delta_h//2)
-        left, right = delta_w//2, delta_w-(delta_w//2)
+    def preprocessing_batch(self, imgs):
+        """Letterbox every crop into the shared (N, 3, S, S) float tensor, scaled to [0, 1]."""
+        count = len(imgs)
+        self._reserve(count)
+        canvas = self._canvas[:count]
+        for img, slot in zip(imgs, canvas):
+            self._letterbox(img, slot)
 
-        img = cv2.copyMakeBorder(img, top, bottom, left, right,
-                                 cv2.BORDER_CONSTANT, value=[0, 0, 0])
-        img = img.transpose(2, 0, 1).astype(np.float32) / 255.0
-        img = np.expand_dims(img, axis=0)
-        return img
+        batch = self._batch[:count]
+        np.multiply(canvas.transpose(0, 3, 1, 2), np.float32(1.0 / 255.0), out=batch, casting="unsafe")
+        return batch
+
+    def preprocessing(self, img):
+        return self.preprocessing_batch([img]).copy()
 
     def postprocessing(self, prediction):
-        softmax = lambda x: np.exp(x)/np.sum(np.exp(x))
-        pred = softmax(prediction)
-        return pred
-        #return np.argmax(pred)
+        """Numerically stable softmax over the class axis of an (N, C) array."""
+        logits = np.asarray(prediction, dtype=np.float32)
+        exp = np.exp(logits - logits.max(axis=1, keepdims=True))
+        return exp / exp.sum(axis=1, keepdims=True)
 
-    def __call__(self, imgs : list):
+    def __call__(self, imgs: list):
+        """Class probabilities for each crop as an (N, 2) array (index 0 is real)."""
         if not self.ort_session:
             return False
+        if len(imgs) == 0:
+            return np.empty((0, 2), dtype=np.float32)
+
+        with timed("antispoof"):
+            batch = self.preprocessing_batch(imgs)
+            if self.supports_batch:
+                logits = self.ort_session.run([], {self.input_name: batch})[0]
+            else:
+                logits = np.concatenate([self.ort_session.run([], {self.input_name: batch[i:i + 1]})[0]
+                                         for i in range(len(batch))])
+            return self.postprocessing(logits)
+
+
+class TrackLiveness:
+    """Runs AntiSpoof once per track instead of once per frame.
+
+    The first time a track_id is seen its face is classified and the verdict is
+    cached; with ``recheck_seconds`` > 0 the track is classified again after that
+    long. Verdicts of tracks unseen for ``ttl_seconds`` are dropped.
+    """
+
+    def __init__(self, anti_spoof: AntiSpoof, threshold: float = 0.5, recheck_seconds: float = 0.0,
+                 ttl_seconds: float = 30.0):
+        self.anti_spoof = anti_spoof
+        self.threshold = threshold
+        self.recheck_seconds = recheck_seconds
+        self.ttl_seconds = ttl_seconds
+        self.results = {}  # track_id: {'real': bool, 'score': float, 'checked_at': time, 'last_seen': time}
+
+    def check(self, frame, track_ids, bboxes, now=None):
+        """Classify tracks that are new or due for a re-check; return {track_id: is_real} for ``track_ids``."""
+        now = time.time() if now is None else now
+
+        due = []
+        for i, track_id in enumerate(track_ids):
+            result = self.results.get(track_id)
+            if result is None or (self.recheck_seconds > 0 and now - result['checked_at'] >= self.recheck_seconds):
+                due.append(i)
+            else:
+                result['last_seen'] = now
+
+        if due:
+            probs = self.anti_spoof([increased_crop(frame, bboxes[i]) for i in due])
+            for i, real_score in zip(due, probs[:, 0]):
+                track_id = track_ids[i]
+                previous = self.results.get(track_id)
+                real = bool(real_score >= self.threshold)
+                self.results[track_id] = {'real': real, 'score': float(real_score),
+                                          'checked_at': now, 'last_seen': now}
+                if previous is None or previous['real'] != real:
+                    logger.info(f"Track {track_id}: {'real' if real else 'SPOOF'} face (score {real_score:.2f})")
+
+        for track_id in [t for t, r in self.results.items() if now - r['last_seen'] > self.ttl_seconds]:
+            del self.results[track_id]
+
+        return {track_id: self.results[track_id]['real'] for track_id in track_ids}
 
-        preds = []
-        for img in imgs:
-            onnx_result = self.ort_session.run([],
-                {self.input_name: self.preprocessing(img)})
-            pred = onnx_result[0]
-            pred = self.postprocessing(pred)
-            preds.append(pred)
-        return preds
\ No newline at end of file
+    def spoofed_track_ids(self):
+        return {track_id for track_id, result in self.results.items() if not result['real']}
@@ -1,4 +1,5 @@
+from .onnx_session import SessionFactory
 from .arcface import ArcFace
 from .scrfd import SCRFD
-from .FaceAntiSpoofing import AntiSpoof
+from .FaceAntiSpoofing import AntiSpoof, TrackLiveness
 from .Attendance_Tracker import AttendanceTracker
@@ -1,9 +1,10 @@
 import cv2
 import numpy as np
 from logging import getLogger
-from onnxruntime import InferenceSession
-
+from typing import List, Tuple
+from models.onnx_session import SessionFactory, resolve_model_path
 from utils.helpers import face_alignment
+from utils.metrics import timed
 
 __all__ = ["ArcFace"]
 
@@ -12,9 +13,11 @@ logger = getLogger(__name__)
 
 class ArcFace:
 
-    def __init__(self, model_path: str) -> None:
+    def __init__(self, model_path: str, session_factory: SessionFactory = None, session_group: int = 0,
+                 quantized: bool = False) -> None:
 
-        self.model_path = model_path
+        self.quantized = quantized
+        self.model_path = resolve_model_path(model_path, quantized)
         self.input_size = (112, 112)
         self.normalization_mean = 127.5
         self.normalization_scale = 127.5
@@ -22,15 +25,15 @@ class ArcFace:
         logger.info(f"Initializing ArcFace model from {self.model_path}")
 
         try:
-            self.session = InferenceSession(
-                self.model_path,
-                providers=["CUDAExecutionProvider", "CPUExecutionProvider"]
-            )
+            session_factory = session_factory or SessionFactory()
+            self.session = session_factory.create(self.model_path, group=session_group)
 
             input_config = self.session.get_inputs()[0]
             self.input_name = input_config.name
 
             input_shape = input_config.shape
+            # Exported with a symbolic batch dimension, the model can embed many faces per run
+            self.supports_batch = not isinstance(input_shape[0], int) or input_shape[0] != 1
             model_input_size = tuple(input_shape[2:4][::-1])
             if model_input_size != self.input_size:
                 logger.warning(
@@ -88,9 +91,11 @@ class ArcFace:
             raise ValueError("Image and landmarks must not be None")
 
         try:
-            aligned_face, _ = face_alignment(image, landmarks)
-            face_blob = self.preprocess(aligned_face)
-            embedding = self.session.run(self.output_names, {self.input_name: face_blob})[0]
+            with timed("alignment"):
+                aligned_face, _ = face_alignment(image, landmarks)
+                face_blob = self.preprocess(aligned_face)
+            with timed("arcface"):
+                embedding = self.session.run(self.output_names, {self.input_name: face_blob})[0]
 
             if normalized:
                 # L2 normalization of embedding
@@ -103,3 +108,36 @@ class ArcFace:
         except Exception as e:
             logger.error(f"Error extracting face embedding: {e}")
             raise
+
+    def get_embeddings(
+        self,
+        faces: List[Tuple[np.ndarray, np.ndarray]],
+        normalized: bool = False
+    ) -> np.ndarray:
+        """Embed several (image, landmarks) pairs with a single session run.
+
+        Returns an array of shape (N, embedding_size).
+        """
+        if not faces:
+            return np.empty((0, self.embedding_size), dtype=np.float32)
+
+        try:
+            with timed("alignment"):
+                blobs = [self.preprocess(face_alignment(image, landmarks)[0]) for image, landmarks in faces]
+
+            with timed("arcface"):
+                if self.supports_batch:
+                    embeddings = self.session.run(self.output_names, {self.input_name: np.concatenate(blobs)})[0]
+                else:
+                    embeddings = np.concatenate(
+                        [self.session.run(self.output_names, {self.input_name: blob})[0] for blob in blobs]
+                    )
+
+            if normalized:
+                embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+            return embeddings
+
+        except Exception as e:
+            logger.error(f"Error extracting face embeddings: {e}")
+            raise
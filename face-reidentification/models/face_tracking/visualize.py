@@ -48,11 +48,13 @@ def get_color(idx):
 def draw_bbox(image, bbox):
     pass
 def plot_tracking(
-    image, tlwhs, obj_ids, frame_id=0, fps=0.0, ids2=None, names=[]):
-    im = np.ascontiguousarray(np.copy(image))
-    im_h, im_w = im.shape[:2]
+    image, tlwhs, obj_ids, frame_id=0, fps=0.0, ids2=None, names=[], colors=None):
+    """Draw tracks onto ``image`` in place and return it.
 
-    top_view = np.zeros([im_w, im_w, 3], dtype=np.uint8) + 255
+    Callers that need to keep the raw frame should pass a reused copy.
+    ``colors`` optionally maps a track id to its box color.
+    """
+    im = np.ascontiguousarray(image)
 
     # text_scale = max(1, image.shape[1] / 1600.)
     # text_thickness = 2
@@ -61,10 +63,6 @@ def plot_tracking(
     text_thickness = 2
     line_thickness = 3
 
-
-    radius = max(5, int(im_w / 140.0))
-
-
     for i, tlwh in enumerate(tlwhs):
         x1, y1, w, h = tlwh
         intbox = tuple(map(int, (x1, y1, x1 + w, y1 + h)))
@@ -74,7 +72,7 @@ def plot_tracking(
             id_text = id_text + ": " + names[obj_id]
         if ids2 is not None:
             id_text = id_text + ", {}".format(int(ids2[i]))
-        color = get_color(abs(obj_id))
+        color = colors[obj_id] if colors and obj_id in colors else get_color(abs(obj_id))
         cv2.rectangle(
             im, intbox[0:2], intbox[2:4], color=color, thickness=line_thickness
         )
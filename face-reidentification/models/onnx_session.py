@@ -0,0 +1,199 @@
+import hashlib
+import json
+import os
+import platform
+from logging import getLogger
+from typing import List, Optional
+
+import onnxruntime
+import yaml
+
+__all__ = ["SessionFactory", "DEFAULT_RUNTIME_CONFIG", "quantized_model_path", "resolve_model_path"]
+
+logger = getLogger(__name__)
+
+DEFAULT_RUNTIME_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "onnx_runtime.yaml")
+
+EXECUTION_MODES = {
+    "sequential": onnxruntime.ExecutionMode.ORT_SEQUENTIAL,
+    "parallel": onnxruntime.ExecutionMode.ORT_PARALLEL,
+}
+
+GRAPH_OPTIMIZATION_LEVELS = {
+    "disabled": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+    "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+    "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+    "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+}
+
+
+def quantized_model_path(model_path: str) -> str:
+    """Where tools/quantize.py publishes the INT8 variant of ``model_path``."""
+    root, ext = os.path.splitext(model_path)
+    return f"{root}.int8{ext}"
+
+
+def resolve_model_path(model_path: str, quantized: bool = False) -> str:
+    """The model file to load: the INT8 variant when ``quantized`` is set and one was published.
+
+    tools/quantize.py only publishes variants that stayed within tolerance, so any
+    other model keeps its FP32 file (with a warning) instead of failing the start.
+    """
+    if not quantized:
+        return model_path
+    path = quantized_model_path(model_path)
+    if os.path.isfile(path):
+        return path
+    if os.path.isfile(model_path):
+        logger.warning(f"INT8 model {path} not found, using FP32 {model_path}; create it with tools/quantize.py")
+    return model_path
+
+
+def available_cores() -> List[int]:
+    """Logical CPUs this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+class SessionFactory:
+    """Builds every InferenceSession from one runtime config.
+
+    The config (``models/onnx_runtime.yaml``) names a profile that fixes thread
+    counts, execution mode, graph optimization, memory arena and thread affinity.
+    ``auto`` thread counts split the cores between ``concurrent_sessions``, and a
+    session's ``group`` selects which slice of cores its threads are pinned to, so
+    models that run at the same time do not fight over the same cores.
+
+    With ``shared_sessions`` every session is run by up to ``concurrent_sessions``
+    threads at once (the API's inference pool), so there is no slice that belongs to
+    one caller: thread counts are still split per caller, but nothing is pinned.
+
+    When ``model_cache`` is enabled, the graph ORT optimizes on first load is saved
+    and later sessions load that copy with graph optimizations turned off.
+    """
+
+    def __init__(self, config_path: Optional[str] = None, profile: Optional[str] = None,
+                 concurrent_sessions: Optional[int] = None, shared_sessions: bool = False) -> None:
+        self.config_path = config_path or DEFAULT_RUNTIME_CONFIG
+        with open(self.config_path, "r") as stream:
+            self.config = yaml.safe_load(stream) or {}
+
+        self.profile = profile or self.config.get("profile", "latency")
+        profiles = self.config.get("profiles", {})
+        if self.profile not in profiles:
+            raise ValueError(f"Unknown ONNX Runtime profile '{self.profile}' (available: {', '.join(profiles)})")
+        self.settings = profiles[self.profile]
+
+        self.concurrent_sessions = max(1, int(concurrent_sessions or self.config.get("concurrent_sessions", 1)))
+        self.shared_sessions = shared_sessions
+        self.cores = available_cores()
+
+        # Only ask for providers this onnxruntime build has, so CPU-only hosts never try CUDA first
+        available = onnxruntime.get_available_providers()
+        preferred = self.config.get("providers") or ["CPUExecutionProvider"]
+        self.providers = [p for p in preferred if p in available] or ["CPUExecutionProvider"]
+
+        cache = self.config.get("model_cache") or {}
+        self.cache_enabled = bool(cache.get("enabled", False))
+        self.cache_dir = cache.get("dir") or "ort_cache"
+
+        logger.info(f"ONNX Runtime profile '{self.profile}': {self.intra_op_threads} intra-op thread(s) "
+                    f"x {self.concurrent_sessions} concurrent {'run' if shared_sessions else 'session'}(s), "
+                    f"providers {self.providers}")
+
+    @property
+    def intra_op_threads(self) -> int:
+        threads = self.settings.get("intra_op_threads", "auto")
+        if threads == "auto":
+            return max(1, len(self.cores) // self.concurrent_sessions)
+        return max(1, int(threads))
+
+    def session_options(self, group: int = 0) -> onnxruntime.SessionOptions:
+        """SessionOptions for the active profile; ``group`` picks the core slice for thread affinity."""
+        settings = self.settings
+        options = onnxruntime.SessionOptions()
+
+        threads = self.intra_op_threads
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = max(1, int(settings.get("inter_op_threads", 1)))
+        options.execution_mode = EXECUTION_MODES[settings.get("execution_mode", "sequential")]
+        options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS[settings.get("graph_optimization", "all")]
+        options.enable_cpu_mem_arena = bool(settings.get("memory_arena", True))
+        options.enable_mem_pattern = bool(settings.get("memory_pattern", True))
+        options.add_session_config_entry("session.intra_op.allow_spinning",
+                                         "1" if settings.get("allow_spinning", True) else "0")
+
+        if (settings.get("thread_affinity") and not self.shared_sessions and threads > 1
+                and threads * self.concurrent_sessions <= len(self.cores)):
+            # ORT pins the threads it creates (all but the calling thread) to 1-based logical processor ids
+            start = (group % self.concurrent_sessions) * threads
+            slice_ = self.cores[start:start + threads]
+            options.add_session_config_entry("session.intra_op_thread_affinities",
+                                             ";".join(str(core + 1) for core in slice_[1:]))
+
+        return options
+
+    def create(self, model_path: str, group: int = 0) -> onnxruntime.InferenceSession:
+        options = self.session_options(group)
+        if not self.cache_enabled:
+            return onnxruntime.InferenceSession(model_path, sess_options=options, providers=self.providers)
+
+        cached_path = self.cached_model_path(model_path, options)
+        if os.path.exists(cached_path):
+            try:
+                options.graph_optimization_level = GRAPH_OPTIMIZATION_LEVELS["disabled"]
+                session = onnxruntime.InferenceSession(cached_path, sess_options=options, providers=self.providers)
+                logger.info(f"Loaded optimized model for {model_path} from cache")
+                return session
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable optimized model cache {cached_path}: {e}")
+                options = self.session_options(group)
+
+        # Let ORT write the graph it optimizes for this session, then publish it atomically
+        os.makedirs(os.path.dirname(cached_path), exist_ok=True)
+        tmp_path = f"{cached_path}.{os.getpid()}.tmp.onnx"
+        options.optimized_model_filepath = tmp_path
+        session = onnxruntime.InferenceSession(model_path, sess_options=options, providers=self.providers)
+        try:
+            os.replace(tmp_path, cached_path)
+            logger.info(f"Cached optimized model for {model_path} at {cached_path}")
+        except OSError as e:
+            logger.warning(f"Could not cache optimized model for {model_path}: {e}")
+        return session
+
+    def cached_model_path(self, model_path: str, options: onnxruntime.SessionOptions) -> str:
+        """Cache file for ``model_path`` under the given options; any input to the optimizer changes the key."""
+        digest = hashlib.sha256()
+        with open(model_path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+
+        # Optimizations at the 'all' level lay out weights for this CPU, so the machine is part of the key too
+        key = json.dumps({
+            "model": digest.hexdigest(),
+            "onnxruntime": onnxruntime.__version__,
+            "providers": self.providers,
+            "graph_optimization": self.settings.get("graph_optimization", "all"),
+            "execution_mode": self.settings.get("execution_mode", "sequential"),
+            "intra_op_threads": options.intra_op_num_threads,
+            "machine": [platform.machine(), platform.processor()],
+        }, sort_keys=True)
+        key_hash = hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+        name = os.path.splitext(os.path.basename(model_path))[0]
+        return os.path.join(self._cache_dir(model_path), f"{name}.{key_hash}.onnx")
+
+    def derived_model_path(self, model_path: str, kind: str) -> str:
+        """Where a rewritten copy of ``model_path`` (e.g. kind ``dynamic``) is kept, out of the weights dir itself."""
+        name = os.path.splitext(os.path.basename(model_path))[0]
+        return os.path.join(self._cache_dir(model_path), f"{name}.{kind}.onnx")
+
+    def _cache_dir(self, model_path: str) -> str:
+        if os.path.isabs(self.cache_dir):
+            return self.cache_dir
+        model_dir = os.path.dirname(os.path.abspath(model_path))
+        cache_dir = os.path.normpath(self.cache_dir)
+        if model_dir.endswith(os.sep + cache_dir):
+            # A derived copy already in the cache; its optimized graph goes next to it
+            return model_dir
+        return os.path.join(model_dir, cache_dir)
@@ -1,10 +1,11 @@
 import os
 import cv2
 import numpy as np
-import onnxruntime
 import torch
 
+from models.onnx_session import SessionFactory, resolve_model_path
 from utils.helpers import distance2bbox, distance2kps
+from utils.metrics import timed
 from typing import Tuple
 
 __all__ = ["SCRFD"]
@@ -21,7 +22,10 @@ class SCRFD:
         model_path: str,
         input_size: Tuple[int] = (640, 640),
         conf_thres: float = 0.5,
-        iou_thres: float = 0.4
+        iou_thres: float = 0.4,
+        session_factory: SessionFactory = None,
+        session_group: int = 0,
+        quantized: bool = False
     ) -> None:
         """SCRFD initialization
 
@@ -30,6 +34,9 @@ class SCRFD:
             input_size (int): Input image size. Defaults to (640, 640)
             conf_thres (float, optional): Confidence threshold. Defaults to 0.5.
             iou_thres (float, optional): Non-max supression (NMS) threshold. Defaults to 0.4.
+            session_factory (SessionFactory, optional): Builds the ONNX Runtime session. Defaults to the shared config.
+            session_group (int, optional): Core slice for the session's threads. Defaults to 0.
+            quantized (bool, optional): Load the INT8 variant made by tools/quantize.py. Defaults to False.
         """
 
         self.input_size = input_size
@@ -48,19 +55,21 @@ class SCRFD:
         self.center_cache = {}
         # ---------------------------------
 
-        self._initialize_model(model_path=model_path)
+        self.quantized = quantized
+        model_path = resolve_model_path(model_path, quantized)
+        self._initialize_model(model_path=model_path, session_factory=session_factory, session_group=session_group)
 
-    def _initialize_model(self, model_path: str):
+    def _initialize_model(self, model_path: str, session_factory: SessionFactory = None, session_group: int = 0):
         """Initialize the model from the given path.
 
         Args:
             model_path (str): Path to .onnx model.
+            session_factory (SessionFactory, optional): Builds the ONNX Runtime session.
+            session_group (int, optional): Core slice for the session's threads.
         """
         try:
-            self.session = onnxruntime.InferenceSession(
-                model_path,
-                providers=["CUDAExecutionProvider", "CPUExecutionProvider"]
-            )
+            session_factory = session_factory or SessionFactory()
+            self.session = session_factory.create(model_path, group=session_group)
             # Get model info
             self.output_names = [x.name for x in self.session.get_outputs()]
             self.input_names = [x.name for x in self.session.get_inputs()]
@@ -69,22 +78,15 @@ class SCRFD:
             raise
 
     def forward(self, image, threshold):
+        blob = self.make_blob(image)
+        outputs = self.session.run(self.output_names, {self.input_names[0]: blob})
+        return self.decode(outputs, blob.shape[2], blob.shape[3], threshold)
+
+    def decode(self, outputs, input_height, input_width, threshold):
+        """Turn raw head outputs into per-stride (scores, bboxes, keypoints) above ``threshold``."""
         scores_list = []
         bboxes_list = []
         kpss_list = []
-        input_size = tuple(image.shape[0:2][::-1])
-
-        blob = cv2.dnn.blobFromImage(
-            image,
-            1.0 / self.std,
-            input_size,
-            (self.mean, self.mean, self.mean),
-            swapRB=True
-        )
-        outputs = self.session.run(self.output_names, {self.input_names[0]: blob})
-
-        input_height = blob.shape[2]
-        input_width = blob.shape[3]
 
         fmc = self.fmc
         for idx, stride in enumerate(self._feat_stride_fpn):
@@ -120,8 +122,20 @@ class SCRFD:
                 kpss_list.append(pos_kpss)
         return scores_list, bboxes_list, kpss_list
 
-    def detect(self, image, max_num=0, metric="max"):
-        width, height = self.input_size
+    def make_blob(self, image):
+        """Normalized NCHW input for an already letterboxed image."""
+        input_size = tuple(image.shape[0:2][::-1])
+        return cv2.dnn.blobFromImage(
+            image,
+            1.0 / self.std,
+            input_size,
+            (self.mean, self.mean, self.mean),
+            swapRB=True
+        )
+
+    def letterbox(self, image, input_size=None):
+        """Resize ``image`` into the model input, keeping its aspect ratio. Returns (det_image, det_scale)."""
+        width, height = input_size or self.input_size
 
         im_ratio = float(image.shape[0]) / image.shape[1]
         model_ratio = height / width
@@ -137,26 +151,36 @@ class SCRFD:
 
         det_image = np.zeros((height, width, 3), dtype=np.uint8)
         det_image[:new_height, :new_width, :] = resized_image
+        return det_image, det_scale
 
-        scores_list, bboxes_list, kpss_list = self.forward(det_image, self.conf_thres)
+    def detect(self, image, max_num=0, metric="max"):
+        with timed("letterbox"):
+            det_image, det_scale = self.letterbox(image)
+            blob = self.make_blob(det_image)
 
-        scores = np.vstack(scores_list)
-        scores_ravel = scores.ravel()
-        order = scores_ravel.argsort()[::-1]
-        bboxes = np.vstack(bboxes_list) / det_scale
+        with timed("scrfd_inference"):
+            outputs = self.session.run(self.output_names, {self.input_names[0]: blob})
 
-        if self.use_kps:
-            kpss = np.vstack(kpss_list) / det_scale
+        with timed("scrfd_decode_nms"):
+            scores_list, bboxes_list, kpss_list = self.decode(outputs, blob.shape[2], blob.shape[3], self.conf_thres)
 
-        pre_det = np.hstack((bboxes, scores)).astype(np.float32, copy=False)
-        pre_det = pre_det[order, :]
-        keep = self.nms(pre_det, iou_thres=self.iou_thres)
-        det = pre_det[keep, :]
-        if self.use_kps:
-            kpss = kpss[order, :, :]
-            kpss = kpss[keep, :, :]
-        else:
-            kpss = None
+            scores = np.vstack(scores_list)
+            scores_ravel = scores.ravel()
+            order = scores_ravel.argsort()[::-1]
+            bboxes = np.vstack(bboxes_list) / det_scale
+
+            if self.use_kps:
+                kpss = np.vstack(kpss_list) / det_scale
+
+            pre_det = np.hstack((bboxes, scores)).astype(np.float32, copy=False)
+            pre_det = pre_det[order, :]
+            keep = self.nms(pre_det, iou_thres=self.iou_thres)
+            det = pre_det[keep, :]
+            if self.use_kps:
+                kpss = kpss[order, :, :]
+                kpss = kpss[keep, :, :]
+            else:
+                kpss = None
         if 0 < max_num < det.shape[0]:
             area = (det[:, 2] - det[:, 0]) * (det[:, 3] - det[:, 1])
             image_center = image.shape[0] // 2, image.shape[1] // 2
@@ -219,36 +243,32 @@ class SCRFD:
 
         input_size = self.input_size if input_size is None else input_size
 
-        im_ratio = float(image.shape[0]) / image.shape[1]
-        model_ratio = float(input_size[1]) / input_size[0]
-        if im_ratio > model_ratio:
-            new_height = input_size[1]
-            new_width = int(new_height / im_ratio)
-        else:
-            new_width = input_size[0]
-            new_height = int(new_width * im_ratio)
-        det_scale = float(new_height) / image.shape[0]
-        resized_img = cv2.resize(image, (new_width, new_height))
-        det_img = np.zeros((input_size[1], input_size[0], 3), dtype=np.uint8)
-        det_img[:new_height, :new_width, :] = resized_img
-
-        scores_list, bboxes_list, kpss_list = self.forward(det_img, thresh)
-
-        scores = np.vstack(scores_list)
-        scores_ravel = scores.ravel()
-        order = scores_ravel.argsort()[::-1]
-        bboxes = np.vstack(bboxes_list)
-        if self.use_kps:
-            kpss = np.vstack(kpss_list)
-        pre_det = np.hstack((bboxes, scores)).astype(np.float32, copy=False)
-        pre_det = pre_det[order, :]
-        keep = self.nms(pre_det,0.4)
-        det = pre_det[keep, :]
-        if self.use_kps:
-            kpss = kpss[order, :, :]
-            kpss = kpss[keep, :, :]
-        else:
-            kpss = None
+        with timed("letterbox"):
+            det_img, det_scale = self.letterbox(image, input_size)
+            blob = self.make_blob(det_img)
+        img_info["det_scale"] = det_scale
+
+        with timed("scrfd_inference"):
+            outputs = self.session.run(self.output_names, {self.input_names[0]: blob})
+
+        with timed("scrfd_decode_nms"):
+            scores_list, bboxes_list, kpss_list = self.decode(outputs, blob.shape[2], blob.shape[3], thresh)
+
+            scores = np.vstack(scores_list)
+            scores_ravel = scores.ravel()
+            order = scores_ravel.argsort()[::-1]
+            bboxes = np.vstack(bboxes_list)
+            if self.use_kps:
+                kpss = np.vstack(kpss_list)
+            pre_det = np.hstack((bboxes, scores)).astype(np.float32, copy=False)
+            pre_det = pre_det[order, :]
+            keep = self.nms(pre_det,0.4)
+            det = pre_det[keep, :]
+            if self.use_kps:
+                kpss = kpss[order, :, :]
+                kpss = kpss[keep, :, :]
+            else:
+                kpss = None
         if max_num > 0 and det.shape[0] > max_num:
             area = (det[:, 2] - det[:, 0]) * (det[:, 3] - det[:, 1])
             img_center = image.shape[0] // 2, image.shape[1] // 2
@@ -0,0 +1,30 @@
+import datetime
+import os
+import sys
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database import AttendanceDatabase  # noqa: E402
+
+
+def embeddings(count, seed=0):
+    """``count`` random unit-length 512-d face embeddings."""
+    rng = np.random.default_rng(seed)
+    matrix = rng.standard_normal((count, 512)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def session_timestamp(hour=7, minute=20, second=30):
+    """Unix time today inside the first scheduled session (07:20-08:05) unless told otherwise."""
+    return datetime.datetime.combine(datetime.date.today(), datetime.time(hour, minute, second)).timestamp()
+
+
+@pytest.fixture
+def attendance_db(tmp_path):
+    db = AttendanceDatabase(db_path=str(tmp_path / "attendance.db"))
+    yield db
+    db.close()
@@ -0,0 +1,108 @@
+import sqlite3
+
+from conftest import session_timestamp
+
+
+def count_sessions(db, name, status=None):
+    with db.get_connection() as conn:
+        query = """
+            SELECT COUNT(*) FROM attendance_sessions a JOIN students s ON a.student_id = s.id
+            WHERE s.name = ?
+        """
+        params = [name]
+        if status:
+            query += " AND a.status = ?"
+            params.append(status)
+        return conn.execute(query, params).fetchone()[0]
+
+
+def test_apply_events_commits_a_batch(attendance_db):
+    ts = session_timestamp()
+    assert attendance_db.apply_events([
+        {"seq": 1, "kind": "entry", "name": "alice", "ts": ts},
+        {"seq": 2, "kind": "entry", "name": "bob", "ts": ts + 1},
+        {"seq": 3, "kind": "exit", "name": "alice", "ts": ts + 120},
+    ])
+
+    assert attendance_db.get_journal_seq() == 3
+    assert count_sessions(attendance_db, "alice", "left") == 1
+    assert attendance_db.get_current_status("alice") == "absent"
+    assert attendance_db.get_current_status("bob") == "present"
+
+
+def test_nested_connection_blocks_share_the_outer_transaction(attendance_db):
+    with attendance_db.get_connection() as conn:
+        conn.execute("INSERT INTO students (name) VALUES ('carol')")
+        with attendance_db.get_connection():
+            pass
+        # The inner block must not have committed: a second connection cannot see the row yet
+        other = attendance_db.open_read_connection()
+        try:
+            assert other.execute("SELECT COUNT(*) FROM students WHERE name = 'carol'").fetchone()[0] == 0
+        finally:
+            other.close()
+        conn.rollback()
+
+    with attendance_db.get_connection() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM students WHERE name = 'carol'").fetchone()[0] == 0
+
+
+def test_failed_batch_rolls_back_events_applied_before_the_failure(attendance_db, monkeypatch):
+    ts = session_timestamp()
+    assert attendance_db.apply_events([{"seq": 1, "kind": "entry", "name": "alice", "ts": ts}])
+
+    record_entry = attendance_db._record_entry
+
+    def failing_entry(cursor, name, current_datetime):
+        # A schedule reload mid-batch opens its own get_connection() block
+        attendance_db._load_schedule()
+        if name == "bob":
+            raise sqlite3.OperationalError("simulated failure")
+        return record_entry(cursor, name, current_datetime)
+
+    monkeypatch.setattr(attendance_db, "_record_entry", failing_entry)
+    batch = [
+        {"seq": 2, "kind": "exit", "name": "alice", "ts": ts + 60},
+        {"seq": 3, "kind": "entry", "name": "bob", "ts": ts + 61},
+    ]
+    assert not attendance_db.apply_events(batch)
+
+    # Nothing of the failed batch is visible, including alice's exit that ran before the failure
+    assert attendance_db.get_journal_seq() == 1
+    assert attendance_db.get_current_status("alice") == "present"
+    assert count_sessions(attendance_db, "alice", "present") == 1
+    assert count_sessions(attendance_db, "bob") == 0
+
+    # Retrying the whole batch applies every event exactly once
+    monkeypatch.setattr(attendance_db, "_record_entry", record_entry)
+    assert attendance_db.apply_events(batch)
+    assert attendance_db.get_journal_seq() == 3
+    assert count_sessions(attendance_db, "alice", "left") == 1
+    assert count_sessions(attendance_db, "bob", "present") == 1
+
+
+def test_schedule_reloads_only_when_class_schedule_changes(tmp_path, monkeypatch):
+    from database import AttendanceDatabase
+
+    db = AttendanceDatabase(db_path=str(tmp_path / "attendance.db"), schedule_refresh_seconds=0)
+    try:
+        loads = []
+        load_schedule = db._load_schedule
+        monkeypatch.setattr(db, "_load_schedule", lambda: (loads.append(1), load_schedule()))
+
+        ts = session_timestamp()
+        assert db.apply_events([{"seq": 1, "kind": "entry", "name": "alice", "ts": ts},
+                                {"seq": 2, "kind": "exit", "name": "alice", "ts": ts + 60}])
+        db.get_current_session_time()
+        assert loads == []
+
+        # An edit from another connection (another process, the sqlite3 shell) is picked up
+        other = sqlite3.connect(db.db_path)
+        with other:
+            other.execute("UPDATE class_schedule SET start_time = '07:30:00' WHERE session_number = 1")
+        other.close()
+        db.get_current_session_time()
+        assert loads == [1]
+        assert db._schedule[1][0]["start_time"].strftime("%H:%M") == "07:30"
+    finally:
+        db.close()
@@ -0,0 +1,115 @@
+import json
+
+from conftest import session_timestamp
+from database import AttendanceWriter
+
+
+def write_journal(path, lines):
+    with open(path, "w", encoding="utf-8") as f:
+        for line in lines:
+            f.write((line if isinstance(line, str) else json.dumps(line)) + "\n")
+
+
+def test_replay_applies_only_uncommitted_journal_events(attendance_db, tmp_path):
+    ts = session_timestamp()
+    attendance_db.apply_events([{"seq": 1, "kind": "entry", "name": "alice", "ts": ts}])
+    journal = str(tmp_path / "attendance.journal")
+    write_journal(journal, [
+        {"seq": 1, "kind": "entry", "name": "alice", "ts": ts},
+        {"seq": 2, "kind": "entry", "name": "bob", "ts": ts + 1},
+        {"seq": 3, "kind": "exit", "name": "alice", "ts": ts + 60},
+        {"seq": 4, "kind": "entry"},      # malformed: skipped, not fatal
+        '{"seq": 5, "kind": "ent',        # torn by a crash mid-write
+    ])
+
+    writer = AttendanceWriter(attendance_db, journal_path=journal, batch_interval=0.05)
+    try:
+        assert attendance_db.get_journal_seq() == 3
+        assert attendance_db.get_current_status("alice") == "absent"
+        assert attendance_db.get_current_status("bob") == "present"
+        with open(journal, encoding="utf-8") as f:
+            assert f.read() == ""
+
+        # New events continue the sequence after everything seen in the journal
+        writer.record_entry("carol")
+    finally:
+        writer.close()
+    assert attendance_db.get_journal_seq() == 4
+    assert attendance_db.get_current_status("carol") == "present"
+
+
+def test_writer_survives_a_batch_that_raises(attendance_db, tmp_path, monkeypatch):
+    apply_events = attendance_db.apply_events
+    calls = []
+
+    def flaky_apply(events):
+        calls.append(len(events))
+        if len(calls) == 1:
+            raise ValueError("bad event")
+        return apply_events(events)
+
+    monkeypatch.setattr(attendance_db, "apply_events", flaky_apply)
+    clock = [session_timestamp()]
+    writer = AttendanceWriter(attendance_db, journal_path=str(tmp_path / "attendance.journal"),
+                              batch_interval=0.05, clock=lambda: clock[0])
+    try:
+        writer.record_entry("alice")
+        while not calls:
+            writer._thread.join(0.01)
+        writer.record_entry("bob")
+    finally:
+        writer.close()
+
+    assert len(calls) == 2
+    assert attendance_db.get_current_status("alice") == "absent"
+    assert attendance_db.get_current_status("bob") == "present"
+    with open(tmp_path / "attendance.journal", encoding="utf-8") as f:
+        assert f.read() == ""
+
+
+def test_refused_batches_are_retried_and_never_dropped(attendance_db, tmp_path, monkeypatch):
+    apply_events = attendance_db.apply_events
+    refusals = [3]
+
+    def locked_apply(events):
+        if refusals[0]:
+            refusals[0] -= 1
+            return False  # what apply_events reports for "database is locked"
+        return apply_events(events)
+
+    monkeypatch.setattr(attendance_db, "apply_events", locked_apply)
+    writer = AttendanceWriter(attendance_db, journal_path=str(tmp_path / "attendance.journal"),
+                              batch_interval=0.01, clock=session_timestamp)
+    try:
+        writer.record_entry("alice")
+        while refusals[0]:
+            writer._thread.join(0.01)
+        writer.record_entry("bob")
+    finally:
+        writer.close()
+
+    assert attendance_db.get_current_status("alice") == "present"
+    assert attendance_db.get_current_status("bob") == "present"
+    assert attendance_db.get_journal_seq() == 2
+
+
+def test_closing_with_a_locked_database_keeps_the_journal_for_replay(attendance_db, tmp_path, monkeypatch):
+    journal = str(tmp_path / "attendance.journal")
+    apply_events = attendance_db.apply_events
+    monkeypatch.setattr(attendance_db, "apply_events", lambda events: False)
+    writer = AttendanceWriter(attendance_db, journal_path=journal, batch_interval=0.01, max_retries=2,
+                              clock=session_timestamp)
+    writer.record_entry("alice")
+    writer.record_entry("bob")
+    writer.close()
+    writer.record_entry("carol")  # ignored, not written to the closed journal
+
+    assert attendance_db.get_journal_seq() == 0
+    with open(journal, encoding="utf-8") as f:
+        assert [json.loads(line)["name"] for line in f] == ["alice", "bob"]
+
+    monkeypatch.setattr(attendance_db, "apply_events", apply_events)
+    AttendanceWriter(attendance_db, journal_path=journal).close()
+    assert attendance_db.get_current_status("alice") == "present"
+    assert attendance_db.get_current_status("bob") == "present"
+    assert attendance_db.get_journal_seq() == 2
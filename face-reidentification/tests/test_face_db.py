@@ -0,0 +1,48 @@
+import pytest
+
+from conftest import embeddings
+from database import FaceDatabase
+
+
+@pytest.fixture
+def open_db(tmp_path):
+    """Open (and load) databases on one directory, as the API and main.py processes do."""
+    opened = []
+
+    def open_db():
+        db = FaceDatabase(db_path=str(tmp_path / "face_database"), max_workers=1, checkpoint_interval=3600)
+        db.load()
+        opened.append(db)
+        return db
+
+    yield open_db
+    for db in opened:
+        db.close()
+
+
+def test_checkpoint_keeps_records_another_process_appended(open_db):
+    vectors = embeddings(3)
+    main_db, api_db = open_db(), open_db()
+
+    api_db.add_face(vectors[0], "alice")  # appended after main_db loaded
+    main_db.add_face(vectors[1], "bob")
+    main_db.save()  # restarts the log that held alice
+    api_db.add_face(vectors[2], "carol")  # api_db notices the restart and picks up the checkpoint first
+
+    assert sorted(open_db().metadata) == ["alice", "bob", "carol"]
+    assert sorted(api_db.metadata) == ["alice", "bob", "carol"]
+    assert api_db.search(vectors[1])[0] == "bob"
+
+
+def test_rebuild_replaces_the_database_in_place(open_db):
+    vectors = embeddings(3)
+    db = open_db()
+    db.add_face(vectors[0], "alice")
+    db.delete_face("alice")
+    db.add_face(vectors[1], "bob")
+
+    db.replace_all(vectors[1:], ["bob", "carol"])
+
+    assert db.metadata == ["bob", "carol"]
+    assert db.search(vectors[2])[0] == "carol"
+    assert open_db().metadata == ["bob", "carol"]
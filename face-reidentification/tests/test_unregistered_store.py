@@ -0,0 +1,132 @@
+import os
+import threading
+
+import numpy as np
+
+from conftest import embeddings
+from database import UnregisteredFaceStore
+
+
+def reopen(path):
+    store = UnregisteredFaceStore(str(path))
+    assert store.load()
+    return store
+
+
+def test_changes_persist_without_rewriting_the_store(tmp_path):
+    store = UnregisteredFaceStore(str(tmp_path))
+    vectors = embeddings(5)
+    for i, vector in enumerate(vectors):
+        store.add(f"face{i}", vector)
+    rows_file = store.rows_file
+    size = os.path.getsize(store.log_file)
+
+    store.remove("face1")  # face4 is swapped into row 1
+    store.remove("face4")
+    store.add("face5", vectors[1])
+
+    # Nothing was rewritten: the row file is the same, the log only grew
+    assert store.rows_file == rows_file
+    assert os.path.getsize(store.log_file) > size
+    store.close()
+
+    reloaded = reopen(tmp_path)
+    assert sorted(reloaded.face_ids()) == ["face0", "face2", "face3", "face5"]
+    for face_id, row in (("face0", 0), ("face2", 2), ("face3", 3), ("face5", 1)):
+        np.testing.assert_array_equal(reloaded[face_id], vectors[row])
+    assert reloaded.find_duplicate(vectors[3], 0.9)[0] == "face3"
+    reloaded.close()
+
+
+def test_log_is_compacted_into_a_new_row_file(tmp_path):
+    store = UnregisteredFaceStore(str(tmp_path), compact_factor=1)
+    vectors = embeddings(40)
+    for i, vector in enumerate(vectors):
+        store.add(f"face{i}", vector)
+        if i % 2:
+            store.remove(f"face{i - 1}")
+    assert os.path.basename(store.rows_file) != "embeddings-0.f32"
+    assert [f for f in os.listdir(tmp_path) if f.endswith(".f32")] == [os.path.basename(store.rows_file)]
+    store.close()
+
+    reloaded = reopen(tmp_path)
+    assert sorted(reloaded.face_ids()) == sorted(f"face{i}" for i in range(1, 40, 2))
+    np.testing.assert_array_equal(reloaded["face39"], vectors[39])
+    reloaded.close()
+
+
+def test_torn_log_line_is_dropped_and_later_appends_survive(tmp_path):
+    store = UnregisteredFaceStore(str(tmp_path))
+    vectors = embeddings(3)
+    store.add("face0", vectors[0])
+    store.add("face1", vectors[1])
+    store.close()
+    with open(store.log_file, "ab") as f:
+        f.write(b'{"row": 2, "id": "fa')
+
+    reloaded = reopen(tmp_path)
+    assert reloaded.face_ids() == ["face0", "face1"]
+    reloaded.add("face2", vectors[2])
+    reloaded.close()
+    assert reopen(tmp_path).face_ids() == ["face0", "face1", "face2"]
+
+
+def test_reads_do_not_wait_for_a_writer_holding_the_persistence_lock(tmp_path):
+    store = UnregisteredFaceStore(str(tmp_path))
+    vectors = embeddings(2)
+    store.add("face0", vectors[0])
+
+    held, release = threading.Event(), threading.Event()
+
+    def slow_writer():
+        with store.lock:
+            held.set()
+            release.wait(5)
+
+    writer = threading.Thread(target=slow_writer)
+    writer.start()
+    held.wait(5)
+    try:
+        result = []
+        reader = threading.Thread(target=lambda: result.append(store.find_duplicate(vectors[0], 0.9)))
+        reader.start()
+        reader.join(1)
+        assert result and result[0][0] == "face0"
+        assert "face0" in store
+    finally:
+        release.set()
+        writer.join()
+        store.close()
+
+
+def test_concurrent_claims_and_adds_of_one_face_succeed_once(tmp_path):
+    store = UnregisteredFaceStore(str(tmp_path), fsync=False)
+    vector = embeddings(1)[0]
+    start = threading.Barrier(8)
+
+    def race(call):
+        results = []
+
+        def run(i):
+            start.wait(5)
+            results.append(call(i))
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    try:
+        duplicates = race(lambda i: store.add_if_unique(f"upload{i}", vector, 0.9))
+        assert sum(duplicate is None for duplicate in duplicates) == 1
+        assert len(store) == 1
+
+        face_id = store.face_ids()[0]
+        claims = race(lambda i: store.pop(face_id))
+        assert sum(claim is not None for claim in claims) == 1
+        assert len(store) == 0 and store.pop(face_id) is None
+    finally:
+        store.close()
+    assert reopen(tmp_path).face_ids() == []
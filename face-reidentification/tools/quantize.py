@@ -0,0 +1,284 @@
+"""Static INT8 quantization of the detector, recognizer and anti-spoofing models.
+
+Local face images are split into a calibration set and a held-out set. Each model
+is quantized (QDQ, per-channel INT8 weights, UINT8 activations) with inputs taken
+from the calibration images, then compared against its FP32 original on the
+held-out images:
+
+    det    detections matched by IoU: recall of FP32 faces and mean IoU of matches
+    rec    cosine similarity between FP32 and INT8 embeddings of the same aligned face
+    spoof  agreement of the real/fake decision and mean largest probability change
+
+A variant is only published next to the original (``<name>.int8.onnx``, loaded
+with ``--int8`` / ``USE_INT8_MODELS=1``) when every metric is within tolerance;
+its metrics are written to ``<name>.int8.json``.
+
+Usage (from the face-reidentification directory):
+    python tools/quantize.py --images ./assets/faces
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+import cv2
+import numpy as np
+import onnx
+from onnx import version_converter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static  # noqa: E402
+from onnxruntime.quantization.shape_inference import quant_pre_process  # noqa: E402
+
+from models import SCRFD, ArcFace, AntiSpoof, SessionFactory  # noqa: E402
+from models.onnx_session import quantized_model_path  # noqa: E402
+from utils.helpers import face_alignment, increased_crop  # noqa: E402
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build and validate INT8 model variants")
+    parser.add_argument("--images", type=str, default="./assets/faces", help="Directory of local face images")
+    parser.add_argument("--models", nargs="+", choices=["det", "rec", "spoof"], default=["det", "rec", "spoof"])
+    parser.add_argument("--det-weight", type=str, default="./weights/det_500m.onnx")
+    parser.add_argument("--rec-weight", type=str, default="./weights/w600k_mbf.onnx")
+    parser.add_argument("--spoof-weight", type=str, default="./weights/AntiSpoofing_bin_1.5_128.onnx")
+    parser.add_argument("--holdout", type=float, default=0.2, help="Fraction of images kept for evaluation")
+    parser.add_argument("--max-calibration", type=int, default=200, help="Calibration samples per model")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--force", action="store_true", help="Replace an existing INT8 variant")
+
+    # Accuracy gate
+    parser.add_argument("--min-det-recall", type=float, default=0.95)
+    parser.add_argument("--min-det-iou", type=float, default=0.90)
+    parser.add_argument("--min-rec-cosine", type=float, default=0.98, help="Mean FP32/INT8 embedding cosine")
+    parser.add_argument("--min-rec-cosine-worst", type=float, default=0.95, help="Lowest single-face cosine")
+    parser.add_argument("--min-spoof-agreement", type=float, default=0.98)
+    parser.add_argument("--max-spoof-prob-delta", type=float, default=0.05)
+    return parser.parse_args()
+
+
+class ListDataReader(CalibrationDataReader):
+    """Feeds pre-computed input tensors to the calibrator one at a time."""
+
+    def __init__(self, input_name, tensors):
+        self.input_name = input_name
+        self.tensors = tensors
+        self.position = 0
+
+    def get_next(self):
+        if self.position >= len(self.tensors):
+            return None
+        tensor = self.tensors[self.position]
+        self.position += 1
+        return {self.input_name: tensor}
+
+    def rewind(self):
+        self.position = 0
+
+
+def list_images(directory):
+    paths = []
+    for dirpath, _, filenames in os.walk(directory):
+        paths.extend(os.path.join(dirpath, f) for f in filenames if f.lower().endswith(IMAGE_EXTENSIONS))
+    return sorted(paths)
+
+
+def load_faces(paths, detector):
+    """Read each image and detect its faces with the FP32 detector."""
+    samples = []
+    for path in paths:
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        bboxes, kpss = detector.detect(image)
+        samples.append((image, bboxes, kpss))
+    return samples
+
+
+def calibration_inputs(kind, samples, models, limit):
+    detector, recognizer, anti_spoofing = models
+    tensors = []
+    for image, bboxes, kpss in samples:
+        if kind == "det":
+            tensors.append(detector.make_blob(detector.letterbox(image)[0]))
+        for bbox, kps in zip(bboxes, kpss):
+            if kind == "rec":
+                tensors.append(recognizer.preprocess(face_alignment(image, kps)[0]))
+            elif kind == "spoof":
+                tensors.append(anti_spoofing.preprocessing(increased_crop(image, bbox)))
+        if len(tensors) >= limit:
+            break
+    return tensors[:limit]
+
+
+def box_iou(box, boxes):
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / np.maximum(area + areas - inter, 1e-9)
+
+
+def evaluate_det(candidate, samples):
+    matched, total, ious = 0, 0, []
+    for image, bboxes, _ in samples:
+        candidate_bboxes, _ = candidate.detect(image)
+        total += len(bboxes)
+        if len(candidate_bboxes) == 0:
+            continue
+        for bbox in bboxes:
+            best = float(box_iou(bbox, candidate_bboxes).max())
+            if best >= 0.5:
+                matched += 1
+                ious.append(best)
+    return {"faces": total, "recall": matched / total if total else 1.0,
+            "mean_iou": float(np.mean(ious)) if ious else 0.0}
+
+
+def evaluate_rec(candidate, reference, samples):
+    cosines = []
+    for image, _, kpss in samples:
+        for kps in kpss:
+            a = reference.get_embedding(image, kps, normalized=True)
+            b = candidate.get_embedding(image, kps, normalized=True)
+            cosines.append(float(np.dot(a, b)))
+    return {"faces": len(cosines), "mean_cosine": float(np.mean(cosines)) if cosines else 0.0,
+            "worst_cosine": float(np.min(cosines)) if cosines else 0.0}
+
+
+def evaluate_spoof(candidate, reference, samples):
+    agree, deltas = [], []
+    for image, bboxes, _ in samples:
+        crops = [increased_crop(image, bbox) for bbox in bboxes]
+        if not crops:
+            continue
+        for a, b in zip(reference(crops), candidate(crops)):
+            agree.append(int(np.argmax(a)) == int(np.argmax(b)))
+            deltas.append(float(np.abs(np.asarray(a) - np.asarray(b)).max()))
+    return {"faces": len(agree), "agreement": float(np.mean(agree)) if agree else 0.0,
+            "mean_prob_delta": float(np.mean(deltas)) if deltas else 1.0}
+
+
+def gate(kind, metrics, args):
+    """Return the list of failed checks for a candidate's metrics."""
+    if metrics["faces"] == 0:
+        return ["no faces in the held-out images"]
+    checks = {
+        "det": [("recall", metrics.get("recall"), args.min_det_recall, ">="),
+                ("mean_iou", metrics.get("mean_iou"), args.min_det_iou, ">=")],
+        "rec": [("mean_cosine", metrics.get("mean_cosine"), args.min_rec_cosine, ">="),
+                ("worst_cosine", metrics.get("worst_cosine"), args.min_rec_cosine_worst, ">=")],
+        "spoof": [("agreement", metrics.get("agreement"), args.min_spoof_agreement, ">="),
+                  ("mean_prob_delta", metrics.get("mean_prob_delta"), args.max_spoof_prob_delta, "<=")],
+    }[kind]
+    return [f"{name} {value:.4f} (needs {op} {limit})" for name, value, limit, op in checks
+            if (value < limit if op == ">=" else value > limit)]
+
+
+def quantize_model(model_path, output_path, input_name, tensors):
+    with tempfile.TemporaryDirectory() as workdir:
+        # Per-channel DequantizeLinear needs opset 13; older exports are upgraded first when possible
+        model = onnx.load(model_path)
+        opset = next((o.version for o in model.opset_import if o.domain in ("", "ai.onnx")), 0)
+        per_channel = opset >= 13
+        if not per_channel:
+            try:
+                model = version_converter.convert_version(model, 13)
+                per_channel = True
+            except Exception as e:
+                print(f"  could not upgrade opset {opset} to 13 ({e}); using per-tensor weights")
+        upgraded = os.path.join(workdir, "upgraded.onnx")
+        onnx.save(model, upgraded)
+
+        prepared = os.path.join(workdir, "prepared.onnx")
+        quant_pre_process(upgraded, prepared, skip_symbolic_shape=True)
+        quantize_static(prepared, output_path, ListDataReader(input_name, tensors),
+                        quant_format=QuantFormat.QDQ, activation_type=QuantType.QUInt8,
+                        weight_type=QuantType.QInt8, per_channel=per_channel)
+
+
+def main():
+    args = parse_args()
+    paths = list_images(args.images)
+    if len(paths) < 2:
+        raise SystemExit(f"Need at least two images under {args.images}")
+
+    random.Random(args.seed).shuffle(paths)
+    holdout = max(1, int(len(paths) * args.holdout))
+    calibration_paths, evaluation_paths = paths[holdout:], paths[:holdout]
+    print(f"{len(calibration_paths)} calibration / {len(evaluation_paths)} held-out images")
+
+    # Candidates are temporary files, so keep them out of the optimized-model cache
+    session_factory = SessionFactory()
+    session_factory.cache_enabled = False
+    detector = SCRFD(args.det_weight, session_factory=session_factory)
+    models = (detector,
+              ArcFace(args.rec_weight, session_factory=session_factory) if "rec" in args.models else None,
+              AntiSpoof(args.spoof_weight, session_factory=session_factory) if "spoof" in args.models else None)
+    calibration = load_faces(calibration_paths, detector)
+    evaluation = load_faces(evaluation_paths, detector)
+
+    weights = {"det": args.det_weight, "rec": args.rec_weight, "spoof": args.spoof_weight}
+    failed = False
+    for kind in args.models:
+        model_path = weights[kind]
+        target = quantized_model_path(model_path)
+        if os.path.exists(target) and not args.force:
+            print(f"[{kind}] {target} exists, skipping (use --force to rebuild)")
+            continue
+
+        tensors = calibration_inputs(kind, calibration, models, args.max_calibration)
+        if not tensors:
+            print(f"[{kind}] no calibration inputs found, skipping")
+            failed = True
+            continue
+
+        input_name = {"det": detector.input_names[0], "rec": models[1] and models[1].input_name,
+                      "spoof": models[2] and models[2].input_name}[kind]
+        # Candidates (and anything derived from them at load time) live in a scratch dir until accepted
+        scratch = tempfile.mkdtemp(prefix=".int8-candidate-", dir=os.path.dirname(os.path.abspath(target)))
+        candidate_path = os.path.join(scratch, os.path.basename(target))
+        try:
+            print(f"[{kind}] quantizing {model_path} with {len(tensors)} calibration inputs")
+            quantize_model(model_path, candidate_path, input_name, tensors)
+
+            if kind == "det":
+                metrics = evaluate_det(SCRFD(candidate_path, session_factory=session_factory), evaluation)
+            elif kind == "rec":
+                metrics = evaluate_rec(ArcFace(candidate_path, session_factory=session_factory), models[1],
+                                       evaluation)
+            else:
+                metrics = evaluate_spoof(AntiSpoof(candidate_path, session_factory=session_factory), models[2],
+                                         evaluation)
+
+            failures = gate(kind, metrics, args)
+            print(f"[{kind}] " + ", ".join(f"{k}={v:.4f}" if isinstance(v, float) else f"{k}={v}"
+                                           for k, v in metrics.items()))
+            if failures:
+                print(f"[{kind}] refused: " + "; ".join(failures))
+                failed = True
+                continue
+
+            os.replace(candidate_path, target)
+            with open(os.path.splitext(target)[0] + ".json", "w") as f:
+                json.dump({"source": os.path.basename(model_path), "calibration_inputs": len(tensors),
+                           "heldout_images": len(evaluation_paths), "metrics": metrics}, f, indent=2)
+            print(f"[{kind}] accepted: {target}")
+        finally:
+            shutil.rmtree(scratch, ignore_errors=True)
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
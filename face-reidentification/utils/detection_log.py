@@ -0,0 +1,88 @@
+import os
+import struct
+
+import numpy as np
+
+from typing import Iterator, NamedTuple
+
+# File header: magic, version. Each frame: header, then count x 5 float32 detections
+# (x1, y1, x2, y2, score in detector input coordinates) and count x 5 x 2 int16 landmarks
+# (frame coordinates), exactly what SCRFD.detect_tracking hands to the rest of the pipeline.
+LOG_MAGIC = b"FDLG"
+LOG_VERSION = 1
+FILE_HEADER = struct.Struct("<4sB")
+FRAME_HEADER = struct.Struct("<dHHfH")  # timestamp, frame height, frame width, det_scale, detection count
+
+
+class DetectionFrame(NamedTuple):
+    timestamp: float
+    height: int
+    width: int
+    det_scale: float
+    detections: np.ndarray  # (N, 5) float32
+    landmarks: np.ndarray   # (N, 5, 2) int32
+
+    @property
+    def bboxes(self) -> np.ndarray:
+        """Detections in frame coordinates, as ``detect_tracking`` returns them."""
+        return np.int32(self.detections / self.det_scale)
+
+
+class DetectionLogWriter:
+    """Appends per-frame detections to a compact binary log (about 40 bytes per face)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.frames = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "wb")
+        self._file.write(FILE_HEADER.pack(LOG_MAGIC, LOG_VERSION))
+
+    def write(self, timestamp: float, height: int, width: int, det_scale: float, detections, landmarks) -> None:
+        detections = np.asarray(detections, dtype=np.float32).reshape(-1, 5)
+        count = len(detections)
+        landmarks = np.asarray(landmarks).reshape(count, 5, 2) if count else np.empty((0, 5, 2))
+
+        self._file.write(FRAME_HEADER.pack(timestamp, height, width, det_scale, count))
+        self._file.write(detections.tobytes())
+        self._file.write(landmarks.astype(np.int16).tobytes())
+        self.frames += 1
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def read_detection_log(path: str) -> Iterator[DetectionFrame]:
+    """Yield the frames of a detection log in order; a torn last frame is ignored."""
+    with open(path, "rb") as f:
+        header = f.read(FILE_HEADER.size)
+        if len(header) < FILE_HEADER.size:
+            raise ValueError(f"{path} is not a detection log")
+        magic, version = FILE_HEADER.unpack(header)
+        if magic != LOG_MAGIC or version != LOG_VERSION:
+            raise ValueError(f"{path} is not a version {LOG_VERSION} detection log")
+
+        while True:
+            header = f.read(FRAME_HEADER.size)
+            if len(header) < FRAME_HEADER.size:
+                return
+            timestamp, height, width, det_scale, count = FRAME_HEADER.unpack(header)
+
+            detections_size, landmarks_size = count * 5 * 4, count * 10 * 2
+            body = f.read(detections_size + landmarks_size)
+            if len(body) < detections_size + landmarks_size:
+                return
+
+            detections = np.frombuffer(body, dtype=np.float32, count=count * 5).reshape(count, 5).copy()
+            landmarks = np.frombuffer(body, dtype=np.int16, count=count * 10,
+                                      offset=detections_size).reshape(count, 5, 2).astype(np.int32)
+            yield DetectionFrame(timestamp, height, width, det_scale, detections, landmarks)
@@ -0,0 +1,155 @@
+import cv2
+import numpy as np
+
+from typing import Dict, List, NamedTuple, Tuple
+
+
+class FaceQuality(NamedTuple):
+    size: float        # shorter side of the face box, in pixels
+    yaw: float         # estimated head yaw in degrees (0 is frontal)
+    sharpness: float   # variance of the Laplacian of the face at 112x112
+    score: float       # combined quality in [0, 1]
+    passed: bool       # every measure is within its threshold
+
+
+def estimate_yaw(landmarks: np.ndarray) -> float:
+    """
+    Estimate head yaw from the 5 SCRFD keypoints (eyes, nose, mouth corners).
+
+    The nose tip is projected onto the eye axis: on a frontal face it sits between
+    the eyes, and it moves towards (and past) one eye as the head turns.
+
+    Args:
+        landmarks (np.ndarray): Array of shape (5, 2).
+
+    Returns:
+        float: Yaw in degrees, in [-90, 90].
+    """
+    landmarks = np.asarray(landmarks, dtype=np.float32).reshape(5, 2)
+    left_eye, right_eye, nose = landmarks[0], landmarks[1], landmarks[2]
+
+    eye_axis = right_eye - left_eye
+    eye_distance = float(np.linalg.norm(eye_axis))
+    if eye_distance < 1e-6:
+        return 90.0
+
+    offset = float(np.dot(nose - (left_eye + right_eye) / 2, eye_axis / eye_distance)) / (eye_distance / 2)
+    return float(np.degrees(np.arcsin(np.clip(offset, -1.0, 1.0))))
+
+
+def estimate_sharpness(image: np.ndarray, bbox, size: int = 112) -> float:
+    """Variance of the Laplacian over the face box, resized to ``size`` so faces of any size compare."""
+    height, width = image.shape[:2]
+    x1, y1, x2, y2 = (int(v) for v in bbox[:4])
+    x1, y1 = max(0, x1), max(0, y1)
+    x2, y2 = min(width, x2), min(height, y2)
+    if x2 - x1 < 2 or y2 - y1 < 2:
+        return 0.0
+
+    face = image[y1:y2, x1:x2]
+    if face.ndim == 3:
+        face = cv2.cvtColor(face, cv2.COLOR_BGR2GRAY)
+    face = cv2.resize(face, (size, size), interpolation=cv2.INTER_AREA)
+    return float(cv2.Laplacian(face, cv2.CV_32F).var())
+
+
+def face_quality(
+    image: np.ndarray,
+    bbox,
+    landmarks: np.ndarray,
+    min_size: float = 40,
+    max_yaw: float = 45,
+    min_sharpness: float = 50
+) -> FaceQuality:
+    """
+    Score how usable a detected face is for recognition.
+
+    Each measure is mapped to [0, 1] (full marks at twice the size/sharpness threshold
+    and at zero yaw) and the score is their product, so one bad measure sinks it.
+
+    Args:
+        image (np.ndarray): Frame the face was detected in, or None to skip the sharpness measure
+            (replays of recorded detections have no pixels).
+        bbox: Face box (x1, y1, x2, y2[, score]).
+        landmarks (np.ndarray): The 5 keypoints of the face.
+        min_size (float): Smallest acceptable face side in pixels.
+        max_yaw (float): Largest acceptable yaw in degrees.
+        min_sharpness (float): Smallest acceptable Laplacian variance.
+
+    Returns:
+        FaceQuality: The individual measures, the combined score and whether the face passes.
+    """
+    size = float(min(bbox[2] - bbox[0], bbox[3] - bbox[1]))
+    yaw = estimate_yaw(landmarks)
+    if image is None:
+        sharpness = float("inf")
+    else:
+        sharpness = estimate_sharpness(image, bbox) if size > 0 else 0.0
+
+    score = (min(1.0, size / (2 * min_size)) if min_size > 0 else 1.0) \
+        * max(0.0, 1.0 - abs(yaw) / 90.0) \
+        * (min(1.0, sharpness / (2 * min_sharpness)) if min_sharpness > 0 else 1.0)
+    passed = size >= min_size and abs(yaw) <= max_yaw and sharpness >= min_sharpness
+    return FaceQuality(size, yaw, sharpness, float(score), passed)
+
+
+class TrackFaceSelector:
+    """
+    Picks which frame of each track gets embedded.
+
+    Faces that pass the quality gate are offered every frame; only the best one per
+    track is kept. A track is recognized once it has had a candidate for ``window``
+    seconds (or as soon as a candidate scores ``good_score``), and again whenever a
+    candidate beats the recognized one by ``min_gain`` or ``refresh`` seconds have passed.
+    """
+
+    def __init__(self, window: float = 0.5, good_score: float = 0.8, min_gain: float = 0.1,
+                 refresh: float = 5.0, ttl: float = 30.0):
+        self.window = window
+        self.good_score = good_score
+        self.min_gain = min_gain
+        self.refresh = refresh
+        self.ttl = ttl
+        # track_id: {'pending': (quality, face) or None, 'since': time, 'recognized_score': float or None,
+        #            'recognized_at': time, 'last_seen': time}
+        self.tracks: Dict[int, dict] = {}
+
+    def offer(self, track_id: int, quality: FaceQuality, face, now: float) -> None:
+        """Keep ``face`` as the track's candidate if it passes and beats the current one."""
+        state = self.tracks.setdefault(track_id, {'pending': None, 'since': now, 'recognized_score': None,
+                                                  'recognized_at': 0.0, 'last_seen': now})
+        state['last_seen'] = now
+        if not quality.passed:
+            return
+        pending = state['pending']
+        if pending is None:
+            state['pending'] = (quality, face)
+            state['since'] = now
+        elif quality.score > pending[0].score:
+            state['pending'] = (quality, face)
+
+    def due(self, now: float) -> List[Tuple[int, FaceQuality, object]]:
+        """Take the candidates that should be embedded now as (track_id, quality, face)."""
+        ready = []
+        for track_id, state in self.tracks.items():
+            pending = state['pending']
+            if pending is None:
+                continue
+            quality, face = pending
+            recognized_score = state['recognized_score']
+            if recognized_score is None:
+                take = quality.score >= self.good_score or now - state['since'] >= self.window
+            else:
+                take = quality.score >= recognized_score + self.min_gain \
+                    or now - state['recognized_at'] >= self.refresh
+            if take:
+                ready.append((track_id, quality, face))
+                state['pending'] = None
+                state['recognized_score'] = quality.score
+                state['recognized_at'] = now
+        return ready
+
+    def purge(self, now: float) -> None:
+        """Forget tracks not offered a face for ``ttl`` seconds."""
+        for track_id in [t for t, s in self.tracks.items() if now - s['last_seen'] > self.ttl]:
+            del self.tracks[track_id]
@@ -68,6 +68,52 @@ def face_alignment(image: np.ndarray, landmark: np.ndarray, image_size: int = 11
     return warped, M_inv
 
 
+def increased_crop(image: np.ndarray, bbox, bbox_inc: float = 1.5) -> np.ndarray:
+    """Square crop around ``bbox`` enlarged by ``bbox_inc``, zero-padded where it leaves the image."""
+    real_h, real_w = image.shape[:2]
+    x1, y1, x2, y2 = bbox[:4]
+    w, h = x2 - x1, y2 - y1
+    size = max(1, int(max(w, h) * bbox_inc))
+    x = int(x1 + w / 2 - size / 2)
+    y = int(y1 + h / 2 - size / 2)
+
+    x1_clip, y1_clip = max(0, x), max(0, y)
+    x2_clip, y2_clip = min(real_w, x + size), min(real_h, y + size)
+    if x2_clip <= x1_clip or y2_clip <= y1_clip:
+        return np.zeros((size, size, image.shape[2]), dtype=image.dtype)
+
+    return cv2.copyMakeBorder(image[y1_clip:y2_clip, x1_clip:x2_clip],
+                              y1_clip - y, y + size - y2_clip, x1_clip - x, x + size - x2_clip,
+                              cv2.BORDER_CONSTANT, value=[0, 0, 0])
+
+
+def match_boxes(boxes_a, boxes_b, min_iou: float = 0.3) -> dict:
+    """Greedily pair boxes of ``boxes_a`` with boxes of ``boxes_b`` by IoU; returns {index_a: index_b}."""
+    if len(boxes_a) == 0 or len(boxes_b) == 0:
+        return {}
+    a = np.asarray(boxes_a, dtype=np.float32)[:, None, :4]
+    b = np.asarray(boxes_b, dtype=np.float32)[None, :, :4]
+
+    inter_w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = inter_w * inter_h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    iou = inter / np.maximum(area_a + area_b - inter, 1e-9)
+
+    matches = {}
+    used = set()
+    for flat in np.argsort(iou, axis=None)[::-1]:
+        i, j = np.unravel_index(flat, iou.shape)
+        if iou[i, j] < min_iou:
+            break
+        if i in matches or j in used:
+            continue
+        matches[int(i)] = int(j)
+        used.add(j)
+    return matches
+
+
 def distance2bbox(points, distance, max_shape=None):
 
     x1 = points[:, 0] - distance[:, 0]
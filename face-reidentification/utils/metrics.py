@@ -0,0 +1,236 @@
+import bisect
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from typing import Callable, Dict, Optional, Sequence, Tuple
+
+# Bucket upper bounds in seconds: 0.1ms .. 2.5s, dense around typical per-stage frame times
+LATENCY_BUCKETS: Tuple[float, ...] = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.0075, 0.01, 0.015, 0.025,
+    0.035, 0.05, 0.075, 0.1, 0.25, 0.5, 1.0, 2.5,
+)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...], extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonic count (events, frames, drops)."""
+
+    kind = "counter"
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self.value += amount
+
+    def samples(self, name, labels):
+        yield name + "_total" if not name.endswith("_total") else name, labels, self.value
+
+
+class Gauge:
+    """Current value, either set explicitly or read from ``fn`` at scrape time (queue depths)."""
+
+    kind = "gauge"
+
+    def __init__(self, fn: Optional[Callable[[], float]] = None):
+        self.value = 0.0
+        self.fn = fn
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def samples(self, name, labels):
+        value = self.value
+        if self.fn is not None:
+            try:
+                value = self.fn()
+            except Exception:
+                return
+        yield name, labels, value
+
+
+class Histogram:
+    """Cumulative-bucket histogram; ``observe`` is a bisect and three adds under a lock."""
+
+    kind = "histogram"
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.bounds = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def samples(self, name, labels):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative = 0
+        for bound, bucket_count in zip(self.bounds + (float("inf"),), counts):
+            cumulative += bucket_count
+            yield name + "_bucket", labels + (("le", _format_value(bound)),), cumulative
+        yield name + "_sum", labels, total
+        yield name + "_count", labels, count
+
+
+class MetricsRegistry:
+    """
+    Named metric families, each holding one child per label set.
+
+    Children are created on first use and live for the process, so callers can
+    keep the returned object and update it without any further lookups.
+    """
+
+    def __init__(self):
+        self._families: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def _child(self, cls, name: str, help_text: str, labels: dict, factory):
+        key = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        with self._lock:
+            family = self._families.get(name)
+            if family is None:
+                family = self._families[name] = {"kind": cls.kind, "help": help_text, "children": {}}
+            elif family["kind"] != cls.kind:
+                raise ValueError(f"Metric {name} already registered as a {family['kind']}")
+            child = family["children"].get(key)
+            if child is None:
+                child = family["children"][key] = factory()
+            return child
+
+    def counter(self, name: str, help_text: str = "", **labels) -> Counter:
+        return self._child(Counter, name, help_text, labels, Counter)
+
+    def gauge(self, name: str, help_text: str = "", fn: Optional[Callable[[], float]] = None, **labels) -> Gauge:
+        gauge = self._child(Gauge, name, help_text, labels, lambda: Gauge(fn))
+        if fn is not None:
+            gauge.fn = fn
+        return gauge
+
+    def histogram(self, name: str, help_text: str = "", buckets: Sequence[float] = LATENCY_BUCKETS,
+                  **labels) -> Histogram:
+        return self._child(Histogram, name, help_text, labels, lambda: Histogram(buckets))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        with self._lock:
+            families = [(name, family["kind"], family["help"], list(family["children"].items()))
+                        for name, family in sorted(self._families.items())]
+
+        lines = []
+        for name, kind, help_text, children in families:
+            exposed = name + "_total" if kind == "counter" and not name.endswith("_total") else name
+            if help_text:
+                lines.append(f"# HELP {exposed} {help_text}")
+            lines.append(f"# TYPE {exposed} {kind}")
+            for labels, child in children:
+                for sample_name, sample_labels, value in child.samples(name, labels):
+                    lines.append(f"{sample_name}{_format_labels(sample_labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+_stage_histograms: Dict[str, Histogram] = {}
+
+# thread ident: innermost stage that thread is inside of, read by the sampling profiler
+_thread_stages: Dict[int, str] = {}
+
+
+def current_stage(thread_id: int) -> Optional[str]:
+    """The innermost ``timed`` stage the given thread is running, or None."""
+    return _thread_stages.get(thread_id)
+
+
+def stage_histogram(stage: str) -> Histogram:
+    """Latency histogram of one pipeline stage (``face_pipeline_stage_seconds{stage=...}``)."""
+    histogram = _stage_histograms.get(stage)
+    if histogram is None:
+        histogram = _stage_histograms[stage] = REGISTRY.histogram(
+            "face_pipeline_stage_seconds", "Wall time spent in each pipeline stage", stage=stage)
+    return histogram
+
+
+class timed:
+    """
+    Context manager that records the wall time of its block into a stage histogram
+    and marks the thread as being in that stage (see ``current_stage``).
+
+    Usage:
+        with timed("arcface"):
+            embeddings = session.run(...)
+    """
+
+    __slots__ = ("stage", "histogram", "start", "thread_id", "previous")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.histogram = stage_histogram(stage)
+
+    def __enter__(self):
+        self.thread_id = threading.get_ident()
+        self.previous = _thread_stages.get(self.thread_id)
+        _thread_stages[self.thread_id] = self.stage
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.histogram.observe(time.perf_counter() - self.start)
+        if self.previous is None:
+            _thread_stages.pop(self.thread_id, None)
+        else:
+            _thread_stages[self.thread_id] = self.previous
+        return False
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", PROMETHEUS_CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int, host: str = "0.0.0.0", registry: MetricsRegistry = REGISTRY) -> ThreadingHTTPServer:
+    """Serve ``GET /metrics`` from a daemon thread; call ``shutdown()`` on the result to stop it."""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logging.info(f"Metrics available at http://{host}:{server.server_address[1]}/metrics")
+    return server
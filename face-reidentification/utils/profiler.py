@@ -0,0 +1,189 @@
+import collections
+import datetime
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+from typing import Dict, Optional
+
+from utils.metrics import current_stage
+
+
+class SamplingProfiler:
+    """
+    Samples the stacks of every thread for a fixed time and writes them as folded stacks.
+
+    Each line of the ``.folded`` output is ``thread;[stage];outer frame;...;inner frame count``,
+    where stage is the innermost ``timed`` block the thread was in, so flamegraph.pl,
+    speedscope or inferno group the time by thread and pipeline stage first. With
+    ``memory`` on, tracemalloc snapshots are taken at the start and end of the run: the
+    allocations still alive at the end are written as ``-memory.folded`` (weighted by
+    bytes) and the biggest growth between the snapshots as ``-memory.txt``. tracemalloc
+    slows every allocation while it traces, so turn ``memory`` off for CPU-only numbers.
+
+    Only one run is active at a time; ``start`` and ``stop`` may be called from any
+    thread (signal handlers, HTTP handlers, key presses) while the pipeline keeps running.
+    """
+
+    def __init__(self, output_dir: str = "profiles", interval: float = 0.005, max_depth: int = 64,
+                 memory_frames: int = 16, top_allocations: int = 40):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.max_depth = max_depth
+        self.memory_frames = memory_frames
+        self.top_allocations = top_allocations
+        self.last_result: Optional[dict] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._current: Optional[dict] = None
+        self._labels: Dict[object, str] = {}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float, memory: bool = True) -> dict:
+        """Begin a run of ``seconds`` in the background; raises RuntimeError if one is in progress."""
+        if seconds <= 0:
+            raise ValueError("Profiling time must be positive")
+        with self._lock:
+            if self.running:
+                raise RuntimeError("A profile is already being recorded")
+            os.makedirs(self.output_dir, exist_ok=True)
+            base = os.path.join(self.output_dir, f"profile-{datetime.datetime.now():%Y%m%d-%H%M%S}")
+            self._current = {
+                "started_at": time.time(),
+                "seconds": seconds,
+                "folded": base + ".folded",
+                "memory": base + "-memory.txt" if memory else None,
+                "memory_folded": base + "-memory.folded" if memory else None,
+            }
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(dict(self._current),), name="profiler",
+                                            daemon=True)
+            self._thread.start()
+        logging.info(f"Profiling all threads for {seconds:.0f}s into {base}.folded")
+        return dict(self._current)
+
+    def stop(self, wait: bool = True) -> Optional[dict]:
+        """End the current run early; returns its result once written (when ``wait``)."""
+        thread = self._thread
+        if thread is None:
+            return self.last_result
+        self._stop.set()
+        if wait:
+            thread.join()
+        return self.last_result
+
+    def toggle(self, seconds: float, memory: bool = True) -> None:
+        """Start a run, or stop the one in progress (for a key press or a signal)."""
+        if self.running:
+            self.stop(wait=False)
+        else:
+            try:
+                self.start(seconds, memory=memory)
+            except RuntimeError as e:
+                logging.warning(f"{e}")
+
+    def status(self) -> dict:
+        current = self._current if self.running else None
+        return {"running": current is not None, "current": current, "last": self.last_result}
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            path = code.co_filename
+            parent = os.path.basename(os.path.dirname(path))
+            name = f"{parent}/{os.path.basename(path)}" if parent else os.path.basename(path)
+            label = f"{code.co_name} ({name}:{code.co_firstlineno})".replace(";", ":")
+            self._labels[code] = label
+        return label
+
+    def _fold(self, thread_name: str, stage: Optional[str], frame) -> str:
+        labels = []
+        while frame is not None and len(labels) < self.max_depth:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        labels.append(f"[{stage}]" if stage else "[no stage]")
+        labels.append(thread_name.replace(";", ":").replace(" ", "_"))
+        return ";".join(reversed(labels))
+
+    def _run(self, run: dict) -> None:
+        own_id = threading.get_ident()
+        stacks = collections.Counter()
+        samples = 0
+        started_tracing = False
+        first_snapshot = None
+        if run["memory"]:
+            started_tracing = not tracemalloc.is_tracing()
+            if started_tracing:
+                tracemalloc.start(self.memory_frames)
+            tracemalloc.reset_peak()
+            first_snapshot = tracemalloc.take_snapshot()
+
+        started = time.perf_counter()
+        deadline = started + run["seconds"]
+        names = {}
+        names_refreshed = 0.0
+        try:
+            while not self._stop.wait(self.interval):
+                now = time.perf_counter()
+                if now >= deadline:
+                    break
+                if now - names_refreshed > 1.0:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                    names_refreshed = now
+                for thread_id, frame in sys._current_frames().items():
+                    if thread_id == own_id:
+                        continue
+                    stacks[self._fold(names.get(thread_id, str(thread_id)), current_stage(thread_id), frame)] += 1
+                samples += 1
+
+            elapsed = time.perf_counter() - started
+            with open(run["folded"], "w", encoding="utf-8") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+
+            if run["memory"]:
+                self._write_memory(run, first_snapshot)
+        except Exception as e:
+            logging.error(f"Profiling failed: {e}")
+            elapsed = time.perf_counter() - started
+            run["error"] = str(e)
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+            # The labels keep every sampled code object alive; start each run with an empty cache
+            self._labels.clear()
+
+        run.update({"elapsed": elapsed, "samples": samples, "stacks": len(stacks)})
+        self.last_result = run
+        logging.info(f"Profile written to {run['folded']} ({samples} samples over {elapsed:.1f}s)")
+
+    def _write_memory(self, run: dict, first_snapshot) -> None:
+        _, peak = tracemalloc.get_traced_memory()
+        ignore = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__))
+        last_snapshot = tracemalloc.take_snapshot().filter_traces(ignore)
+        first_snapshot = first_snapshot.filter_traces(ignore)
+
+        with open(run["memory_folded"], "w", encoding="utf-8") as f:
+            for stat in last_snapshot.statistics("traceback"):
+                frames = ";".join(f"{os.path.basename(frame.filename)}:{frame.lineno}"
+                                  for frame in stat.traceback)
+                f.write(f"{frames} {stat.size}\n")
+
+        growth = last_snapshot.compare_to(first_snapshot, "lineno")
+        current = sum(stat.size for stat in last_snapshot.statistics("filename"))
+        with open(run["memory"], "w", encoding="utf-8") as f:
+            f.write(f"Traced memory at end: {current / 1024:.1f} KiB, peak during run: {peak / 1024:.1f} KiB\n\n")
+            f.write(f"Top {self.top_allocations} allocation sites by growth over the run:\n")
+            for stat in growth[:self.top_allocations]:
+                f.write(f"{stat}\n")
+        run["memory_peak_bytes"] = peak
+
+
+PROFILER = SamplingProfiler()
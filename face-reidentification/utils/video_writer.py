@@ -0,0 +1,112 @@
+import logging
+import queue
+import threading
+
+import cv2
+import numpy as np
+
+from utils.metrics import REGISTRY
+
+__all__ = ["AsyncVideoWriter"]
+
+
+class AsyncVideoWriter:
+    """Annotates and encodes frames on a background thread.
+
+    ``submit`` never blocks: when the bounded queue is full the frame is dropped
+    and counted in ``dropped``. Annotation is drawn in place on a canvas that is
+    reused between frames, and the optional downscale reuses its own buffer too.
+    """
+
+    _STOP = object()
+
+    def __init__(self, path, fps, frame_size, annotate=None, every_n=1, scale=1.0,
+                 queue_size=8, fourcc="mp4v"):
+        width, height = frame_size
+        self.path = path
+        self.annotate = annotate
+        self.every_n = max(1, int(every_n))
+        self.frame_size = (width, height)
+        self.output_size = (max(1, int(width * scale)), max(1, int(height * scale)))
+
+        self.submitted = 0
+        self.written = 0
+        self.dropped = 0
+        self._seen = 0
+
+        self._canvas = None
+        self._scaled = None
+        self._queue = queue.Queue(maxsize=max(1, queue_size))
+        REGISTRY.gauge("face_queue_depth", "Items waiting in a background queue", fn=self.qsize,
+                       queue="video_writer")
+        self._dropped_metric = REGISTRY.counter("face_queue_dropped", "Items dropped from a background queue",
+                                                queue="video_writer")
+
+        fps = fps if fps and fps > 0 else 30.0
+        self._writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps / self.every_n,
+                                       self.output_size)
+        if not self._writer.isOpened():
+            raise IOError(f"Could not open video writer for {path}")
+
+        self._thread = threading.Thread(target=self._run, name="video-writer", daemon=True)
+        self._thread.start()
+        logging.info(f"Writing annotated video to {path} "
+                     f"(every {self.every_n} frame(s), size {self.output_size[0]}x{self.output_size[1]})")
+
+    def submit(self, frame, overlay=None) -> bool:
+        """Queue a frame for writing. The caller must not modify ``frame`` afterwards."""
+        self._seen += 1
+        if (self._seen - 1) % self.every_n:
+            return False
+
+        try:
+            self._queue.put_nowait((frame, overlay))
+        except queue.Full:
+            self.dropped += 1
+            self._dropped_metric.inc()
+            return False
+
+        self.submitted += 1
+        return True
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                break
+
+            frame, overlay = item
+            try:
+                self._write(frame, overlay)
+            except Exception as e:
+                logging.error(f"Error writing video frame: {e}")
+
+    def _write(self, frame, overlay):
+        if self._canvas is None or self._canvas.shape != frame.shape:
+            self._canvas = np.empty_like(frame)
+        np.copyto(self._canvas, frame)
+
+        if self.annotate is not None and overlay is not None:
+            self.annotate(self._canvas, overlay)
+
+        out = self._canvas
+        if out.shape[1] != self.output_size[0] or out.shape[0] != self.output_size[1]:
+            if self._scaled is None:
+                self._scaled = np.empty((self.output_size[1], self.output_size[0], out.shape[2]),
+                                        dtype=out.dtype)
+            cv2.resize(out, self.output_size, dst=self._scaled, interpolation=cv2.INTER_AREA)
+            out = self._scaled
+
+        self._writer.write(out)
+        self.written += 1
+
+    def close(self):
+        """Flush queued frames and release the encoder."""
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+        self._writer.release()
+        logging.info(f"Video writer closed: {self.written} written, {self.dropped} dropped")